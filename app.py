@@ -1,91 +1,200 @@
 import sys
-from intrafact.ingestion.file_ingestor import ingestor
+import time
+import argparse
+import json
+import logging
+from intrafact.ingestion.file_ingestor import iter_ingest, iter_document_pages, document_id_for_path
 from intrafact.normalization.normalizer import TextNormalizer
 from intrafact.processing.chunker import TextChunker 
-from intrafact.processing.embedder import TextEmbedder 
-from intrafact.storage.metadata_store import MetadataStore
-from intrafact.storage.vector_store import VectorDB
-import uuid
-from intrafact.reasoning.rag_pipeline import RAGPipeline
-from dotenv import load_dotenv
-
-def run_pipeline():
-    print("-----Starting Pipeline------")
-    
-    meta_store = MetadataStore()
-    vector_db = VectorDB()
+from intrafact.processing.ingest_pipeline import IngestPipeline
+from intrafact.processing.incremental import IncrementalIndexer
+from intrafact.processing.deduplicator import ChunkDeduplicator
+from intrafact.ingestion.watcher import IngestDaemon
+from intrafact.config import (INGEST_PIPELINED, BATCH_CONCURRENCY, DEDUP_ENABLED, LOG_LEVEL, METRICS_PATH,
+                              PROCESSED_STORE_ENABLED)
+from intrafact import registry, telemetry
 
-    #Step 1 Ingestion
-    print("-----Starting Ingestion------")
+logger = logging.getLogger("intrafact.app")
+
+def get_processed_store():
+    return registry.get_processed_store() if PROCESSED_STORE_ENABLED else None
+
+def build_pipeline() -> IngestPipeline:
+    # The chunker is built (and the model loaded) only once a file needs ingesting
+    return IngestPipeline(registry.get_meta_store(), registry.get_vector_db(), TextNormalizer(), None,
+                          registry.get_embedder(), processed_store=get_processed_store())
+
+def create_rag_pipeline():
+    # openai and the RAG stack are only imported by commands that answer questions
+    with registry.timed("rag_pipeline"):
+        from intrafact.reasoning.rag_pipeline import RAGPipeline
+        return RAGPipeline()
+
+def print_startup_timings():
+    print("   ⏱️ Startup: " + ", ".join(
+        f"{name} {seconds:.2f}s" for name, seconds in registry.startup_timings().items()
+    ))
 
-    raw_data = ingestor()
+def run_pipeline(pipelined: bool = INGEST_PIPELINED):
+    logger.info("-----Starting Pipeline------")
 
-    if not raw_data:
-        print("No raw data found")
+    if pipelined:
+        # Extraction, encoding and storage run as overlapping stages
+        pipeline = build_pipeline()
+        processed_count = pipeline.run()
+
+        if not pipeline.seen_count:
+            logger.info("No new raw data found")
+            return
+
+        logger.info(f"----- Processed {processed_count} new files. -----")
         return
-    
-    print(f"Found {len(raw_data)} files in raw data")
 
-    #Step 2 processing
-    print("-----Starting Normalisation-----")
-    
+    meta_store = registry.get_meta_store()
+    vector_db = registry.get_vector_db()
+
+    #Step 1 Ingestion
+    logger.info("-----Starting Ingestion------")
+
     norm = TextNormalizer()
-    chunker = TextChunker()
-    embedder = TextEmbedder()
+    embedder = registry.get_embedder()
+    # Built (and the model loaded) only once a file needs chunking
+    chunker = None
+
+    # Files are documents keyed by path: drop the ones deleted from disk
+    deduplicator = ChunkDeduplicator(meta_store) if DEDUP_ENABLED else None
+    processed_store = get_processed_store()
+    indexer = IncrementalIndexer(meta_store, vector_db, embedder, deduplicator, processed_store)
+    indexer.remove_missing_files()
+
+    # Documents are streamed from the extraction pool as they finish,
+    # so the whole corpus is never held in memory at once
+    raw_data = iter_ingest(meta_store=meta_store)
+
+    #Step 2 processing
+    logger.info("-----Starting Normalisation-----")
 
     processed_count = 0
+    seen_count = 0
     for file in raw_data:
+        seen_count += 1
         original_file_name = file["metadata"]["file_name"]
         file_hash = file["metadata"]["file_hash"]
+        file_path = file["metadata"]["file_path"]
 
-        print(f"Normalising {original_file_name}")
+        logger.info(f"Normalising {original_file_name}")
         # Step 3 normalising
-        if meta_store.document_exists(file_hash):
-            print("File already processed, skipped")
+        if meta_store.document_exists(file_hash, file_path):
+            logger.info("File already processed, skipped")
+            meta_store.record_file(file["metadata"])
             continue
 
         try:
-            doc_id = str(uuid.uuid4())
-            normalized_data = norm.normalize(
-                file['raw_text'], 
+            doc_id = document_id_for_path(file_path)
+            normalized_data = norm.normalize_pages(
+                iter_document_pages(file),
                 file['metadata']
             )
-            # Step 4 chunking
+            normalized_data["id"] = doc_id
+            if processed_store is not None:
+                normalized_data = norm.store_object(normalized_data, processed_store)
+            # Step 4 chunking, sized in model tokens so nothing is truncated at encode time
+            if chunker is None:
+                chunker = TextChunker.for_embedder(embedder)
             chunks = chunker.process_chunks(normalized_data)
-        
             
-            for chunk in chunks:
-                chunk["parent_id"] = doc_id
-            
-            print(f"   ↳ Split into {len(chunks)} chunks.")
+            logger.info(f"   ↳ Split into {len(chunks)} chunks.")
 
-            # Step 5 embedding
-            chunks_with_vectors = embedder.embed_chunks(chunks)
-            print(f"   ↳ Generated {len(chunks_with_vectors[0]['embedding'])}-dimension vectors.")
+            # Step 5 embedding, only for chunks not already stored for this file
+            update = indexer.plan(doc_id, file["metadata"], chunks)
+            if update.added:
+                chunks_with_vectors = embedder.embed_chunks(update.added)
+                logger.info(f"   ↳ Generated {len(chunks_with_vectors[0]['embedding'])}-dimension vectors.")
             
-            # Step 6 saving vectors
-            vector_db.add_chunks(chunks_with_vectors)
-
-            # Step 7 saving metadata
-            meta_store.register_document(doc_id, original_file_name, file["metadata"])
+            # Step 6 saving vectors and metadata, deleting chunks that are gone
+            indexer.apply([update])
 
             processed_count += 1
             
-            print("   ✅ Processing Complete!")
+            logger.info("   ✅ Processing Complete!")
 
         except Exception as e:
-            print(f"❌ Error processing {original_file_name}: {e}")
+            logger.error(f"❌ Error processing {original_file_name}: {e}")
+
+    if processed_store is not None:
+        processed_store.flush()
+
+    if not seen_count:
+        logger.info("No new raw data found")
+        return
+
+    if deduplicator is not None and deduplicator.checked:
+        stats = deduplicator.stats()
+        logger.info(f"   ↳ Dedup: {stats['duplicates']} of {stats['checked']} new chunks were near-duplicates "
+                    f"({stats['dedup_ratio']:.1%})")
+    logger.info(f"----- Processed {processed_count} new files. -----")
+
+def run_reindex():
+    """
+    Re-chunks and re-embeds every document in the processed-object store,
+    without re-extracting the raw files.
+    """
+    store = get_processed_store()
+    if store is None:
+        print("⚠️ The processed-object store is disabled (PROCESSED_STORE_ENABLED=0)")
+        return
 
-    print(f"\n----- Processed {processed_count} new files. -----")
+    logger.info(f"-----Reindexing {len(store)} stored documents------")
+    processed_count = build_pipeline().reindex()
+    logger.info(f"----- Reindexed {processed_count} documents. -----")
 
-def start_chat_session():
-        print("---- Chat Mode (type 'exit' to quit) ----")
+def run_partitions(drop: str = None, rebuild: str = None, reembed: bool = False):
+    """
+    Lists the vector partitions, after dropping or rebuilding one if asked.
+    Dropping a partition also removes its documents from the other stores.
+    """
+    vector_db = registry.get_vector_db()
+
+    if drop:
+        doc_ids = vector_db.drop_partition(drop)
+        meta_store = registry.get_meta_store()
+        deduplicator = ChunkDeduplicator(meta_store) if DEDUP_ENABLED else None
+        indexer = IncrementalIndexer(meta_store, vector_db, registry.get_embedder(), deduplicator,
+                                     get_processed_store())
+        indexer.remove_documents(doc_ids)
+        print(f"🗑️ Dropped partition {drop} and its {len(doc_ids)} documents")
+
+    if rebuild:
+        count = vector_db.rebuild_partition(rebuild, registry.get_embedder() if reembed else None)
+        print(f"🔁 Rebuilt partition {rebuild} ({count} vectors)")
+
+    print(f"---- Vector partitions ({vector_db.partition_by}) ----")
+    for key, count in vector_db.list_partitions().items():
+        print(f"   {key or '(unpartitioned)'}: {count} vectors")
+
+def print_watch_metrics(daemon: IngestDaemon):
+    metrics = daemon.metrics()
+    lag = metrics["last_batch_lag"]
+    print(f"   watch ({metrics['mode']}): {metrics['queue_depth']} queued, {metrics['debouncing']} settling, "
+          f"oldest {metrics['oldest_queued_age']:.1f}s, last lag {'-' if lag is None else f'{lag:.1f}s'}, "
+          f"{metrics['processed_files']} files ingested")
+
+def print_stage_metrics():
+    for stage, stats in telemetry.metrics.stage_summary().items():
+        print(f"   {stage}: {stats['count']} calls, p50 {stats['p50_ms']:.1f} ms, "
+              f"p95 {stats['p95_ms']:.1f} ms, p99 {stats['p99_ms']:.1f} ms")
+
+def start_chat_session(daemon: IngestDaemon = None, show_timings: bool = False):
+        print("---- Chat Mode (type 'exit' to quit, 'stats' for cache hit rates and stage latencies) ----")
         try:
-            rag = RAGPipeline()
+            rag = create_rag_pipeline()
 
         except Exception as e:
-            print("Error initialising AI")
+            logger.error(f"Error initialising AI: {e}")
             return
+
+        if show_timings:
+            print_startup_timings()
         
         while True:
             try:
@@ -95,9 +204,27 @@ def start_chat_session():
                     break
                 if not query:
                     continue
+                if query.lower() == 'stats':
+                    for name, stats in rag.retriever.cache_stats().items():
+                        print(f"   {name}: {stats['hits']} hits / {stats['misses']} misses "
+                              f"({stats['hit_rate']:.0%}), {stats['entries']} entries")
+                    print_stage_metrics()
+                    if daemon is not None:
+                        print_watch_metrics(daemon)
+                    continue
                 
-                answer = rag.answer_question(query)
-                print(f"\nAI: {answer}")
+                # Render tokens as they arrive instead of waiting for the full answer
+                print("\nAI: ", end="", flush=True)
+                for token in rag.stream_answer(query):
+                    print(token, end="", flush=True)
+                print()
+
+                timings = rag.last_timings
+                if timings.get("time_to_first_token") is not None:
+                    breakdown = ", ".join(f"{name[:-3]} {ms:.0f} ms" for name, ms in rag.last_trace.items()
+                                          if name != "total_ms")
+                    print(f"   ⏱️ First token {timings['time_to_first_token']:.2f}s, "
+                          f"total {timings['generation_time']:.2f}s ({breakdown})")
 
             except KeyboardInterrupt:
                 print("Goodbye")
@@ -105,10 +232,155 @@ def start_chat_session():
             except Exception as e:
                 print(f"Error: {e}")
 
-if __name__== "__main__":
+def run_watch(interval: float = 30.0, metrics_path: str = METRICS_PATH):
+    """
+    Runs the watch-mode ingest daemon in the foreground until interrupted,
+    refreshing the metrics file (if any) every `interval` seconds.
+    """
+    daemon = IngestDaemon(build_pipeline())
+    daemon.start()
+    try:
+        while True:
+            time.sleep(interval)
+            print_watch_metrics(daemon)
+            if metrics_path:
+                telemetry.write_metrics(metrics_path)
+    except KeyboardInterrupt:
+        print("Stopping watcher")
+    finally:
+        daemon.stop()
+
+def run_batch(input_path: str, output_path: str, concurrency: int = BATCH_CONCURRENCY):
+    """
+    Reads {"question": ...} records from a JSONL file and writes each record
+    back with an "answer" field, in input order, as answers complete.
+    """
+    rag = create_rag_pipeline()
+
+    with open(input_path, encoding="utf-8") as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    questions = [record.get("question") or record.get("query") or "" for record in records]
+
+    print(f"---- Answering {len(questions)} questions ----")
+    with open(output_path, "w", encoding="utf-8") as out:
+        for record, answer in zip(records, rag.iter_answers(questions, concurrency)):
+            out.write(json.dumps({**record, "answer": answer}, ensure_ascii=False) + "\n")
+            out.flush()
+
+    print(f"---- Wrote {len(questions)} answers to {output_path} ----")
+
+def check_embeddings(backend: str, samples: int = 256, num_threads: int = 0):
+    """
+    Measures how closely `backend` reproduces the float32 torch embeddings on
+    stored chunks, and how much faster it encodes them.
+    """
+    from intrafact.processing.embedding_backends import compare_backends
+
+    embedder = registry.get_embedder()
+    texts = registry.get_meta_store().sample_chunks(samples)
+    if not texts:
+        print("⚠️ No ingested chunks to compare on; run `ingest` first")
+        return
+
+    print(f"---- Comparing {backend} with torch on {len(texts)} chunks ----")
+    report = compare_backends(embedder.model_name, backend, texts, num_threads=num_threads)
+    print(f"   torch: {report['reference']['texts_per_sec']:.1f} texts/s")
+    print(f"   {backend}: {report['candidate']['texts_per_sec']:.1f} texts/s ({report['speedup']:.2f}x)")
+    print(f"   dimension: {report['candidate']['dim']} (unchanged)")
+    print(f"   cosine agreement: mean {report['cosine_mean']:.4f}, "
+          f"p1 {report['cosine_p01']:.4f}, min {report['cosine_min']:.4f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Intrafact AI - personal knowledge base")
+    parser.add_argument("--timings", action="store_true", help="print a startup time breakdown")
+    parser.add_argument("--log-level", default=LOG_LEVEL, choices=["DEBUG", "INFO", "WARNING", "ERROR"],
+                        type=str.upper, help="verbosity of progress output")
+    parser.add_argument("--trace", help="append every finished span to this JSONL file")
+    parser.add_argument("--metrics", default=METRICS_PATH or None,
+                        help="write stage metrics here on exit (Prometheus text, or JSON for .json)")
+    commands = parser.add_subparsers(dest="command")
+    chat = commands.add_parser("chat", help="ingest new files, then start a chat session (default)")
+    chat.add_argument("--watch", action="store_true",
+                      help="keep ingesting changes to the raw data directory in the background")
+    commands.add_parser("ingest", help="ingest new files and exit")
+    commands.add_parser("reindex", help="re-chunk and re-embed stored documents without re-reading raw files")
+    partitions = commands.add_parser("partitions", help="list vector partitions, or drop or rebuild one")
+    partitions.add_argument("--drop", metavar="PARTITION",
+                            help="delete a partition and its documents (they are not re-ingested until changed)")
+    partitions.add_argument("--rebuild", metavar="PARTITION",
+                            help="copy a partition (e.g. file_type.pdf) afresh, reclaiming deleted vectors")
+    partitions.add_argument("--reembed", action="store_true",
+                            help="with --rebuild, re-encode its chunks with the current embedding model")
+    commands.add_parser("watch", help="ingest changes to the raw data directory continuously")
+    commands.add_parser("serve-embeddings",
+                        help="serve the embedding model to every Intrafact process over a local socket")
+    check = commands.add_parser("check-embeddings",
+                                help="compare an embedding backend's accuracy and speed with torch")
+    check.add_argument("--backend", default="onnx-int8", choices=["torch", "onnx", "onnx-int8"])
+    check.add_argument("--samples", type=int, default=256, help="number of stored chunks to encode")
+    check.add_argument("--threads", type=int, default=0, help="inference threads (0 = default)")
+    batch = commands.add_parser("batch", help="answer questions from a JSONL file into a JSONL file")
+    batch.add_argument("input", help='JSONL file with one {"question": ...} per line')
+    batch.add_argument("output", help="JSONL file to write answers to")
+    batch.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="parallel LLM calls")
+    args = parser.parse_args(argv)
+
+    telemetry.configure_logging(args.log_level)
+    if args.trace:
+        telemetry.set_trace_path(args.trace)
+
     print("==========================================")
     print("   INTRAFACT AI - PERSONAL KNOWLEDGE BASE  ")
     print("==========================================")
-    run_pipeline()
-    start_chat_session()
-           
\ No newline at end of file
+
+    try:
+        run_command(args)
+    finally:
+        if args.metrics:
+            telemetry.write_metrics(args.metrics)
+
+def run_command(args):
+    if args.command == "batch":
+        run_batch(args.input, args.output, args.concurrency)
+        return
+
+    if args.command == "reindex":
+        run_reindex()
+        return
+
+    if args.command == "partitions":
+        run_partitions(args.drop, args.rebuild, args.reembed)
+        return
+
+    if args.command == "watch":
+        run_watch(metrics_path=args.metrics)
+        return
+
+    if args.command == "check-embeddings":
+        check_embeddings(args.backend, args.samples, args.threads)
+        return
+
+    if args.command == "serve-embeddings":
+        from intrafact.processing.embedding_server import serve
+        serve()
+        return
+
+    if getattr(args, "watch", False):
+        # The daemon's first pass ingests new files while the chat is already usable
+        daemon = IngestDaemon(build_pipeline())
+        daemon.start()
+        try:
+            start_chat_session(daemon, args.timings)
+        finally:
+            daemon.stop()
+        return
+
+    with registry.timed("ingest"):
+        run_pipeline()
+    if args.command != "ingest":
+        start_chat_session(show_timings=args.timings)
+    elif args.timings:
+        print_startup_timings()
+
+if __name__== "__main__":
+    main(sys.argv[1:])
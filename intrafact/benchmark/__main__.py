@@ -0,0 +1,96 @@
+import argparse
+import json
+import sys
+from pathlib import Path
+from intrafact.benchmark.corpus import generate_corpus
+from intrafact.benchmark.runner import run_benchmark, compare_results
+from intrafact.storage.vector_store import PARTITION_SCHEMES
+from intrafact import telemetry
+
+def print_stages(result: dict):
+    print(f"{'stage':<16} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'throughput':>16}")
+    for stage, row in result["stages"].items():
+        print(f"{stage:<16} {row['count']:>6} {row['p50_ms']:>9.2f} {row['p95_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+              f"{row['throughput']:>9.1f} {row['unit']}/s")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m intrafact.benchmark",
+                                     description="Intrafact end-to-end benchmarks")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="write a deterministic synthetic corpus")
+    generate.add_argument("output", help="directory to write the corpus to")
+    generate.add_argument("--files", type=int, default=100)
+    generate.add_argument("--words", type=int, default=1500, help="words per file")
+    generate.add_argument("--duplicate-rate", type=float, default=0.1,
+                          help="fraction of paragraphs copied from earlier files")
+    generate.add_argument("--formats", default="txt,md,pdf", help="comma-separated, assigned round-robin")
+    generate.add_argument("--queries", type=int, default=50)
+    generate.add_argument("--seed", type=int, default=42)
+
+    run = commands.add_parser("run", help="time every stage over a corpus and write JSON results")
+    run.add_argument("corpus", help="directory made by `generate`")
+    run.add_argument("--output", "-o", help="JSON file to write (default: stdout summary only)")
+    run.add_argument("--work-dir", help="keep the benchmark stores here instead of a temporary directory")
+    run.add_argument("--vector-backend", default="numpy", choices=["numpy", "chroma"])
+    run.add_argument("--partition-by", default=None, choices=PARTITION_SCHEMES,
+                     help="vector partition scheme (default: VECTOR_PARTITION_KEY)")
+    run.add_argument("--embedding-backend", default=None, choices=["torch", "onnx", "onnx-int8"])
+    run.add_argument("--max-queries", type=int, default=None)
+    run.add_argument("--llm-latency", type=float, default=0.0, help="seconds the stub LLM waits per request")
+    run.add_argument("--verbose", action="store_true", help="show the pipeline's own progress output")
+
+    compare = commands.add_parser("compare", help="exit non-zero if a stage regressed against a baseline")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=0.10, help="allowed slowdown, e.g. 0.1 = 10%%")
+    compare.add_argument("--metric", default="p95_ms", choices=["mean_ms", "p50_ms", "p95_ms", "p99_ms"])
+
+    args = parser.parse_args(argv)
+    telemetry.configure_logging()
+
+    if args.command == "generate":
+        corpus = generate_corpus(Path(args.output), args.files, args.words, args.duplicate_rate,
+                                 [f.strip() for f in args.formats.split(",") if f.strip()],
+                                 args.queries, args.seed)
+        print(f"📂 Wrote {len(corpus['files'])} files and {len(corpus['queries'])} queries to {args.output}")
+        return 0
+
+    if args.command == "run":
+        options = {"embedding_backend": args.embedding_backend} if args.embedding_backend else {}
+        if args.partition_by:
+            options["partition_by"] = args.partition_by
+        result = run_benchmark(Path(args.corpus), args.work_dir, args.vector_backend,
+                               max_queries=args.max_queries, llm_latency=args.llm_latency,
+                               quiet=not args.verbose, **options)
+        print_stages(result)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+            print(f"💾 Results written to {args.output}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    rows = compare_results(baseline, current, args.threshold, args.metric)
+    print(f"{'stage':<16} {'baseline':>10} {'current':>10} {'latency':>9} {'throughput':>11}")
+    for row in rows:
+        if row["current"] is None:
+            print(f"{row['stage']:<16} {row['baseline']:>10.2f} {'missing':>10}  ❌ REGRESSED")
+            continue
+        flag = "  ❌ REGRESSED" if row["regressed"] else ""
+        print(f"{row['stage']:<16} {row['baseline']:>10.2f} {row['current']:>10.2f} "
+              f"{row['latency_change']:>+9.1%} {row['throughput_change']:>+11.1%}{flag}")
+
+    regressed = [row["stage"] for row in rows if row["regressed"]]
+    if regressed:
+        print(f"❌ {len(regressed)} stage(s) regressed by more than {args.threshold:.0%}: {', '.join(regressed)}")
+        return 1
+    print(f"✅ No stage regressed by more than {args.threshold:.0%} ({args.metric})")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import json
+import random
+from pathlib import Path
+from typing import List, Dict, Sequence
+
+SYLLABLES = ["ka", "lo", "mi", "ra", "ten", "vor", "shi", "pla", "dex", "on", "tri", "zu", "mel", "qua", "nor", "fi"]
+IDENTIFIER_PREFIXES = ["ERR", "REQ", "INC", "SPEC", "BUILD"]
+
+def _vocabulary(rng: random.Random, size: int = 2000) -> List[str]:
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 3))))
+    return sorted(words)
+
+def _sentence(rng: random.Random, vocabulary: List[str]) -> str:
+    words = [rng.choice(vocabulary) for _ in range(rng.randint(6, 18))]
+    if rng.random() < 0.1:
+        words.insert(rng.randrange(len(words)), f"{rng.choice(IDENTIFIER_PREFIXES)}-{rng.randint(1000, 9999)}")
+    return " ".join(words).capitalize() + "."
+
+def _paragraph(rng: random.Random, vocabulary: List[str]) -> str:
+    return " ".join(_sentence(rng, vocabulary) for _ in range(rng.randint(3, 7)))
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_pdf(path: Path, paragraphs: List[str], line_width: int = 90, lines_per_page: int = 50):
+    """
+    Writes a minimal text-only PDF (Helvetica, one text object per page)
+    without any PDF library.
+    """
+    lines = []
+    for paragraph in paragraphs:
+        line = ""
+        for word in paragraph.split():
+            if line and len(line) + len(word) + 1 > line_width:
+                lines.append(line)
+                line = word
+            else:
+                line = f"{line} {word}" if line else word
+        lines.extend([line, ""])
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # Objects: 1 catalog, 2 page tree, 3 font, then a (page, content) pair per page
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for page_lines in pages:
+        text = "".join(f"({_pdf_escape(line)}) Tj T* " for line in page_lines)
+        stream = f"BT /F1 10 Tf 14 TL 50 780 Td {text}ET".encode("latin-1", "replace")
+        page_ids.append(len(objects) + 1)
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects) + 2} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(f'{i} 0 R' for i in page_ids)}] /Count {len(page_ids)} >>".encode()
+
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    Path(path).write_bytes(bytes(data))
+
+def generate_corpus(out_dir: Path, num_files: int = 100, words_per_file: int = 1500,
+                    duplicate_rate: float = 0.1, formats: Sequence[str] = ("txt", "md", "pdf"),
+                    num_queries: int = 50, seed: int = 42) -> Dict:
+    """
+    Writes a deterministic synthetic corpus to `out_dir`: the same arguments
+    always produce byte-identical files. A `duplicate_rate` fraction of
+    paragraphs are copies of paragraphs from earlier files. Also writes
+    corpus.json with the parameters and benchmark queries (phrases taken from
+    the documents, plus some chit-chat that should not trigger a search).
+    """
+    rng = random.Random(seed)
+    vocabulary = _vocabulary(rng)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    seen_paragraphs = []
+    files = []
+    for index in range(num_files):
+        paragraphs = []
+        words = 0
+        while words < words_per_file:
+            if seen_paragraphs and rng.random() < duplicate_rate:
+                paragraph = rng.choice(seen_paragraphs)
+            else:
+                paragraph = _paragraph(rng, vocabulary)
+                seen_paragraphs.append(paragraph)
+            paragraphs.append(paragraph)
+            words += len(paragraph.split())
+
+        file_format = formats[index % len(formats)]
+        path = out_dir / f"doc_{index:05d}.{file_format}"
+        if file_format == "pdf":
+            write_pdf(path, paragraphs)
+        elif file_format == "md":
+            sections = [f"## Section {i + 1}\n\n{paragraph}" for i, paragraph in enumerate(paragraphs)]
+            path.write_text(f"# Document {index}\n\n" + "\n\n".join(sections) + "\n", encoding="utf-8")
+        else:
+            path.write_text("\n\n".join(paragraphs) + "\n", encoding="utf-8")
+        files.append(path.name)
+
+    queries = []
+    for _ in range(num_queries):
+        if rng.random() < 0.1:
+            queries.append(rng.choice(["Hello there", "Thanks, that helps", "What is 2 + 2?", "Good morning"]))
+            continue
+        words = rng.choice(seen_paragraphs).rstrip(".").split()
+        start = rng.randrange(max(len(words) - 6, 1))
+        queries.append(f"What do the documents say about {' '.join(words[start:start + 6])}?")
+
+    corpus = {
+        "seed": seed,
+        "num_files": num_files,
+        "words_per_file": words_per_file,
+        "duplicate_rate": duplicate_rate,
+        "formats": list(formats),
+        "files": files,
+        "queries": queries
+    }
+    with open(out_dir / "corpus.json", "w", encoding="utf-8") as f:
+        json.dump(corpus, f, indent=2)
+    return corpus
@@ -0,0 +1,228 @@
+import contextlib
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Dict, Optional
+from intrafact.config import CONTEXT_CANDIDATES, EMBEDDING_BACKEND, VECTOR_PARTITION_KEY
+from intrafact.ingestion.file_ingestor import load_document, iter_document_pages
+from intrafact.benchmark.stub_llm import StubLLMServer
+from intrafact import telemetry
+
+# Stage name -> unit its throughput is reported in
+STAGES = {
+    "ingestor": "files",
+    "normalize": "documents",
+    "chunk": "chunks",
+    "embed": "chunks",
+    "vector_add": "chunks",
+    "retrieve": "queries",
+    "answer_question": "queries"
+}
+
+class StageTimer:
+    """
+    Collects one latency sample per item (file, document, query) per stage,
+    together with how many units (e.g. chunks) the item contained.
+    """
+
+    def __init__(self):
+        self.samples = {}
+
+    @contextlib.contextmanager
+    def measure(self, stage: str, units: int = 1):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, units)
+
+    def record(self, stage: str, seconds: float, units: int = 1):
+        self.samples.setdefault(stage, []).append((seconds, units))
+
+    def summary(self) -> Dict[str, Dict]:
+        stages = {}
+        for stage, samples in self.samples.items():
+            seconds = np.array([s for s, _ in samples])
+            units = sum(u for _, u in samples)
+            total = float(seconds.sum())
+            stages[stage] = {
+                "count": len(samples),
+                "units": units,
+                "unit": STAGES.get(stage, "items"),
+                "total_s": total,
+                "mean_ms": float(seconds.mean() * 1000),
+                "p50_ms": float(np.percentile(seconds, 50) * 1000),
+                "p95_ms": float(np.percentile(seconds, 95) * 1000),
+                "p99_ms": float(np.percentile(seconds, 99) * 1000),
+                "throughput": units / total if total else 0.0
+            }
+        return stages
+
+@contextlib.contextmanager
+def _quiet(enabled: bool):
+    # Progress logs of every stage would drown the benchmark output
+    logger = logging.getLogger("intrafact")
+    level = logger.level
+    if enabled:
+        logger.setLevel(logging.WARNING)
+    try:
+        yield
+    finally:
+        logger.setLevel(level)
+
+def run_benchmark(corpus_dir: Path, work_dir: Optional[Path] = None, vector_backend: str = "numpy",
+                  embedding_backend: str = EMBEDDING_BACKEND, max_queries: Optional[int] = None,
+                  llm_latency: float = 0.0, quiet: bool = True,
+                  partition_by: str = VECTOR_PARTITION_KEY) -> Dict:
+    """
+    Runs every stage of ingest and query over a corpus made by
+    generate_corpus() and returns per-stage p50/p95/p99 latency and throughput.
+
+    Stores live in `work_dir` (a temporary directory by default), never in
+    the configured data directory. The embedding cache and server are off, so
+    each run measures the model itself; the LLM is a local StubLLMServer
+    answering after `llm_latency` seconds.
+    """
+    from intrafact.normalization.normalizer import TextNormalizer
+    from intrafact.processing.chunker import TextChunker
+    from intrafact.processing.embedder import TextEmbedder
+    from intrafact.storage.metadata_store import MetadataStore
+    from intrafact.storage.vector_store import VectorDB
+    from intrafact.retrieval.retriever import Retriever
+    from intrafact.reasoning.rag_pipeline import RAGPipeline
+
+    corpus_dir = Path(corpus_dir)
+    with open(corpus_dir / "corpus.json", encoding="utf-8") as f:
+        corpus = json.load(f)
+    files = [corpus_dir / name for name in corpus["files"]]
+    queries = corpus["queries"][:max_queries] if max_queries else corpus["queries"]
+
+    cleanup = work_dir is None
+    work_dir = Path(work_dir or tempfile.mkdtemp(prefix="intrafact-bench-"))
+    work_dir.mkdir(parents=True, exist_ok=True)
+    timer = StageTimer()
+    setup = {}
+    telemetry.metrics.reset()
+
+    stub = StubLLMServer(latency=llm_latency).start()
+    try:
+        with _quiet(quiet):
+            started = time.perf_counter()
+            embedder = TextEmbedder(use_cache=False, use_server=False, backend=embedding_backend)
+            embedder.encode(["warm up"])
+            setup["embedding_model_s"] = time.perf_counter() - started
+
+            normalizer = TextNormalizer()
+            chunker = TextChunker.for_embedder(embedder)
+            meta_store = MetadataStore(work_dir / "metadata.db")
+            vector_dir = work_dir / ("vectors" if vector_backend == "numpy" else "chroma")
+            vector_db = VectorDB("benchmark", backend=vector_backend, partition_by=partition_by, path=vector_dir)
+
+            # Ingest, one document at a time through every stage
+            for path in files:
+                with timer.measure("ingestor"):
+                    data = load_document(path)
+                if data is None:
+                    continue
+
+                # Normalization streams into the chunker in the pipeline; the
+                # pages are materialized here so each stage is timed alone
+                with timer.measure("normalize"):
+                    normalized = normalizer.normalize_pages(iter_document_pages(data), data["metadata"])
+                    normalized["pages"] = list(normalized["pages"])
+
+                started = time.perf_counter()
+                chunks = chunker.process_chunks(normalized)
+                timer.record("chunk", time.perf_counter() - started, len(chunks))
+
+                with timer.measure("embed", len(chunks)):
+                    embedder.embed_chunks(chunks)
+                with timer.measure("vector_add", len(chunks)):
+                    vector_db.add_chunks(chunks)
+                # Not a timed stage, but lexical and hybrid retrieval need it
+                meta_store.register_document(normalized["id"], data["metadata"]["file_name"],
+                                             normalized["metadata"], chunks)
+
+            retriever = Retriever(embedder, vector_db, meta_store)
+            for query in queries:
+                with timer.measure("retrieve"):
+                    retriever.retrieve(query, limit=CONTEXT_CANDIDATES)
+
+            # Fresh caches, so answer_question does its own retrieval
+            rag = RAGPipeline(model_name="stub", retriever=Retriever(embedder, vector_db, meta_store),
+                              base_url=stub.base_url, api_key="benchmark")
+            rag.router.log_handler = None
+            for query in queries:
+                with timer.measure("answer_question"):
+                    rag.answer_question(query)
+
+            meta_store.close()
+    finally:
+        stub.stop()
+        if cleanup:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "embedding_model": embedder.model_name,
+            "embedding_backend": embedding_backend,
+            "vector_backend": vector_backend,
+            "partition_by": partition_by,
+            "llm_latency_s": llm_latency,
+            "llm_requests": stub.requests,
+            "corpus": {key: corpus[key] for key in ("seed", "num_files", "words_per_file",
+                                                    "duplicate_rate", "formats")},
+            "queries": len(queries),
+            "setup": setup
+        },
+        "stages": timer.summary(),
+        # Finer-grained spans recorded inside the stages (encode, search, router, ...)
+        "spans": telemetry.metrics.stage_summary()
+    }
+
+def compare_results(baseline: Dict, current: Dict, threshold: float = 0.10,
+                    metric: str = "p95_ms") -> List[Dict]:
+    """
+    Compares each stage of the baseline with the current results. A stage
+    regresses when its `metric` latency grew, or its throughput dropped, by
+    more than `threshold` (a fraction of the baseline), or when it is missing
+    from the current results (it crashed or was never reached). Returns one
+    row per baseline stage.
+    """
+    rows = []
+    for stage, before in baseline["stages"].items():
+        after = current["stages"].get(stage)
+        if after is None:
+            rows.append({
+                "stage": stage,
+                "baseline": before[metric],
+                "current": None,
+                "latency_change": None,
+                "throughput_change": None,
+                "regressed": True
+            })
+            continue
+
+        latency_change = after[metric] / before[metric] - 1 if before[metric] else 0.0
+        throughput_change = after["throughput"] / before["throughput"] - 1 if before["throughput"] else 0.0
+        rows.append({
+            "stage": stage,
+            "baseline": before[metric],
+            "current": after[metric],
+            "latency_change": latency_change,
+            "throughput_change": throughput_change,
+            "regressed": latency_change > threshold or throughput_change < -threshold
+        })
+    return rows
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STUB_ANSWER = "Based on the provided context, the documents describe this topic in detail."
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, body: dict):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        server = self.server
+        time.sleep(server.latency)
+        with server.lock:
+            server.requests += 1
+
+        # The router prompt asks for one word with a tiny max_tokens
+        content = "SEARCH" if (request.get("max_tokens") or 1000) <= 5 else server.answer
+        created = int(time.time())
+        model = request.get("model", "stub")
+
+        if not request.get("stream"):
+            self._send_json(200, {
+                "id": "stub", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for word in content.split(" "):
+            chunk = {
+                "id": "stub", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}]
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(server.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+class StubLLMServer(ThreadingHTTPServer):
+    """
+    Minimal OpenAI-compatible chat completions endpoint on localhost, so
+    RAGPipeline can be benchmarked without network calls. Each request
+    sleeps `latency` seconds (and `token_delay` per streamed word) before
+    answering with a fixed text.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, port: int = 0, latency: float = 0.0, token_delay: float = 0.0, answer: str = STUB_ANSWER):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.answer = answer
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/v1"
+
+    def start(self) -> "StubLLMServer":
+        self.thread = threading.Thread(target=self.serve_forever, name="intrafact-stub-llm", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -13,9 +13,148 @@ RAW_DATA_DIR = DATA_DIR/"raw"
 PROCESSED_DATA_DIR = DATA_DIR/"processed"
 CHROMA_DB_DIR = DATA_DIR/"chroma_db"
 SQLITE_DB_PATH = DATA_DIR/"metadata.db"
+VECTOR_INDEX_DIR = DATA_DIR/"vector_index"
+
+# Vector store: "chroma", or "numpy" for the built-in memory-mapped flat index
+# (stored as "float16", or "int8" for a quarter of float32 memory)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+VECTOR_INDEX_DTYPE = os.getenv("VECTOR_INDEX_DTYPE", "float16")
+
+# Vector partitioning: one collection per value of VECTOR_PARTITION_KEY, one of
+# "none" (a single collection), "source_type", "file_type", "time" (the file's
+# modification time, bucketed by VECTOR_PARTITION_TIME_BUCKET: "year", "month"
+# or "day") or "hash" (VECTOR_PARTITION_SHARDS shards of the document ID).
+# Searches fan out over the partitions on up to VECTOR_SEARCH_WORKERS threads.
+# After changing the key, `app.py reindex` moves stored vectors to their new
+# partitions; `app.py partitions` lists, drops and rebuilds them.
+VECTOR_PARTITION_KEY = os.getenv("VECTOR_PARTITION_KEY", "none")
+VECTOR_PARTITION_TIME_BUCKET = os.getenv("VECTOR_PARTITION_TIME_BUCKET", "month")
+VECTOR_PARTITION_SHARDS = int(os.getenv("VECTOR_PARTITION_SHARDS", 4))
+VECTOR_SEARCH_WORKERS = int(os.getenv("VECTOR_SEARCH_WORKERS", 8))
+
+# Ingestion: worker processes used for extraction, and how many files may be
+# submitted to the pool before results are consumed (bounds peak memory).
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", os.cpu_count() or 1))
+INGEST_MAX_IN_FLIGHT = int(os.getenv("INGEST_MAX_IN_FLIGHT", INGEST_WORKERS * 2))
+
+# PDFs: pages are extracted, normalized and chunked as a stream. PDFs with at
+# least PDF_STREAM_MIN_PAGES pages are extracted page by page by the consumer
+# instead of being shipped whole from a worker process, so memory is bounded
+# by a page. Extracting one page may take at most PDF_PAGE_TIMEOUT seconds
+# before it is skipped (0 = no limit; enforced only in a process's main thread).
+PDF_STREAM_MIN_PAGES = int(os.getenv("PDF_STREAM_MIN_PAGES", 200))
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", 30))
+
+# Processed-object store: normalized documents are appended to gzip JSONL
+# segments in PROCESSED_DATA_DIR (indexed by document ID and file hash), so
+# `app.py reindex` can re-chunk and re-embed without re-extracting raw files.
+# Data is fsynced every PROCESSED_FSYNC_EVERY objects; segments of at most
+# PROCESSED_SEGMENT_MAX_BYTES are compacted in the background (every
+# PROCESSED_COMPACT_INTERVAL seconds) once PROCESSED_COMPACT_RATIO of their
+# bytes belong to superseded or deleted documents.
+PROCESSED_STORE_ENABLED = os.getenv("PROCESSED_STORE_ENABLED", "1") == "1"
+PROCESSED_SEGMENT_MAX_BYTES = int(os.getenv("PROCESSED_SEGMENT_MAX_BYTES", 64 << 20))
+PROCESSED_FSYNC_EVERY = int(os.getenv("PROCESSED_FSYNC_EVERY", 64))
+PROCESSED_COMPACT_RATIO = float(os.getenv("PROCESSED_COMPACT_RATIO", 0.5))
+PROCESSED_COMPACT_INTERVAL = float(os.getenv("PROCESSED_COMPACT_INTERVAL", 300))
+
+# Pipelined ingest: encode batch size, how many chunks the encoder pools across
+# documents per model call, and the depth of the queues between stages
+INGEST_PIPELINED = os.getenv("INGEST_PIPELINED", "1") == "1"
+INGEST_ENCODE_BATCH_SIZE = int(os.getenv("INGEST_ENCODE_BATCH_SIZE", 64))
+INGEST_ENCODE_POOL_SIZE = int(os.getenv("INGEST_ENCODE_POOL_SIZE", 512))
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", 8))
+
+# Watch mode: seconds a path must be quiet before it is queued for ingest,
+# the stat-polling interval used when inotify (watchdog) is unavailable, and
+# how many queued paths are ingested per pipeline run
+WATCH_DEBOUNCE = float(os.getenv("WATCH_DEBOUNCE", 2.0))
+WATCH_POLL_INTERVAL = float(os.getenv("WATCH_POLL_INTERVAL", 5.0))
+WATCH_BATCH_SIZE = int(os.getenv("WATCH_BATCH_SIZE", 32))
+
+# Near-duplicate chunk detection before embedding: MinHash signatures over
+# word shingles, LSH-banded and persisted in the metadata store. Chunks whose
+# estimated Jaccard similarity to a stored chunk reaches DEDUP_THRESHOLD
+# reference that chunk instead of getting their own vector.
+DEDUP_ENABLED = os.getenv("DEDUP_ENABLED", "1") == "1"
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.85))
+DEDUP_NUM_PERM = int(os.getenv("DEDUP_NUM_PERM", 128))
+
+# Embedding inference: "torch" (float32 reference), "onnx" (ONNX Runtime) or
+# "onnx-int8" (dynamically quantized ONNX model, exported once on first use).
+# The ONNX backends need the `onnx` extra (`pip install 'intrafact-ai[onnx]'`); check
+# their agreement with torch via `app.py check-embeddings`. EMBEDDING_THREADS
+# caps CPU threads used for inference (0 = library default).
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0))
+
+# Local embedding server (`app.py serve-embeddings`): "auto" uses it whenever
+# its Unix socket answers and encodes in-process otherwise; "off" never does.
+# Concurrent requests are merged into batches of up to MAX_BATCH texts,
+# waiting at most MAX_WAIT seconds for a batch to fill.
+EMBEDDING_SERVER = os.getenv("EMBEDDING_SERVER", "auto")
+EMBEDDING_SOCKET_PATH = Path(os.getenv("EMBEDDING_SOCKET_PATH", DATA_DIR/"embedder.sock"))
+EMBEDDING_SERVER_MAX_BATCH = int(os.getenv("EMBEDDING_SERVER_MAX_BATCH", 64))
+EMBEDDING_SERVER_MAX_WAIT = float(os.getenv("EMBEDDING_SERVER_MAX_WAIT", 0.005))
+
+# Embedding cache: one float32 row per entry (~1.5 KB for a 384-dim model).
+# Hits update the LRU order at most every EMBEDDING_CACHE_TOUCH_INTERVAL
+# seconds, so reads never wait for the cache's write lock
+EMBEDDING_CACHE_DIR = DATA_DIR/"embedding_cache"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 100_000))
+EMBEDDING_CACHE_TOUCH_INTERVAL = float(os.getenv("EMBEDDING_CACHE_TOUCH_INTERVAL", 30))
+
+# Retriever caches (query embeddings and search results): size and TTL in seconds
+QUERY_CACHE_MAX_ENTRIES = int(os.getenv("QUERY_CACHE_MAX_ENTRIES", 1024))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", 600))
+
+# Retrieval: "vector", "lexical" (SQLite FTS5 / BM25) or "hybrid" (both, fused
+# with reciprocal rank fusion using constant RRF_K)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# Query router: "local" (embedding prototypes, LLM only for ambiguous queries)
+# or "llm" (always ask the LLM). ROUTER_MARGIN is the minimum gap between the
+# SEARCH and DIRECT similarity scores for a local decision. When
+# ROUTER_LOG_PATH is set, every decision (with the raw query) is appended to it
+# as JSONL, rotated at ROUTER_LOG_MAX_BYTES with ROUTER_LOG_BACKUPS old files
+ROUTER_MODE = os.getenv("ROUTER_MODE", "local")
+ROUTER_MARGIN = float(os.getenv("ROUTER_MARGIN", 0.05))
+ROUTER_TOP_K = int(os.getenv("ROUTER_TOP_K", 3))
+ROUTER_LOG_PATH = os.getenv("ROUTER_LOG_PATH", "")
+ROUTER_LOG_MAX_BYTES = int(os.getenv("ROUTER_LOG_MAX_BYTES", 10 * 1024 * 1024))
+ROUTER_LOG_BACKUPS = int(os.getenv("ROUTER_LOG_BACKUPS", 3))
+
+# Async LLM client: concurrent questions per process, per-request timeout in
+# seconds, and retries (with exponential backoff) on connection errors/429/5xx
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 16))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 60))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 3))
+
+# Context packing: chunks retrieved per question, the token budget for the
+# packed context, and the word-shingle overlap above which passages count as
+# near duplicates
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 10))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", 0.8))
+
+# Batch answering (answer_many / `app.py batch`): concurrent LLM calls, and how
+# many questions are embedded, routed and searched together
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))
+BATCH_WINDOW = int(os.getenv("BATCH_WINDOW", 64))
+
+# Logging and telemetry: log level and format of Intrafact's loggers; when set,
+# every finished span is appended to TRACE_PATH (JSONL) and metrics are written
+# to METRICS_PATH (Prometheus text format, or JSON for a .json path)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "%(message)s")
+TRACE_PATH = os.getenv("TRACE_PATH", "")
+METRICS_PATH = os.getenv("METRICS_PATH", "")
 
 os.makedirs(RAW_DATA_DIR, exist_ok=True)
 os.makedirs(PROCESSED_DATA_DIR, exist_ok=True)
 os.makedirs(CHROMA_DB_DIR, exist_ok=True)
+os.makedirs(EMBEDDING_CACHE_DIR, exist_ok=True)
+os.makedirs(VECTOR_INDEX_DIR, exist_ok=True)
 # Removed the SQL part because it was giving errors
 
@@ -1,8 +1,35 @@
+import contextlib
 import hashlib
+import logging
+import multiprocessing
+import signal
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from pathlib import Path
-from intrafact.config import RAW_DATA_DIR, PROCESSED_DATA_DIR
-import pypdf
-from typing import List, Dict, Optional
+from intrafact.config import (RAW_DATA_DIR, PROCESSED_DATA_DIR, INGEST_WORKERS, INGEST_MAX_IN_FLIGHT,
+                              PDF_STREAM_MIN_PAGES, PDF_PAGE_TIMEOUT)
+from typing import List, Dict, Optional, Iterator, Tuple
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
+
+TEXT_SUFFIXES = ['.txt', '.md', '.csv', '.json', '.log', '.xml', '.html']
+SUPPORTED_SUFFIXES = ['.pdf'] + TEXT_SUFFIXES
+
+# A child extracting a PDF that sends nothing for this many page timeouts is killed
+PDF_STALL_FACTOR = 4
+
+DOCUMENT_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "intrafact:document")
+
+def document_id_for_path(file_path) -> str:
+    """
+    Stable document ID of a raw file: re-ingesting a changed file updates
+    the same document instead of creating a new one.
+    """
+    return str(uuid.uuid5(DOCUMENT_ID_NAMESPACE, str(file_path)))
 
 def calculate_file_hash(content: str) -> str:
     """
@@ -10,23 +37,137 @@ def calculate_file_hash(content: str) -> str:
     """
     return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
-def extract_text_from_pdf(filepath: Path) -> str:
+def calculate_raw_file_hash(filepath: Path, block_size: int = 1 << 20) -> str:
     """
-    Reads a PDF file and converts it to a single string of text.
+    Calculates the SHA256 hash of a file's raw bytes, reading it in blocks
+    so large files are never loaded into memory at once.
+    """
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+class PageTimeout(BaseException):
+    """
+    Raised inside a page's extraction when its time is up. A BaseException,
+    so pypdf's own `except Exception` handlers cannot swallow it.
     """
-    text_content = []
+
+def _can_time_pages(seconds: float) -> bool:
+    # SIGALRM is only delivered to the main thread
+    return seconds > 0 and hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+@contextlib.contextmanager
+def _page_deadline(seconds: float):
+    if not _can_time_pages(seconds):
+        yield
+        return
+
+    def expire(signum, frame):
+        raise PageTimeout()
+
+    previous = signal.signal(signal.SIGALRM, expire)
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        yield
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+def count_pdf_pages(filepath: Path) -> int:
+    """
+    Number of pages in a PDF (0 if it cannot be read), without extracting any text.
+    """
+    import pypdf
+
     try:
         with open(filepath, 'rb') as f:
-            reader = pypdf.PdfReader(f)
-            for page in reader.pages:
-                text = page.extract_text()
-                if text:
-                    text_content.append(text)
-        
-        return "\n".join(text_content)
+            return len(pypdf.PdfReader(f).pages)
     except Exception as e:
-        print(f"   ⚠️ Error reading PDF {filepath.name}: {e}")
-        return ""
+        logger.warning(f"   ⚠️ Error reading PDF {filepath.name}: {e}")
+        return 0
+
+def iter_pdf_pages(filepath: Path, page_timeout: float = PDF_PAGE_TIMEOUT) -> Iterator[Tuple[int, str]]:
+    """
+    Lazily yields (page_number, text) for each page of a PDF that has text,
+    numbered from 1, so only one page's text is held at a time. A page whose
+    extraction fails or takes longer than `page_timeout` seconds is skipped.
+
+    Outside the main thread (e.g. in the watch daemon), where the deadline
+    cannot be set, the pages are extracted by a child process instead.
+    """
+    if page_timeout > 0 and hasattr(signal, "setitimer") and not _can_time_pages(page_timeout):
+        yield from _iter_pdf_pages_in_process(filepath, page_timeout)
+    else:
+        yield from _extract_pdf_pages(filepath, page_timeout)
+
+def _send_pdf_pages(filepath: Path, page_timeout: float, conn):
+    # Child process entry point: its main thread can set page deadlines
+    try:
+        for page in _extract_pdf_pages(filepath, page_timeout):
+            conn.send(page)
+    finally:
+        conn.send(None)
+        conn.close()
+
+def _iter_pdf_pages_in_process(filepath: Path, page_timeout: float) -> Iterator[Tuple[int, str]]:
+    # The pipe's buffer bounds how far the child runs ahead of the consumer
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    process = multiprocessing.Process(target=_send_pdf_pages, args=(filepath, page_timeout, sender),
+                                      name="intrafact-pdf", daemon=True)
+    process.start()
+    sender.close()
+    try:
+        while True:
+            # Backstop for a child stuck where the page deadline cannot reach
+            if not receiver.poll(page_timeout * PDF_STALL_FACTOR):
+                logger.warning(f"   ⚠️ {filepath.name}: extraction stalled, remaining pages skipped")
+                return
+            try:
+                page = receiver.recv()
+            except EOFError:
+                return
+            if page is None:
+                return
+            yield page
+    finally:
+        receiver.close()
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+def _extract_pdf_pages(filepath: Path, page_timeout: float) -> Iterator[Tuple[int, str]]:
+    import pypdf
+
+    with open(filepath, 'rb') as f:
+        try:
+            reader = pypdf.PdfReader(f)
+            page_count = len(reader.pages)
+        except Exception as e:
+            logger.warning(f"   ⚠️ Error reading PDF {filepath.name}: {e}")
+            return
+
+        for number in range(1, page_count + 1):
+            try:
+                with _page_deadline(page_timeout):
+                    text = reader.pages[number - 1].extract_text()
+            except PageTimeout:
+                logger.warning(f"   ⚠️ {filepath.name}: page {number} took over {page_timeout:g}s to extract, skipped")
+                continue
+            except Exception as e:
+                logger.warning(f"   ⚠️ Error reading page {number} of {filepath.name}: {e}")
+                continue
+
+            if text and text.strip():
+                yield number, text
+
+def extract_text_from_pdf(filepath: Path) -> str:
+    """
+    Reads a PDF file and converts it to a single string of text.
+    Prefer iter_pdf_pages() for large files.
+    """
+    return "\n".join(text for _, text in iter_pdf_pages(filepath))
 
 def extract_text_from_txt(filepath: Path) -> str:
     """
@@ -41,10 +182,10 @@ def extract_text_from_txt(filepath: Path) -> str:
         except UnicodeDecodeError:
             continue
         except Exception as e:
-            print(f"   ⚠️ Error reading file {filepath.name}: {e}")
+            logger.warning(f"   ⚠️ Error reading file {filepath.name}: {e}")
             return ""
     
-    print(f"   ⚠️ Could not decode {filepath.name} with any encoding")
+    logger.warning(f"   ⚠️ Could not decode {filepath.name} with any encoding")
     return ""
 
 def get_file_content(filepath: Path) -> Optional[str]:
@@ -55,105 +196,306 @@ def get_file_content(filepath: Path) -> Optional[str]:
     
     if suffix == '.pdf':
         return extract_text_from_pdf(filepath)
-    elif suffix in ['.txt', '.md', '.csv', '.json', '.log', '.xml', '.html']:
+    elif suffix in TEXT_SUFFIXES:
         return extract_text_from_txt(filepath)
     else:
-        print(f"   ⚠️ Unsupported file type: {filepath.name}")
+        logger.warning(f"   ⚠️ Unsupported file type: {filepath.name}")
         return None
 
-def check_if_processed(file_hash: str, file_name: str) -> bool:
+def is_candidate_file(file_path: Path, root: Path = RAW_DATA_DIR) -> bool:
     """
-    Checks if a file with this hash actually exists in the processed folder.
-    Returns True only if BOTH the hash matches AND the file physically exists.
+    True for files under `root` (the raw data directory by default) that are
+    not hidden and not inside a hidden directory (editor swap files, .git, ...).
     """
-    # Check if processed directory exists
-    if not PROCESSED_DATA_DIR.exists():
-        PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
+    try:
+        relative = file_path.relative_to(root)
+    except ValueError:
         return False
-    
-    # Look for any file with matching hash in the filename or metadata
-    # This assumes processed files are named with hash (adjust based on your system)
-    processed_files = list(PROCESSED_DATA_DIR.glob("*"))
-    
-    for processed_file in processed_files:
-        # Check if this file's name contains the hash
-        if file_hash in processed_file.name:
-            return True
-        
-        # Alternative: check metadata file if you store hash separately
-        # You might need to adjust this based on how your system stores metadata
-    
-    return False
+    return not any(part.startswith('.') for part in relative.parts)
 
-def ingestor() -> List[Dict]:
+def list_raw_files() -> List[Path]:
     """
-    Reads all supported files from the raw data directory and returns a list 
-    of data objects for the normalization layer.
+    Returns every candidate file in the raw data directory and its
+    subdirectories (excluding hidden files).
     """
     # 1. Ensure directories exist
     if not RAW_DATA_DIR.exists():
-        print(f"❌ Directory not found: {RAW_DATA_DIR}")
+        logger.error(f"❌ Directory not found: {RAW_DATA_DIR}")
         return []
     
     if not PROCESSED_DATA_DIR.exists():
         PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
-        print(f"✅ Created processed directory: {PROCESSED_DATA_DIR}")
+        logger.info(f"✅ Created processed directory: {PROCESSED_DATA_DIR}")
     
-    # 2. Get all files in the directory (excluding hidden files)
-    files = [f for f in RAW_DATA_DIR.glob("*") if f.is_file() and not f.name.startswith('.')]
+    # 2. Get all files in the directory tree (excluding hidden files)
+    files = [f for f in RAW_DATA_DIR.rglob("*") if f.is_file() and is_candidate_file(f, RAW_DATA_DIR)]
     
     if not files:
-        print(f"⚠️ No files found in {RAW_DATA_DIR}")
+        logger.warning(f"⚠️ No files found in {RAW_DATA_DIR}")
         return []
     
-    print(f"📂 Found {len(files)} file(s) in raw directory")
-    
-    collected_data = []
+    logger.info(f"📂 Found {len(files)} file(s) in raw directory")
+    return files
+
+def _file_metadata(file_path: Path, stat, file_hash: str) -> Dict:
+    return {
+        "file_name": file_path.name,
+        "file_path": str(file_path),
+        "file_type": file_path.suffix.lower(),
+        "source_type": "local_file",
+        "file_hash": file_hash,
+        "file_size": stat.st_size,
+        "file_mtime_ns": stat.st_mtime_ns,
+        "file_inode": stat.st_ino
+    }
+
+def load_document(file_path: Path, known_hash: Optional[str] = None,
+                  stream_min_pages: int = PDF_STREAM_MIN_PAGES, keep_empty: bool = False) -> Optional[Dict]:
+    """
+    Extracts a single file into a standardized data object, or returns None
+    if it should be skipped. Runs inside worker processes, so it must stay a
+    module-level function. The extraction time travels with the object
+    ("extract_seconds"), since worker processes have their own metrics.
+
+    Text files come back as "raw_text"; PDFs as "pages", a list of
+    (page_number, text). PDFs of at least `stream_min_pages` pages are not
+    extracted here: "pages" is None and iter_document_pages() streams them
+    in the consuming process instead. Either way, read the text through
+    iter_document_pages().
+
+    With keep_empty=True a file without text comes back too, with no pages
+    and "empty" set, so the caller can drop what was stored for its path.
+
+    When the raw bytes hash to `known_hash` (the hash last recorded for the
+    path) nothing is extracted: the object has only "metadata" and
+    "unchanged" set.
+    """
+    started = time.perf_counter()
+    stat = file_path.stat()
+
+    # 3. Hash the raw bytes (identity of the file, independent of extraction)
+    file_hash = calculate_raw_file_hash(file_path)
+    if file_hash == known_hash:
+        # Touched or copied but identical bytes
+        return {"metadata": _file_metadata(file_path, stat, file_hash), "unchanged": True}
+
+    # 4. Extract content based on file type
+    content, pages, page_count, chars = None, None, None, None
+    skipped = None
+    if file_path.suffix.lower() == '.pdf':
+        page_count = count_pdf_pages(file_path)
+        if not page_count:
+            skipped = "empty or unsupported"
+
+        elif page_count < stream_min_pages:
+            pages = list(iter_pdf_pages(file_path))
+            if not pages:
+                skipped = "no text content"
+            chars = sum(len(text) for _, text in pages)
+    else:
+        content = get_file_content(file_path)
+
+        if not content:
+            skipped = "empty or unsupported"
+        elif len(content.strip()) == 0:
+            skipped = "no text content"
+        chars = len(content or "")
+
+    if skipped:
+        logger.info(f"   ⏭️ Skipping {file_path.name} ({skipped})")
+        if not keep_empty:
+            return None
+        content, pages, chars = None, [], 0
+
+    # 5. Create standardized data object
+    data_item = {
+        "raw_text": content,
+        "pages": pages,
+        "page_count": page_count,
+        "chars": chars,
+        "metadata": _file_metadata(file_path, stat, file_hash),
+        "extract_seconds": time.perf_counter() - started
+    }
+    if skipped:
+        data_item["empty"] = True
+        return data_item
+
+    if chars is None:
+        logger.info(f"   ✅ Collected: {file_path.name} ({page_count} pages, streamed)")
+    else:
+        logger.info(f"   ✅ Collected: {file_path.name} ({chars} chars)")
+    return data_item
+
+def iter_document_pages(data_item: Dict) -> Iterator[Tuple[Optional[int], str]]:
+    """
+    The text of a data object from load_document() as (page_number, text)
+    pieces: the pages of a PDF (extracted here, one at a time, when it was
+    left to be streamed), or the whole text of any other file with
+    page_number None.
+    """
+    if data_item.get("pages") is not None:
+        yield from data_item["pages"]
+    elif data_item.get("raw_text") is not None:
+        yield None, data_item["raw_text"]
+    else:
+        yield from iter_pdf_pages(Path(data_item["metadata"]["file_path"]))
+
+def _record_extract(data_item: Dict):
+    metadata = data_item["metadata"]
+    attributes = {"document": metadata["file_name"], "bytes": metadata["file_size"]}
+    if data_item.get("chars") is not None:
+        attributes["chars"] = data_item["chars"]
+    if data_item.get("page_count"):
+        attributes["pages"] = data_item["page_count"]
+    telemetry.record_span("extract", data_item.get("extract_seconds", 0.0), **attributes)
+
+def filter_changed_files(files: List[Path], meta_store, full_scan: bool = True) -> Iterator[Tuple[Path, Optional[str]]]:
+    """
+    Yields (path, known_hash) for files that may have changed, known_hash
+    being the content hash last recorded for the path (or None). Files whose
+    (size, mtime_ns, inode) match the manifest are skipped without being
+    opened; hashing the rest is left to the extraction workers (see
+    load_document). Unsupported files are recorded so later scans skip them
+    by stat. Unless `full_scan`, only the manifest entries of `files` are
+    loaded.
+    """
+    manifest = meta_store.load_manifest(None if full_scan else [str(file_path) for file_path in files])
 
     for file_path in files:
         try:
-            # 3. Extract content based on file type
-            content = get_file_content(file_path)
-            
-            if not content:
-                print(f"   ⏭️ Skipping {file_path.name} (empty or unsupported)")
-                continue
-            
-            if len(content.strip()) == 0:
-                print(f"   ⏭️ Skipping {file_path.name} (no text content)")
+            stat = file_path.stat()
+            key = str(file_path)
+            known = manifest.get(key)
+
+            if known and known[:3] == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
                 continue
-            
-            # 4. Calculate hash
-            file_hash = calculate_file_hash(content)
-            
-            # 5. CRITICAL FIX: Check if file is actually processed (not just hash exists)
-            if check_if_processed(file_hash, file_path.name):
-                print(f"   ✓ Already processed: {file_path.name}")
+
+            if file_path.suffix.lower() not in SUPPORTED_SUFFIXES:
+                logger.warning(f"   ⚠️ Unsupported file type: {file_path.name}")
+                meta_store.update_manifest(key, stat.st_size, stat.st_mtime_ns, stat.st_ino, "")
                 continue
-            
-            # 6. Create standardized data object
-            data_item = {
-                "raw_text": content,
-                "metadata": {
-                    "file_name": file_path.name,
-                    "file_path": str(file_path),
-                    "file_type": file_path.suffix.lower(),
-                    "source_type": "local_file",
-                    "file_hash": file_hash,
-                    "file_size": file_path.stat().st_size
-                }
-            }
-            
-            collected_data.append(data_item)
-            print(f"   ✅ Collected: {file_path.name} ({len(content)} chars)")
+
+            yield file_path, known[3] if known else None
+
+        except Exception as e:
+            logger.error(f"   ❌ Failed to check {file_path.name}: {e}")
+
+def _finish_document(data_item: Optional[Dict], meta_store) -> Optional[Dict]:
+    """
+    Returns a data object from load_document() for the consumer, or None
+    when there is nothing to ingest. Unchanged files only get their stat
+    snapshot refreshed.
+    """
+    if not data_item:
+        return None
+    if data_item.get("unchanged"):
+        meta_store.record_file(data_item["metadata"])
+        logger.info(f"   ✓ Already processed: {data_item['metadata']['file_name']}")
+        return None
+    _record_extract(data_item)
+    return data_item
+
+def ingestor() -> List[Dict]:
+    """
+    Reads all supported files from the raw data directory and returns a list 
+    of data objects for the normalization layer.
+
+    Every object holds its whole text as "raw_text"; PDFs are extracted
+    eagerly, whatever their size, and keep their "pages" too. Large corpora
+    should go through iter_ingest(), which streams big PDFs instead.
+    """
+    collected_data = []
+
+    for file_path in list_raw_files():
+        try:
+            data_item = load_document(file_path, stream_min_pages=sys.maxsize)
+            if data_item:
+                if data_item["raw_text"] is None:
+                    data_item["raw_text"] = "\n".join(text for _, text in data_item["pages"])
+                collected_data.append(data_item)
             
         except Exception as e:
-            print(f"   ❌ Failed to process {file_path.name}: {e}")
+            logger.error(f"   ❌ Failed to process {file_path.name}: {e}")
             continue
 
-    print(f"\n📊 Total files to process: {len(collected_data)}")
+    logger.info(f"📊 Total files to process: {len(collected_data)}")
     return collected_data
 
+def iter_ingest(max_workers: Optional[int] = None, max_in_flight: Optional[int] = None,
+                meta_store=None, paths: Optional[List[Path]] = None) -> Iterator[Dict]:
+    """
+    Streaming variant of ingestor(). Extracts files on a process pool and
+    yields data objects as soon as each one finishes (in completion order).
+    At most `max_in_flight` files are submitted ahead of the consumer, so only
+    a bounded number of extracted documents are ever held in memory.
+
+    When a MetadataStore is given, its file manifest is consulted first and
+    unchanged files are skipped before extraction (by stat here, by content
+    hash in the workers). Callers record processed files with
+    MetadataStore.record_file(). Files without text are then
+    yielded too (see load_document's keep_empty), so an edit that empties a
+    file removes its document.
+
+    `paths` restricts the run to the given files (e.g. from the watcher)
+    instead of scanning the raw data directory.
+    """
+    if paths is None:
+        files = list_raw_files()
+    else:
+        files = [Path(path) for path in paths if Path(path).is_file()]
+    if not files:
+        return
+
+    if meta_store is not None:
+        candidates = filter_changed_files(files, meta_store, full_scan=paths is None)
+    else:
+        candidates = ((file_path, None) for file_path in files)
+    keep_empty = meta_store is not None
+
+    max_workers = max_workers or INGEST_WORKERS
+    max_in_flight = max(max_in_flight or INGEST_MAX_IN_FLIGHT, max_workers)
+
+    if max_workers <= 1:
+        for file_path, known_hash in candidates:
+            try:
+                data_item = _finish_document(load_document(file_path, known_hash, keep_empty=keep_empty), meta_store)
+            except Exception as e:
+                logger.error(f"   ❌ Failed to process {file_path.name}: {e}")
+                continue
+            if data_item:
+                yield data_item
+        return
+
+    pool = ProcessPoolExecutor(max_workers=max_workers)
+    pending = {}
+
+    try:
+        while True:
+            # Top up the pool until the in-flight limit is reached
+            while len(pending) < max_in_flight:
+                candidate = next(candidates, None)
+                if candidate is None:
+                    break
+                file_path, known_hash = candidate
+                pending[pool.submit(load_document, file_path, known_hash, keep_empty=keep_empty)] = file_path
+
+            if not pending:
+                break
+
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                file_path = pending.pop(future)
+                try:
+                    data_item = _finish_document(future.result(), meta_store)
+                except Exception as e:
+                    logger.error(f"   ❌ Failed to process {file_path.name}: {e}")
+                    continue
+                if data_item:
+                    yield data_item
+    finally:
+        # Also reached when the consumer stops early: drop queued work
+        pool.shutdown(wait=True, cancel_futures=True)
+
 if __name__ == "__main__":
     result = ingestor()
     print(f"\nIngested {len(result)} documents")
\ No newline at end of file
@@ -0,0 +1,243 @@
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from intrafact.config import RAW_DATA_DIR, WATCH_DEBOUNCE, WATCH_POLL_INTERVAL, WATCH_BATCH_SIZE
+from intrafact.ingestion.file_ingestor import is_candidate_file, SUPPORTED_SUFFIXES
+from intrafact.storage.metadata_store import MetadataStore
+
+logger = logging.getLogger(__name__)
+
+class DirectoryWatcher:
+    """
+    Watches the raw data directory tree and queues changed paths.
+
+    Uses inotify (through the optional `watchdog` package, installed by the
+    `watch` extra) when available and falls back to polling a stat snapshot
+    of the tree. Events for a path are debounced: it is queued once no event
+    has arrived for `debounce` seconds, so a file being written in many small
+    pieces is ingested once. The queue lives in the metadata store and
+    survives restarts.
+    """
+
+    def __init__(self, meta_store: MetadataStore, root: Path = RAW_DATA_DIR,
+                 debounce: float = WATCH_DEBOUNCE, poll_interval: float = WATCH_POLL_INTERVAL,
+                 use_inotify: bool = True):
+        self.meta_store = meta_store
+        self.root = Path(root)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+
+        self.lock = threading.Lock()
+        self.changed = {}
+        self.snapshot = {}
+        self.stop_event = threading.Event()
+        self.observer = None
+        self.thread = None
+        self.mode = None
+
+    def _is_watched(self, path: Path) -> bool:
+        return is_candidate_file(path, self.root) and path.suffix.lower() in SUPPORTED_SUFFIXES
+
+    def notify(self, path):
+        """
+        Records an event for `path` (created, modified, moved or deleted).
+        """
+        path = Path(path)
+        if self._is_watched(path):
+            with self.lock:
+                self.changed[str(path)] = time.monotonic()
+
+    def _scan(self) -> Dict[str, tuple]:
+        snapshot = {}
+        stack = [str(self.root)]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        stat = entry.stat()
+                        snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                except OSError:
+                    continue
+        return snapshot
+
+    def _poll(self):
+        snapshot = self._scan()
+        for path in snapshot.keys() | self.snapshot.keys():
+            if snapshot.get(path) != self.snapshot.get(path):
+                self.notify(path)
+        self.snapshot = snapshot
+
+    def _start_inotify(self) -> bool:
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            return False
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory:
+                    return
+                watcher.notify(event.src_path)
+                if getattr(event, "dest_path", None):
+                    watcher.notify(event.dest_path)
+
+        self.observer = Observer()
+        self.observer.schedule(Handler(), str(self.root), recursive=True)
+        self.observer.start()
+        return True
+
+    def flush(self) -> int:
+        """
+        Queues every path that has been quiet for `debounce` seconds and
+        returns how many were queued.
+        """
+        now = time.monotonic()
+        with self.lock:
+            ready = [path for path, last_event in self.changed.items() if now - last_event >= self.debounce]
+            for path in ready:
+                del self.changed[path]
+
+        if ready:
+            self.meta_store.enqueue_paths(ready, time.time())
+        return len(ready)
+
+    def _loop(self):
+        last_poll = 0.0
+        while not self.stop_event.is_set():
+            if self.observer is None and time.monotonic() - last_poll >= self.poll_interval:
+                self._poll()
+                last_poll = time.monotonic()
+            self.flush()
+            self.stop_event.wait(min(self.debounce, self.poll_interval) / 4 or 0.1)
+
+    def start(self):
+        if self.use_inotify and self._start_inotify():
+            self.mode = "inotify"
+        else:
+            self.mode = "polling"
+            self.snapshot = self._scan()
+
+        self.thread = threading.Thread(target=self._loop, name="intrafact-watch", daemon=True)
+        self.thread.start()
+        logger.info(f"👀 Watching {self.root} ({self.mode})")
+
+    def stop(self):
+        self.stop_event.set()
+        if self.observer is not None:
+            self.observer.stop()
+            self.observer.join()
+        if self.thread is not None:
+            self.thread.join()
+        self.flush()
+
+    @property
+    def debouncing(self) -> int:
+        with self.lock:
+            return len(self.changed)
+
+
+class IngestDaemon:
+    """
+    Watch-mode ingestion: a DirectoryWatcher fills the persistent queue and a
+    background thread drains it through an IngestPipeline, `batch_size` paths
+    at a time. Queued paths that no longer exist (deleted or moved away)
+    have their documents removed by the pipeline, without sweeping the
+    whole manifest. On start, paths left in the queue by an earlier process
+    and anything changed while it was down are picked up by one full scan.
+    """
+
+    def __init__(self, pipeline, watcher: Optional[DirectoryWatcher] = None,
+                 batch_size: int = WATCH_BATCH_SIZE):
+        self.pipeline = pipeline
+        self.meta_store = pipeline.meta_store
+        self.watcher = watcher or DirectoryWatcher(self.meta_store)
+        self.batch_size = batch_size
+
+        self.stop_event = threading.Event()
+        self.thread = None
+
+        self.processed_files = 0
+        self.batches = 0
+        self.last_lag = None
+        self.last_batch_at = None
+        self.last_error = None
+
+    def start(self):
+        self.watcher.start()
+        self.thread = threading.Thread(target=self._run, name="intrafact-ingest", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        self.watcher.stop()
+        if self.thread is not None:
+            self.thread.join()
+
+    def _run(self):
+        try:
+            self.pipeline.run()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"❌ Initial scan failed: {e}")
+
+        while not self.stop_event.is_set():
+            if not self.process_batch():
+                self.stop_event.wait(self.watcher.debounce / 2 or 0.5)
+
+    def process_batch(self) -> int:
+        """
+        Ingests up to batch_size queued paths; returns how many were taken.
+        """
+        queued = self.meta_store.peek_queue(self.batch_size)
+        if not queued:
+            return 0
+
+        taken_at = time.time()
+        paths = [path for path, _ in queued]
+        try:
+            self.pipeline.run(paths)
+        except Exception as e:
+            # Paths stay queued and are retried on the next pass
+            self.last_error = str(e)
+            logger.error(f"❌ Watch ingest failed: {e}")
+            self.stop_event.wait(self.watcher.poll_interval)
+            return 0
+
+        self.meta_store.complete_paths(paths, taken_at)
+        self.processed_files += len(paths)
+        self.batches += 1
+        self.last_batch_at = time.time()
+        self.last_lag = self.last_batch_at - min(enqueued_at for _, enqueued_at in queued)
+        return len(paths)
+
+    def metrics(self) -> Dict:
+        """
+        Queue depth, ingest lag (age of the oldest queued path, and enqueue to
+        indexed time of the last batch) and counters.
+        """
+        depth, oldest = self.meta_store.queue_stats()
+        return {
+            "mode": self.watcher.mode,
+            "queue_depth": depth,
+            "debouncing": self.watcher.debouncing,
+            "oldest_queued_age": time.time() - oldest if oldest is not None else 0.0,
+            "last_batch_lag": self.last_lag,
+            "processed_files": self.processed_files,
+            "batches": self.batches,
+            "last_error": self.last_error
+        }
@@ -1,8 +1,8 @@
 import json
 import uuid
-from typing import Dict
-from datetime import datetime, timezone
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+from datetime import datetime, timezone
 
 from intrafact.config import PROCESSED_DATA_DIR
 
@@ -10,18 +10,31 @@ class TextNormalizer:
     def __init__(self) -> None:
         PROCESSED_DATA_DIR.mkdir(parents=True, exist_ok=True)
 
+    def iter_clean_lines(self, lines: Iterable[str]) -> Iterator[str]:
+        """
+        Yields each non-blank line with its whitespace collapsed.
+        """
+        for line in lines:
+            words = line.split()
+            if words:
+                yield " ".join(words)
+
     def clean_text(self, raw_text: str) -> str:
         if not raw_text:
             return ""
 
-        cleaned_lines = []
-        for line in raw_text.splitlines():
-            if line.strip():
+        return "\n\n".join(self.iter_clean_lines(raw_text.splitlines()))
 
-                clean_line = " ".join(line.split())
-                cleaned_lines.append(clean_line)
-        
-        return "\n\n".join(cleaned_lines)
+    def iter_clean_pages(self, pages: Iterable[Tuple[Optional[int], str]]) -> Iterator[Tuple[Optional[int], str]]:
+        """
+        Cleans a stream of (page_number, text) pieces one at a time, dropping
+        pieces left empty. Joined by blank lines, the pieces equal clean_text()
+        of the whole text.
+        """
+        for page_number, text in pages:
+            cleaned = self.clean_text(text)
+            if cleaned:
+                yield page_number, cleaned
     
     def normalize(self,raw_text: str, metadata: Dict) -> Dict:
 
@@ -38,6 +51,22 @@ class TextNormalizer:
           
         }
         return knowledge_object
+
+    def normalize_pages(self, pages: Iterable[Tuple[Optional[int], str]], metadata: Dict) -> Dict:
+        """
+        Streaming variant of normalize(): "pages" is a lazy iterator of cleaned
+        (page_number, text) pieces instead of one "content" string, for
+        TextChunker to consume. It can be iterated only once.
+        """
+        return {
+            "id": str(uuid.uuid4()),
+            "pages": self.iter_clean_pages(pages),
+            "metadata": {
+                **metadata,
+                "processed_at": datetime.now(timezone.utc).isoformat(),
+                "status": "processed"
+            }
+        }
     
     def save_object(self, knowledge_object: Dict, original_file_name: str) -> Path:
 
@@ -49,3 +78,15 @@ class TextNormalizer:
             json.dump(knowledge_object, f, indent=4, ensure_ascii=False)
 
         return save_path
+
+    def store_object(self, knowledge_object: Dict, store=None) -> Dict:
+        """
+        Saves a knowledge object to the processed-object store (the shared
+        one by default) and returns it, instead of writing one JSON file per
+        object like save_object(). A "pages" stream is saved as it is
+        read, so use the returned object from then on (see ProcessedStore.put).
+        """
+        if store is None:
+            from intrafact import registry
+            store = registry.get_processed_store()
+        return store.put(knowledge_object)
@@ -1,66 +1,209 @@
+import copy
+import re
 import uuid
-from typing import List, Dict
+import zlib
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+WORD_PATTERN = re.compile(r"\S+")
+
+# Joins the pieces of a streamed document, like the blank line TextNormalizer
+# puts between lines
+PIECE_SEPARATOR = "\n\n"
+
+CHUNK_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "intrafact:chunk")
+
+def chunk_id(parent_id: str, content: str, occurrence: int = 0) -> str:
+    """
+    Deterministic chunk ID: the same text in the same document keeps its ID
+    across re-ingests. `occurrence` tells repeated identical chunks apart.
+    """
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{parent_id}\x00{occurrence}\x00{content}"))
 
 class TextChunker:
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50):
+    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50, tokenizer=None,
+                 content_defined: bool = False):
+        """
+        chunk_size and chunk_overlap are counted in characters, or in tokens
+        when a (HuggingFace fast) tokenizer is given.
+
+        With content_defined=True a chunk ends at the first word pair whose
+        hash hits a fixed pattern once it is at least 3/4 of chunk_size (or at
+        chunk_size if none does). Boundaries then depend only on nearby words,
+        so an edit re-chunks the text around it instead of shifting every
+        chunk after it.
+        """
         if chunk_overlap >= chunk_size:
             raise ValueError("chunk_overlap must be smaller than chunk_size")
 
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.tokenizer = tokenizer
+        self.content_defined = content_defined
 
-    def chunker(self, text: str) -> List[str]:
+        self.min_chunk_size = max(chunk_size * 3 // 4, chunk_overlap + 1)
+        # Aim for ~4 expected boundaries in the window between the minimum and
+        # maximum size (a word is ~1.3 tokens or ~6 characters). Fixed per
+        # chunker, so the same text always gets the same boundaries.
+        word_size = 1.3 if tokenizer is not None else 6.0
+        self.boundary_divisor = max(1, round((chunk_size - self.min_chunk_size) / word_size / 4))
+
+    @classmethod
+    def for_embedder(cls, embedder, chunk_overlap: int = 32) -> "TextChunker":
+        """
+        Token-sized chunker matching what the embedding model actually reads,
+        so no chunk is silently truncated at encode time. Boundaries are
+        content-defined so re-ingesting an edited file re-embeds little.
+        """
+        # A private tokenizer copy: fast tokenizers are not safe to share
+        # with the model while another thread encodes
+        return cls(embedder.max_tokens, chunk_overlap, tokenizer=copy.deepcopy(embedder.tokenizer),
+                   content_defined=True)
+
+    def _word_sizes(self, text: str, starts: List[int], ends: List[int]) -> List[int]:
+        if self.tokenizer is None:
+            return [end - start + 1 for start, end in zip(starts, ends)]
+
+        # One tokenizer pass over the whole text, then count tokens per word
+        encoding = self.tokenizer(
+            text,
+            add_special_tokens=False,
+            return_offsets_mapping=True,
+            truncation=False,
+            verbose=False
+        )
+        sizes = [0] * len(starts)
+        for token_start, token_end in encoding["offset_mapping"]:
+            if token_end > token_start:
+                sizes[bisect_right(starts, token_start) - 1] += 1
+        return sizes
+
+    def _is_boundary(self, text: str, starts: List[int], ends: List[int], j: int) -> bool:
+        # Hash of the last two words before a cut after word j - 1
+        window = text[starts[max(j - 2, 0)]:ends[j - 1]]
+        return zlib.crc32(window.encode("utf-8")) % self.boundary_divisor == 0
+
+    def iter_spans(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Lazily yields (start, end) character spans of each chunk in `text`.
+        Chunks always end on word boundaries; boundaries are found by
+        bisecting the cumulative word sizes, so the whole pass is linear.
+        """
         if not text:
-            return []
+            return
 
-        words = text.split()
-        chunks = []
-        current_chunk = []
-        current_length = 0
+        starts, ends = [], []
+        for match in WORD_PATTERN.finditer(text):
+            starts.append(match.start())
+            ends.append(match.end())
+
+        n = len(starts)
+        if n == 0:
+            return
+
+        # prefix[k] is the size of words[:k]
+        prefix = [0, *accumulate(self._word_sizes(text, starts, ends))]
 
         i = 0
-        while i < len(words):
-            word = words[i]
-            current_length += len(word) + 1   # Fixed: += instead of =
-            current_chunk.append(word)
+        while i < n:
+            # Chunk is words[i:j] for the largest j within chunk_size (at least
+            # one word, even if that word alone is larger)
+            j = max(bisect_right(prefix, prefix[i] + self.chunk_size, lo=i + 1) - 1, i + 1)
+            if self.content_defined and j < n:
+                # Cut earlier, at the first boundary past the minimum size
+                lo = bisect_left(prefix, prefix[i] + self.min_chunk_size, lo=i + 1)
+                j = next((b for b in range(lo, j) if self._is_boundary(text, starts, ends, b)), j)
+            yield starts[i], ends[j - 1]
 
-            if current_length >= self.chunk_size:
-                chunk_str = " ".join(current_chunk)
-                chunks.append(chunk_str)  
+            if j == n:
+                break
 
-                overlap = 0
-                backtrack = 0
-                while overlap < self.chunk_overlap and backtrack < len(current_chunk):  # Fixed: < self.chunk_overlap
-                    backtrack += 1
-                    overlap += len(current_chunk[-backtrack]) + 1  # Fixed: += instead of =
+            # Next chunk starts at the last k whose tail words[k:j] covers the overlap
+            k = bisect_right(prefix, prefix[j] - self.chunk_overlap, lo=i, hi=j + 1) - 1
+            i = max(k, i + 1)
 
-                i -= backtrack - 1
-                
-                # Reset for next chunk
-                current_chunk = []
-                current_length = 0
+    def iter_page_spans(self, pages: Iterable[Tuple[Optional[int], str]]
+                        ) -> Iterator[Tuple[int, int, str, Optional[int], Optional[int]]]:
+        """
+        Chunks a stream of (page_number, text) pieces as if they were one text
+        joined by PIECE_SEPARATOR, yielding (start, end, content, first_page,
+        last_page) with offsets into that joined text.
 
-            i += 1
+        Only the current piece and the unfinished chunk carried over from the
+        previous ones are held, so memory is bounded by a page. A chunk is
+        only emitted once text after it is known, so chunks (and their
+        overlap) come out the same as chunking the joined text in one go.
+        """
+        pieces = ((page, text) for page, text in pages if text)
+        piece = next(pieces, None)
 
-        if current_chunk:
-            chunks.append(" ".join(current_chunk)) 
+        buffer = ""
+        # Offset of buffer[0] in the joined text, and where each piece in the buffer starts
+        base = 0
+        piece_starts, piece_pages = [], []
 
-        return chunks   
+        while piece is not None:
+            page, text = piece
+            piece = next(pieces, None)
+            last = piece is None
 
-    def process_chunks(self, normalised_data: Dict) -> List[Dict]:
-        raw_text = normalised_data.get("content", "") 
-        text_chunks = self.chunker(raw_text)
+            if piece_starts:
+                buffer += PIECE_SEPARATOR
+            piece_starts.append(base + len(buffer))
+            piece_pages.append(page)
+            buffer += text
+
+            carry = len(buffer)
+            for start, end in self.iter_spans(buffer):
+                # A chunk reaching the end of the buffer may grow with the next piece
+                if not last and end >= len(buffer.rstrip()):
+                    carry = start
+                    break
+                first_page = piece_pages[bisect_right(piece_starts, base + start) - 1]
+                last_page = piece_pages[bisect_right(piece_starts, base + end - 1) - 1]
+                yield base + start, base + end, buffer[start:end], first_page, last_page
+
+            buffer = buffer[carry:]
+            base += carry
+            # Keep the piece the carried text starts in, and the ones after it
+            keep = max(bisect_right(piece_starts, base) - 1, 0)
+            del piece_starts[:keep], piece_pages[:keep]
 
-        chunk_objects = []
+    def chunker(self, text: str) -> List[str]:
+        return [text[start:end] for start, end in self.iter_spans(text)]
+
+    def iter_chunks(self, normalised_data: Dict) -> Iterator[Dict]:
+        """
+        Chunks a normalised document: its "content" string, or its "pages"
+        stream (see TextNormalizer.normalize_pages). Chunks of paged
+        documents record the pages they span in page_start and page_end.
+        """
+        metadata = normalised_data.get("metadata", {})
+        parent_id = normalised_data.get("id")
+
+        pages = normalised_data.get("pages")
+        if pages is not None:
+            spans = self.iter_page_spans(pages)
+        else:
+            raw_text = normalised_data.get("content", "")
+            spans = ((start, end, raw_text[start:end], None, None) for start, end in self.iter_spans(raw_text))
 
-        for index, text_segment in enumerate(text_chunks):
-            chunk_object = {
-                "id": str(uuid.uuid4()),
-                "parent_id": normalised_data.get("id"),  # Fixed: consistent variable name
+        occurrences = {}
+        for index, (start, end, content, first_page, last_page) in enumerate(spans):
+            occurrence = occurrences[content] = occurrences.get(content, -1) + 1
+            # Offsets into the normalised content, so later stages can slice it
+            chunk_metadata = {**metadata, "char_start": start, "char_end": end}
+            if first_page is not None:
+                chunk_metadata["page_start"] = first_page
+                chunk_metadata["page_end"] = last_page
+            yield {
+                "id": chunk_id(parent_id, content, occurrence),
+                "parent_id": parent_id,
                 "chunk_index": index,
-                "content": text_segment,
-                "metadata": normalised_data.get("metadata", {})  # Fixed: consistent variable name
-            } 
-            chunk_objects.append(chunk_object)
-            
-        return chunk_objects
\ No newline at end of file
+                "content": content,
+                "metadata": chunk_metadata
+            }
+
+    def process_chunks(self, normalised_data: Dict) -> List[Dict]:
+        return list(self.iter_chunks(normalised_data))
@@ -0,0 +1,173 @@
+import hashlib
+import threading
+import zlib
+import numpy as np
+from typing import List, Dict, Iterable, Set, Tuple
+from intrafact.config import DEDUP_THRESHOLD, DEDUP_NUM_PERM
+from intrafact.storage.metadata_store import MetadataStore
+
+def _choose_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """
+    Picks (bands, rows) with bands * rows == num_perm whose LSH threshold
+    (1 / bands) ** (1 / rows) is the highest one not above `threshold`, so
+    pairs at the threshold are very likely to share a bucket.
+    """
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    below = [(bands, rows) for bands, rows in options if (1 / bands) ** (1 / rows) <= threshold]
+    return max(below or options[:1], key=lambda option: (1 / option[0]) ** (1 / option[1]))
+
+class ChunkDeduplicator:
+    """
+    Near-duplicate chunk detection before embedding.
+
+    Each chunk gets a MinHash signature over its word shingles. Signatures
+    are split into LSH bands, and chunks sharing a band bucket with a stored
+    chunk are compared on their full signatures (the fraction of equal
+    values estimates Jaccard similarity). A chunk at or above `threshold`
+    becomes a duplicate of that canonical chunk: it is kept in the metadata
+    store with a reference instead of being embedded.
+
+    Signatures of canonical chunks are persisted in the metadata store once
+    their vectors are written (index()); chunks assigned earlier in the same
+    run are matched from memory until then, or until discard() when their
+    write failed.
+    """
+
+    def __init__(self, meta_store: MetadataStore, threshold: float = DEDUP_THRESHOLD,
+                 num_perm: int = DEDUP_NUM_PERM, shingle_size: int = 3):
+        self.meta_store = meta_store
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        self.bands, self.rows = _choose_bands(num_perm, threshold)
+
+        # Fixed seed: signatures are persisted and compared across runs
+        rng = np.random.default_rng(20240101)
+        self.a = rng.integers(1, 2 ** 63, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.integers(0, 2 ** 63, num_perm, dtype=np.uint64)
+
+        self.lock = threading.Lock()
+        self.pending_signatures = {}
+        self.pending_buckets = {}
+
+        self.checked = 0
+        self.duplicates = 0
+
+    def signature(self, text: str) -> np.ndarray:
+        words = text.lower().split()
+        size = self.shingle_size
+        shingles = {" ".join(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))}
+        hashes = np.fromiter((zlib.crc32(shingle.encode("utf-8")) for shingle in shingles),
+                             dtype=np.uint64, count=len(shingles))
+
+        # Multiply-shift hashing: one 32-bit permutation per row, overflow wraps mod 2^64
+        permuted = (self.a[:, None] * hashes[None, :] + self.b[:, None]) >> np.uint64(32)
+        return permuted.min(axis=1).astype(np.uint32)
+
+    def buckets(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        result = []
+        for band in range(self.bands):
+            digest = hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8)
+            result.append((band, int.from_bytes(digest.digest(), "little", signed=True)))
+        return result
+
+    def _find_canonical(self, chunk_id: str, signature: np.ndarray, buckets: List[Tuple[int, int]],
+                        exclude: Set[str]):
+        candidates = list(dict.fromkeys(
+            [c for key in buckets for c in self.pending_buckets.get(key, [])]
+            + self.meta_store.lsh_candidates(buckets)
+        ))
+        candidates = [candidate for candidate in candidates if candidate != chunk_id and candidate not in exclude]
+        if not candidates:
+            return None
+
+        stored = self.meta_store.get_signatures(
+            [candidate for candidate in candidates if candidate not in self.pending_signatures]
+        )
+        best, best_similarity = None, self.threshold
+        for candidate in candidates:
+            other = self.pending_signatures.get(candidate)
+            if other is None:
+                if candidate not in stored:
+                    continue
+                other = np.frombuffer(stored[candidate], dtype=np.uint32)
+            if len(other) != len(signature):
+                continue
+
+            similarity = float(np.mean(other == signature))
+            if similarity >= best_similarity:
+                best, best_similarity = candidate, similarity
+        return best
+
+    def assign(self, chunks: List[Dict], exclude: Iterable[str] = ()) -> Tuple[List[Dict], List[Dict]]:
+        """
+        Splits chunks into (unique, duplicates). Duplicates get a
+        "canonical_id"; unique chunks are remembered as canonical for the
+        rest of the run. Chunks in `exclude` (e.g. the ones the same update
+        deletes) are never chosen as canonical.
+        """
+        exclude = set(exclude)
+        unique, duplicates = [], []
+        with self.lock:
+            for chunk in chunks:
+                signature = self.signature(chunk["content"])
+                buckets = self.buckets(signature)
+                canonical_id = self._find_canonical(chunk["id"], signature, buckets, exclude)
+
+                self.checked += 1
+                if canonical_id is not None:
+                    chunk["canonical_id"] = canonical_id
+                    duplicates.append(chunk)
+                    self.duplicates += 1
+                    continue
+
+                chunk.pop("canonical_id", None)
+                unique.append(chunk)
+                self.pending_signatures[chunk["id"]] = signature
+                for key in buckets:
+                    self.pending_buckets.setdefault(key, []).append(chunk["id"])
+
+        return unique, duplicates
+
+    def index(self, chunks: List[Dict]):
+        """
+        Persists the signatures of canonical chunks whose vectors were written.
+        """
+        entries = []
+        with self.lock:
+            for chunk in chunks:
+                signature, buckets = self._forget(chunk)
+                entries.append((chunk["id"], signature.tobytes(), buckets))
+
+        if entries:
+            self.meta_store.add_signatures(entries)
+
+    def discard(self, chunks: List[Dict]):
+        """
+        Forgets assigned canonical chunks whose vectors were never written,
+        so no later chunk is matched to them.
+        """
+        with self.lock:
+            for chunk in chunks:
+                self._forget(chunk)
+
+    def _forget(self, chunk: Dict) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        # Call with the lock held
+        signature = self.pending_signatures.pop(chunk["id"], None)
+        if signature is None:
+            signature = self.signature(chunk["content"])
+        buckets = self.buckets(signature)
+        for key in buckets:
+            members = self.pending_buckets.get(key)
+            if members and chunk["id"] in members:
+                members.remove(chunk["id"])
+                if not members:
+                    del self.pending_buckets[key]
+        return signature, buckets
+
+    def stats(self) -> Dict:
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "dedup_ratio": self.duplicates / self.checked if self.checked else 0.0
+        }
@@ -1,10 +1,133 @@
-from sentence_transformers import SentenceTransformer
-from typing import List, Dict
+import logging
+import threading
+import numpy as np
+from typing import List, Dict, Optional
+from intrafact.config import EMBEDDING_SERVER, EMBEDDING_BACKEND, EMBEDDING_THREADS
+from intrafact.processing.embedding_backends import load_sentence_transformer
+from intrafact.processing.embedding_cache import EmbeddingCache
+from intrafact.processing.embedding_server import EmbeddingClient
+from intrafact.registry import timed
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
 
 class TextEmbedder:
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
-        print(f"......Loading embedding model: {model_name} ....")
-        self.model = SentenceTransformer(model_name)
+    """
+    SentenceTransformer wrapper with a persistent embedding cache.
+
+    The model (and sentence_transformers itself) is loaded on first use, so
+    creating an embedder is free when nothing needs encoding. One instance
+    can be shared across threads: model calls are serialised.
+
+    When a local embedding server is running (and use_server is set), encode
+    calls go to it and only the tokenizer is loaded here; if the server goes
+    away, encoding falls back to an in-process model.
+
+    `backend` selects the inference runtime (see embedding_backends); every
+    backend keeps the model's output dimension, so collections stay usable.
+    """
+
+    def __init__(self, model_name: str = "all-MiniLM-L6-v2", use_cache: bool = True,
+                 use_server: bool = EMBEDDING_SERVER != "off", backend: str = EMBEDDING_BACKEND,
+                 num_threads: int = EMBEDDING_THREADS):
+        self.model_name = model_name
+        self.backend = backend
+        self.num_threads = num_threads
+        self.use_cache = use_cache
+        self.lock = threading.RLock()
+        self._model = None
+        self._cache = None
+        self._tokenizer = None
+        self.client = EmbeddingClient() if use_server else None
+
+    def _server(self) -> Optional[EmbeddingClient]:
+        if self.client is None or not self.client.available():
+            return None
+        info = self.client.info()
+        if info["model_name"] != self.model_name or info.get("backend", "torch") != self.backend:
+            return None
+        return self.client
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self.lock:
+                if self._model is None:
+                    logger.info(f"......Loading embedding model: {self.model_name} ({self.backend}) ....")
+                    with timed("embedding_model"):
+                        self._model = load_sentence_transformer(self.model_name, self.backend, self.num_threads)
+        return self._model
+
+    @property
+    def cache(self):
+        if self._cache is None and self.use_cache:
+            with self.lock:
+                if self._cache is None:
+                    # Backends differ slightly in their output, so each keeps its own cache
+                    cache_name = self.model_name if self.backend == "torch" else f"{self.model_name}@{self.backend}"
+                    self._cache = EmbeddingCache(cache_name, self.model.get_sentence_embedding_dimension())
+        return self._cache
+
+    @property
+    def tokenizer(self):
+        # Shared with the model: callers on other threads should use a copy
+        if self._model is not None:
+            return self._model.tokenizer
+
+        if self._tokenizer is None:
+            server = self._server()
+            if server is None:
+                return self.model.tokenizer
+            with self.lock, timed("tokenizer"):
+                from transformers import AutoTokenizer
+                self._tokenizer = AutoTokenizer.from_pretrained(server.info()["tokenizer"])
+        return self._tokenizer
+
+    @property
+    def max_tokens(self) -> int:
+        # max_seq_length also counts the [CLS] and [SEP] special tokens
+        server = self._server() if self._model is None else None
+        if server is not None:
+            return server.info()["max_seq_length"] - 2
+        return self.model.max_seq_length - 2
+
+    def _encode_model(self, texts, batch_size: int = 32) -> np.ndarray:
+        with self.lock:
+            return self.model.encode(texts, batch_size=batch_size, convert_to_numpy=True)
+
+    def encode(self, texts: List[str], batch_size: int = 32, use_cache: bool = True) -> np.ndarray:
+        """
+        Encodes texts into a float32 array, sending only cache misses to the
+        model. use_cache=False skips the cache (e.g. for one-off queries).
+        """
+        with telemetry.span("encode", texts=len(texts), batch_size=batch_size) as encode_span:
+            return self._encode(texts, batch_size, use_cache, encode_span)
+
+    def _encode(self, texts: List[str], batch_size: int, use_cache: bool, encode_span) -> np.ndarray:
+        server = self._server()
+        if server is not None:
+            try:
+                # The server applies its own cache and batches with other clients
+                encode_span.set(source="server")
+                return server.encode(texts, use_cache=use_cache and self.use_cache)
+            except (ConnectionError, OSError, RuntimeError) as e:
+                logger.warning(f"   ⚠️ Embedding server unavailable ({e}), encoding in-process")
+
+        encode_span.set(source="model")
+        if not use_cache or self.cache is None:
+            return self._encode_model(texts, batch_size)
+
+        embeddings, missing = self.cache.get_many(texts)
+        encode_span.set(cache_hits=len(texts) - len(missing), cache_misses=len(missing))
+        if missing:
+            # Repeated boilerplate within one batch is only encoded once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            fresh = self._encode_model(unique_texts, batch_size)
+            position = {text: row for row, text in enumerate(unique_texts)}
+            embeddings[missing] = fresh[[position[texts[i]] for i in missing]]
+            self.cache.put_many(unique_texts, fresh)
+
+        return embeddings
 
     def embed_chunks(self, chunks: List[Dict]) -> List[Dict]:
         if not chunks:
@@ -12,11 +135,14 @@ class TextEmbedder:
         
         texts = [chunk["content"] for chunk in chunks]
 
-        print(f"....Embedding {len(texts)} chunks....")
-        embeddings = self.model.encode(texts) # converted to numpy array, also giving batch for chunks not individual texts
+        logger.info(f"....Embedding {len(texts)} chunks....")
+        embeddings = self.encode(texts) # numpy array, one batch for all chunks not individual texts
+
+        if self._cache is not None:
+            stats = self._cache.stats()
+            logger.info(f"....Embedding cache: {stats['hits']} hits / {stats['misses']} misses....")
 
         for i,chunk in enumerate(chunks):
             chunk["embedding"] = embeddings[i].tolist() # converted to list
 
         return chunks
-
@@ -0,0 +1,125 @@
+import logging
+import platform
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional
+from intrafact.config import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+ONNX_MODEL_DIR = DATA_DIR/"onnx_models"
+
+def quantization_config() -> str:
+    """
+    The dynamic int8 quantization preset matching this CPU.
+    """
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "arm64"
+    try:
+        with open("/proc/cpuinfo") as f:
+            flags = f.read()
+    except OSError:
+        flags = ""
+    if "avx512_vnni" in flags:
+        return "avx512_vnni"
+    if "avx512" in flags:
+        return "avx512"
+    return "avx2"
+
+def _onnx_kwargs(num_threads: int, file_name: Optional[str] = None) -> Dict:
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    if num_threads:
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+    kwargs = {"provider": "CPUExecutionProvider", "session_options": options}
+    if file_name:
+        kwargs["file_name"] = file_name
+    return kwargs
+
+def _quantized_model_dir(model_name: str, num_threads: int) -> Path:
+    """
+    Exports an int8 dynamically quantized ONNX copy of the model once, under
+    ONNX_MODEL_DIR, and returns its directory.
+    """
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    config = quantization_config()
+    model_dir = ONNX_MODEL_DIR / f"{model_name.replace('/', '__')}-qint8_{config}"
+    if not (model_dir / "onnx" / f"model_qint8_{config}.onnx").exists():
+        logger.info(f"......Exporting int8 ONNX model ({config}) to {model_dir} ....")
+        model = SentenceTransformer(model_name, backend="onnx", model_kwargs=_onnx_kwargs(num_threads))
+        model.save(str(model_dir))
+        export_dynamic_quantized_onnx_model(model, config, str(model_dir), push_to_hub=False)
+    return model_dir
+
+def load_sentence_transformer(model_name: str, backend: str = "torch", num_threads: int = 0):
+    """
+    Loads a SentenceTransformer with the given inference backend:
+    "torch" (reference float32), "onnx" (ONNX Runtime, float32) or
+    "onnx-int8" (ONNX Runtime with dynamically quantized int8 weights).
+    All backends produce embeddings of the same dimension.
+    num_threads caps intra-op CPU threads (0 keeps the library default).
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend: {backend} (expected one of {', '.join(BACKENDS)})")
+
+    from sentence_transformers import SentenceTransformer
+
+    if backend == "torch":
+        if num_threads:
+            import torch
+            torch.set_num_threads(num_threads)
+        return SentenceTransformer(model_name)
+
+    try:
+        import onnxruntime  # noqa: F401
+        import optimum  # noqa: F401
+    except ImportError as e:
+        raise ImportError(
+            f"The {backend} embedding backend needs ONNX Runtime support: pip install 'intrafact-ai[onnx]'"
+        ) from e
+
+    if backend == "onnx":
+        return SentenceTransformer(model_name, backend="onnx", model_kwargs=_onnx_kwargs(num_threads))
+
+    model_dir = _quantized_model_dir(model_name, num_threads)
+    file_name = f"onnx/model_qint8_{quantization_config()}.onnx"
+    return SentenceTransformer(str(model_dir), backend="onnx", model_kwargs=_onnx_kwargs(num_threads, file_name))
+
+def compare_backends(model_name: str, backend: str, texts: List[str], reference: str = "torch",
+                     num_threads: int = 0, batch_size: int = 32) -> Dict:
+    """
+    Encodes `texts` with both backends and reports the cosine agreement of
+    the embeddings (the accuracy given up) next to each backend's throughput.
+    """
+    results = {}
+    embeddings = {}
+    for name in (reference, backend):
+        model = load_sentence_transformer(model_name, name, num_threads)
+        model.encode(texts[:batch_size], batch_size=batch_size)  # warm-up
+
+        started = time.perf_counter()
+        embeddings[name] = np.asarray(model.encode(texts, batch_size=batch_size, convert_to_numpy=True),
+                                      dtype=np.float32)
+        elapsed = time.perf_counter() - started
+        results[name] = {"dim": int(embeddings[name].shape[1]), "texts_per_sec": len(texts) / elapsed}
+
+    a, b = embeddings[reference], embeddings[backend]
+    if a.shape != b.shape:
+        raise ValueError(f"{backend} produces {b.shape[1]}-dim embeddings, {reference} {a.shape[1]}-dim")
+
+    cosine = np.sum(a * b, axis=1) / np.maximum(np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1), 1e-12)
+    return {
+        "model": model_name,
+        "texts": len(texts),
+        "reference": {"backend": reference, **results[reference]},
+        "candidate": {"backend": backend, **results[backend]},
+        "speedup": results[backend]["texts_per_sec"] / results[reference]["texts_per_sec"],
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "cosine_p01": float(np.percentile(cosine, 1))
+    }
@@ -0,0 +1,238 @@
+import contextlib
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Tuple
+from intrafact.config import EMBEDDING_CACHE_DIR, EMBEDDING_CACHE_MAX_ENTRIES, EMBEDDING_CACHE_TOUCH_INTERVAL
+
+# SQLite's default limit on bound parameters is 999 on older builds
+_SQL_BATCH = 500
+# Bytes of a sha256 key, stored next to each row
+_KEY_BYTES = 32
+
+class EmbeddingCache:
+    """
+    Persistent, content-addressed cache of embeddings for one model.
+
+    Vectors are stored as float32 rows in a fixed-capacity memory-mapped file;
+    a SQLite index maps sha256(model name + normalized text) to a row slot and
+    tracks last use, so the least recently used entries are evicted once the
+    cache reaches `max_entries`.
+
+    Several processes (the embedding server, the watch daemon, CLI commands)
+    may share a cache. Inserts run in an immediate SQLite transaction, so
+    slot allocation and row writes are serialised across processes. Lookups
+    take no write lock: each row's key is stored next to it and checked after
+    the row is read, so a row being replaced is a miss, never a wrong vector.
+    Hits are remembered and written to the LRU order in one batch, at most
+    every `touch_interval` seconds (and before any eviction).
+    """
+
+    def __init__(self, model_name: str, dim: int, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES,
+                 cache_dir: Path = EMBEDDING_CACHE_DIR, touch_interval: float = EMBEDDING_CACHE_TOUCH_INTERVAL):
+        self.model_name = model_name
+        self.dim = dim
+        self.capacity = max_entries
+        self.touch_interval = touch_interval
+        # key -> last hit time, not yet written to the index
+        self.touched: Dict[str, float] = {}
+        self.touched_at = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        base_name = f"{re.sub(r'[^A-Za-z0-9_.-]', '_', model_name)}-{dim}"
+
+        self.conn = sqlite3.connect(str(cache_dir / f"{base_name}.db"), check_same_thread=False, timeout=30)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                slot INTEGER UNIQUE,
+                last_used REAL
+            )
+        """)
+        self.conn.commit()
+
+        with self._transaction():
+            self.vectors = self._open_vectors(cache_dir / f"{base_name}.f32")
+            self.row_keys = self._open_row_keys(cache_dir / f"{base_name}.keys")
+
+    def _open_vectors(self, path: Path) -> np.memmap:
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        expected_size = self.capacity * row_bytes
+
+        if not path.exists():
+            # Sparse on most filesystems: disk is only used as rows get written
+            with open(path, "wb") as f:
+                f.truncate(expected_size)
+        elif path.stat().st_size != expected_size:
+            # max_entries changed since the file was created: drop slots that no longer fit
+            self.conn.execute("DELETE FROM entries WHERE slot >= ?", (self.capacity,))
+            os.truncate(path, expected_size)
+
+        return np.memmap(path, dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+
+    def _open_row_keys(self, path: Path) -> np.memmap:
+        expected_size = self.capacity * _KEY_BYTES
+        if path.exists() and path.stat().st_size == expected_size:
+            return np.memmap(path, dtype=np.uint8, mode="r+", shape=(self.capacity, _KEY_BYTES))
+
+        # New, or made by an older version or another max_entries: rebuilt from the index
+        with open(path, "wb") as f:
+            f.truncate(expected_size)
+        row_keys = np.memmap(path, dtype=np.uint8, mode="r+", shape=(self.capacity, _KEY_BYTES))
+        for key, slot in self.conn.execute("SELECT key, slot FROM entries"):
+            row_keys[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+        row_keys.flush()
+        return row_keys
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        # Takes SQLite's write lock up front: other processes wait here
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+    def _key(self, text: str) -> str:
+        # Whitespace-only differences do not change the embedding meaningfully
+        normalized = " ".join(text.split())
+        return hashlib.sha256(f"{self.model_name}\0{normalized}".encode("utf-8")).hexdigest()
+
+    def _lookup(self, keys: List[str]) -> Dict[str, int]:
+        found = {}
+        for i in range(0, len(keys), _SQL_BATCH):
+            batch = keys[i:i + _SQL_BATCH]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.conn.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", batch
+            ).fetchall()
+            found.update(rows)
+        return found
+
+    def get_many(self, texts: List[str]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Returns (embeddings, missing) where embeddings has one row per text
+        and `missing` lists the indices whose rows still need encoding.
+        """
+        keys = [self._key(text) for text in texts]
+        embeddings = np.zeros((len(texts), self.dim), dtype=np.float32)
+
+        with self.lock:
+            found = self._lookup(list(set(keys)))
+
+        hit_rows, hit_slots, hit_keys = [], [], []
+        for i, key in enumerate(keys):
+            slot = found.get(key)
+            if slot is not None:
+                hit_rows.append(i)
+                hit_slots.append(slot)
+                hit_keys.append(key)
+
+        if hit_rows:
+            embeddings[hit_rows] = self.vectors[hit_slots]
+            # Read after the rows: a slot rewritten meanwhile no longer holds its key
+            expected = np.frombuffer(b"".join(bytes.fromhex(key) for key in hit_keys), dtype=np.uint8)
+            valid = (self.row_keys[hit_slots] == expected.reshape(-1, _KEY_BYTES)).all(axis=1)
+            hit_rows = [row for row, ok in zip(hit_rows, valid) if ok]
+            hit_keys = [key for key, ok in zip(hit_keys, valid) if ok]
+
+        hits = set(hit_rows)
+        missing = [i for i in range(len(texts)) if i not in hits]
+        embeddings[missing] = 0.0
+
+        with self.lock:
+            self.hits += len(hit_rows)
+            self.misses += len(missing)
+            now = time.time()
+            self.touched.update((key, now) for key in hit_keys)
+            due = time.monotonic() - self.touched_at >= self.touch_interval
+        if due:
+            with self._transaction():
+                self._write_touched()
+
+        return embeddings, missing
+
+    def _write_touched(self):
+        # Call inside _transaction()
+        if self.touched:
+            self.conn.executemany(
+                "UPDATE entries SET last_used = MAX(last_used, ?) WHERE key = ?",
+                [(used, key) for key, used in self.touched.items()]
+            )
+            self.touched.clear()
+        self.touched_at = time.monotonic()
+
+    def put_many(self, texts: List[str], embeddings: np.ndarray):
+        new_entries = {}
+        for text, vector in zip(texts, embeddings):
+            new_entries.setdefault(self._key(text), vector)
+
+        with self._transaction():
+            # Eviction must see the recent hits
+            self._write_touched()
+
+            # Another process may have stored some of them meanwhile
+            for key in self._lookup(list(new_entries)):
+                new_entries.pop(key)
+
+            # Never try to hold more than the cache can store
+            items = list(new_entries.items())[:self.capacity]
+            if not items:
+                return
+
+            # Slots are filled in order and only reused after eviction, so the
+            # used ones are exactly 0..used-1
+            used = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            free = min(self.capacity - used, len(items))
+            slots = list(range(used, used + free))
+
+            if len(items) > free:
+                # Evict the least recently used entries and reuse their slots
+                victims = self.conn.execute(
+                    "SELECT key, slot FROM entries ORDER BY last_used LIMIT ?",
+                    (len(items) - free,)
+                ).fetchall()
+                self.conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key, _ in victims])
+                slots.extend(slot for _, slot in victims)
+                self.evictions += len(victims)
+
+            # The key goes last: readers of a half-written row see a mismatch
+            self.row_keys[slots] = 0
+            self.vectors[slots] = np.asarray([vector for _, vector in items], dtype=np.float32)
+            self.row_keys[slots] = np.frombuffer(
+                b"".join(bytes.fromhex(key) for key, _ in items), dtype=np.uint8
+            ).reshape(-1, _KEY_BYTES)
+            self.vectors.flush()
+            self.row_keys.flush()
+
+            now = time.time()
+            self.conn.executemany(
+                "INSERT INTO entries (key, slot, last_used) VALUES (?, ?, ?)",
+                [(key, slot, now) for (key, _), slot in zip(items, slots)]
+            )
+
+    def stats(self) -> Dict:
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "capacity": self.capacity
+        }
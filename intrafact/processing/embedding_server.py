@@ -0,0 +1,308 @@
+import json
+import logging
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from intrafact.config import (EMBEDDING_SOCKET_PATH, EMBEDDING_SERVER_MAX_BATCH, EMBEDDING_SERVER_MAX_WAIT,
+                              METRICS_PATH)
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Frame: header length, payload length, JSON header, raw payload bytes
+_FRAME = struct.Struct("!II")
+
+def _recv_exactly(sock: socket.socket, size: int) -> bytes:
+    data = bytearray()
+    while len(data) < size:
+        block = sock.recv(size - len(data))
+        if not block:
+            raise ConnectionError("connection closed")
+        data.extend(block)
+    return bytes(data)
+
+def send_message(sock: socket.socket, header: Dict, payload: bytes = b""):
+    encoded = json.dumps(header).encode("utf-8")
+    sock.sendall(_FRAME.pack(len(encoded), len(payload)) + encoded + payload)
+
+def recv_message(sock: socket.socket) -> Tuple[Dict, bytes]:
+    header_size, payload_size = _FRAME.unpack(_recv_exactly(sock, _FRAME.size))
+    header = json.loads(_recv_exactly(sock, header_size))
+    return header, _recv_exactly(sock, payload_size) if payload_size else b""
+
+
+class _Request:
+    def __init__(self, texts: List[str], use_cache: bool):
+        self.texts = texts
+        self.use_cache = use_cache
+        self.enqueued = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Merges concurrent encode requests into one model call. A batch is sent
+    once it holds `max_batch` texts or `max_wait` seconds after its first
+    request arrived, whichever comes first.
+    """
+
+    def __init__(self, embedder, max_batch: int = EMBEDDING_SERVER_MAX_BATCH,
+                 max_wait: float = EMBEDDING_SERVER_MAX_WAIT):
+        self.embedder = embedder
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = queue.Queue()
+        self.stats_lock = threading.Lock()
+
+        self.request_count = 0
+        self.text_count = 0
+        self.batch_count = 0
+        self.batch_sizes = {}
+        self.queue_latencies = deque(maxlen=4096)
+
+        self.thread = threading.Thread(target=self._loop, name="intrafact-embed-batcher", daemon=True)
+        self.thread.start()
+
+    def submit(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        request = _Request(texts, use_cache)
+        self.requests.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _next_batch(self) -> List[_Request]:
+        batch = [self.requests.get()]
+        size = len(batch[0].texts)
+        deadline = batch[0].enqueued + self.max_wait
+
+        while size < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                request = self.requests.get(timeout=remaining)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+
+            for use_cache in (True, False):
+                group = [request for request in batch if request.use_cache == use_cache]
+                if not group:
+                    continue
+                texts = [text for request in group for text in request.texts]
+                try:
+                    embeddings = self.embedder.encode(texts, batch_size=self.max_batch, use_cache=use_cache)
+                    offset = 0
+                    for request in group:
+                        request.result = embeddings[offset:offset + len(request.texts)]
+                        offset += len(request.texts)
+                except Exception as e:
+                    for request in group:
+                        request.error = e
+
+            texts_in_batch = sum(len(request.texts) for request in batch)
+            with self.stats_lock:
+                self.request_count += len(batch)
+                self.text_count += texts_in_batch
+                self.batch_count += 1
+                # Power-of-two histogram buckets: 1, 2, 4, 8, ...
+                bucket = 1 << max(texts_in_batch - 1, 0).bit_length()
+                self.batch_sizes[bucket] = self.batch_sizes.get(bucket, 0) + 1
+                self.queue_latencies.extend(started - request.enqueued for request in batch)
+
+            for request in batch:
+                request.done.set()
+
+    def stats(self) -> Dict:
+        with self.stats_lock:
+            latencies = np.array(self.queue_latencies) * 1000 if self.queue_latencies else np.zeros(1)
+            return {
+                "requests": self.request_count,
+                "texts": self.text_count,
+                "batches": self.batch_count,
+                "mean_batch_size": self.text_count / self.batch_count if self.batch_count else 0.0,
+                "batch_size_histogram": {f"<={size}": count for size, count in sorted(self.batch_sizes.items())},
+                "queue_latency_ms": {
+                    "p50": float(np.percentile(latencies, 50)),
+                    "p95": float(np.percentile(latencies, 95)),
+                    "max": float(latencies.max())
+                }
+            }
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                header, _ = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                op = header.get("op")
+                if op == "encode":
+                    embeddings = np.ascontiguousarray(
+                        server.batcher.submit(header["texts"], header.get("use_cache", True)), dtype=np.float32
+                    )
+                    send_message(self.request, {"shape": list(embeddings.shape)}, embeddings.tobytes())
+                elif op == "info":
+                    send_message(self.request, server.info)
+                elif op == "stats":
+                    send_message(self.request, server.batcher.stats())
+                else:
+                    send_message(self.request, {"error": f"unknown op: {op}"})
+            except Exception as e:
+                send_message(self.request, {"error": str(e)})
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Owns one embedding model for every Intrafact process on the machine and
+    serves it over a Unix domain socket, micro-batching concurrent requests.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, embedder, socket_path: Path = EMBEDDING_SOCKET_PATH,
+                 max_batch: int = EMBEDDING_SERVER_MAX_BATCH, max_wait: float = EMBEDDING_SERVER_MAX_WAIT):
+        self.socket_path = Path(socket_path)
+        if self.socket_path.exists():
+            # A stale socket from a crashed server; a live one would still answer
+            if EmbeddingClient(self.socket_path).available():
+                raise RuntimeError(f"An embedding server is already running on {self.socket_path}")
+            self.socket_path.unlink()
+
+        model = embedder.model
+        self.info = {
+            "model_name": embedder.model_name,
+            "backend": embedder.backend,
+            "dim": model.get_sentence_embedding_dimension(),
+            "max_seq_length": model.max_seq_length,
+            "tokenizer": model.tokenizer.name_or_path
+        }
+        self.batcher = MicroBatcher(embedder, max_batch, max_wait)
+        super().__init__(str(self.socket_path), _Handler)
+
+    def server_close(self):
+        super().server_close()
+        if self.socket_path.exists():
+            self.socket_path.unlink()
+
+
+class EmbeddingClient:
+    """
+    Client of a running EmbeddingServer. One connection per thread; after a
+    failed connection the server is considered down for `retry_after` seconds.
+    """
+
+    def __init__(self, socket_path: Path = EMBEDDING_SOCKET_PATH, retry_after: float = 5.0):
+        self.socket_path = Path(socket_path)
+        self.retry_after = retry_after
+        self.local = threading.local()
+        self.down_until = 0.0
+        self._info = None
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self.local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(str(self.socket_path))
+            except OSError:
+                sock.close()
+                raise
+            self.local.sock = sock
+        return sock
+
+    def mark_down(self):
+        self.down_until = time.monotonic() + self.retry_after
+        self._info = None
+        sock = getattr(self.local, "sock", None)
+        if sock is not None:
+            sock.close()
+            self.local.sock = None
+
+    def request(self, header: Dict, payload: bytes = b"") -> Tuple[Dict, bytes]:
+        sock = self._connection()
+        try:
+            send_message(sock, header, payload)
+            reply, reply_payload = recv_message(sock)
+        except (ConnectionError, OSError):
+            self.mark_down()
+            raise
+        if "error" in reply:
+            raise RuntimeError(f"Embedding server error: {reply['error']}")
+        return reply, reply_payload
+
+    def available(self) -> bool:
+        if time.monotonic() < self.down_until or not os.path.exists(self.socket_path):
+            return False
+        try:
+            self.info()
+            return True
+        except (ConnectionError, OSError, RuntimeError):
+            self.mark_down()
+            return False
+
+    def info(self) -> Dict:
+        if self._info is None:
+            self._info, _ = self.request({"op": "info"})
+        return self._info
+
+    def stats(self) -> Dict:
+        return self.request({"op": "stats"})[0]
+
+    def encode(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        reply, payload = self.request({"op": "encode", "texts": list(texts), "use_cache": use_cache})
+        return np.frombuffer(payload, dtype=np.float32).reshape(reply["shape"]).copy()
+
+
+def serve(socket_path: Path = EMBEDDING_SOCKET_PATH, embedder=None, stats_interval: Optional[float] = 60.0):
+    """
+    Runs an embedding server in the foreground until interrupted.
+    """
+    from intrafact.processing.embedder import TextEmbedder
+
+    # The server's own embedder must never call back into a server
+    server = EmbeddingServer(embedder or TextEmbedder(use_server=False), socket_path)
+    thread = threading.Thread(target=server.serve_forever, name="intrafact-embed-server", daemon=True)
+    thread.start()
+    logger.info(f"🧮 Embedding server listening on {server.socket_path}")
+
+    try:
+        while True:
+            time.sleep(stats_interval or 3600)
+            if stats_interval:
+                stats = server.batcher.stats()
+                logger.info(f"   {stats['requests']} requests, {stats['batches']} batches, "
+                            f"mean batch {stats['mean_batch_size']:.1f}, "
+                            f"queue p95 {stats['queue_latency_ms']['p95']:.1f} ms")
+                if METRICS_PATH:
+                    telemetry.write_metrics(METRICS_PATH)
+    except KeyboardInterrupt:
+        logger.info("Stopping embedding server")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,213 @@
+import logging
+from pathlib import Path
+from typing import List, Dict, Optional
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
+
+class DocumentUpdate:
+    """
+    Chunk-level difference between the stored and the new version of a document.
+    Only `added` chunks need embedding; `duplicates` are new chunks that share
+    the vector of a near-identical canonical chunk.
+    """
+
+    def __init__(self, doc_id: str, metadata: Dict, chunks: List[Dict], added: List[Dict],
+                 kept: List[Dict], removed_ids: List[str], stale_doc_ids: List[str],
+                 duplicates: Optional[List[Dict]] = None):
+        self.doc_id = doc_id
+        self.metadata = metadata
+        self.chunks = chunks
+        self.added = added
+        self.kept = kept
+        self.removed_ids = removed_ids
+        self.stale_doc_ids = stale_doc_ids
+        self.duplicates = duplicates or []
+
+    @property
+    def file_name(self) -> str:
+        return self.metadata["file_name"]
+
+
+class IncrementalIndexer:
+    """
+    Keeps the vector store and metadata store in step with the raw files.
+
+    Documents are keyed by their source path and chunks by a hash of their
+    content, so re-ingesting a changed file embeds only the chunks that did
+    not exist before, deletes the ones that disappeared and rewrites the
+    metadata of the rest. Documents of deleted files are removed entirely.
+
+    With a ChunkDeduplicator, new chunks that nearly match a stored chunk are
+    recorded as references to it instead of being embedded. When a canonical
+    chunk is deleted, the chunks referencing it are re-embedded with
+    `embedder` (if given). Deleted documents are also dropped from
+    `processed_store` (a ProcessedStore), if given.
+    """
+
+    def __init__(self, meta_store: MetadataStore, vector_db, embedder=None, deduplicator=None,
+                 processed_store=None):
+        self.meta_store = meta_store
+        self.vector_db = vector_db
+        self.embedder = embedder
+        self.deduplicator = deduplicator
+        self.processed_store = processed_store
+
+    def plan(self, doc_id: str, metadata: Dict, chunks: List[Dict]) -> DocumentUpdate:
+        """
+        Diffs `chunks` against the stored version of the document. A file
+        with no chunks (e.g. edited down to nothing) has its documents removed.
+        """
+        if not chunks:
+            return DocumentUpdate(doc_id, metadata, [], added=[], kept=[], removed_ids=[],
+                                  stale_doc_ids=self.meta_store.documents_for_path(metadata["file_path"]))
+
+        existing = self.meta_store.chunk_canonical_ids(doc_id)
+        new_ids = {chunk["id"] for chunk in chunks}
+
+        # Earlier versions stored under another ID (e.g. random IDs from before
+        # documents were keyed by path) are replaced wholesale
+        stale_doc_ids = [other for other in self.meta_store.documents_for_path(metadata["file_path"])
+                         if other != doc_id]
+
+        added, kept = [], []
+        for chunk in chunks:
+            if chunk["id"] in existing:
+                if existing[chunk["id"]] is not None:
+                    chunk["canonical_id"] = existing[chunk["id"]]
+                kept.append(chunk)
+            else:
+                added.append(chunk)
+
+        duplicates = []
+        if self.deduplicator is not None and added:
+            # Chunks this update replaces are about to be deleted: never reference them
+            replaced = set(existing).union(*(self.meta_store.chunk_ids(other) for other in stale_doc_ids))
+            with telemetry.span("dedup", chunks=len(added)) as dedup_span:
+                added, duplicates = self.deduplicator.assign(added, exclude=replaced)
+                dedup_span.set(duplicates=len(duplicates))
+
+        return DocumentUpdate(
+            doc_id,
+            metadata,
+            chunks,
+            added=added,
+            kept=kept,
+            removed_ids=sorted(set(existing) - new_ids),
+            stale_doc_ids=stale_doc_ids,
+            duplicates=duplicates
+        )
+
+    def apply(self, updates: List[DocumentUpdate], embeddings=None):
+        """
+        Writes a batch of updates. `embeddings` are for the added chunks of all
+        updates, in order; when omitted they are read from each chunk's
+        "embedding" key.
+        """
+        added = [chunk for update in updates for chunk in update.added]
+        # Duplicates have no vector of their own to update
+        kept = [chunk for update in updates for chunk in update.kept if chunk.get("canonical_id") is None]
+        removed_ids = [chunk_id for update in updates for chunk_id in update.removed_ids]
+        stale_doc_ids = [doc_id for update in updates for doc_id in update.stale_doc_ids]
+
+        if added:
+            self.vector_db.add_chunks(added, embeddings=embeddings)
+        self._embed_orphans([chunk for update in updates for chunk in update.duplicates],
+                            {chunk["id"] for chunk in added})
+        self.vector_db.update_chunk_metadata(kept)
+        self.meta_store.register_documents([
+            (update.doc_id, update.file_name, update.metadata, update.chunks) for update in updates if update.chunks
+        ])
+
+        self._delete(removed_ids, stale_doc_ids)
+
+        if self.deduplicator is not None:
+            self.deduplicator.index(added)
+        self.meta_store.record_files([update.metadata for update in updates])
+
+        for update in updates:
+            if not update.chunks and update.stale_doc_ids:
+                logger.info(f"   🗑️ {update.file_name}: no text left, document removed")
+            elif update.kept or update.removed_ids or update.duplicates:
+                logger.info(f"   ♻️ {update.file_name}: {len(update.added)} new, "
+                            f"{len(update.duplicates)} duplicate, {len(update.kept)} unchanged, "
+                            f"{len(update.removed_ids)} removed chunks")
+
+    def _embed_orphans(self, duplicates: List[Dict], added_ids: set):
+        """
+        Gives duplicates their own vector when their canonical chunk was
+        never written (its batch failed to encode or store).
+        """
+        canonical_ids = {chunk["canonical_id"] for chunk in duplicates} - added_ids
+        if not canonical_ids:
+            return
+        missing = canonical_ids - self.meta_store.stored_vector_ids(sorted(canonical_ids))
+        orphans = [chunk for chunk in duplicates if chunk["canonical_id"] in missing]
+        if not orphans:
+            return
+        if self.embedder is None:
+            logger.warning(f"   ⚠️ {len(orphans)} duplicate chunks reference a chunk that was never stored")
+            return
+
+        logger.info(f"   ↳ Embedding {len(orphans)} chunks whose canonical copy was never stored")
+        for chunk in orphans:
+            del chunk["canonical_id"]
+        self.vector_db.add_chunks(orphans, embeddings=self.embedder.encode([c["content"] for c in orphans]))
+        if self.deduplicator is not None:
+            self.deduplicator.index(orphans)
+
+    def _delete(self, chunk_ids: List[str], doc_ids: List[str]):
+        """
+        Deletes chunks and whole documents from both stores. Chunks elsewhere
+        that referenced a deleted chunk's vector get their own.
+        """
+        doc_chunk_ids = [chunk_id for doc_id in doc_ids for chunk_id in self.meta_store.chunk_ids(doc_id)]
+        deleted = set(chunk_ids) | set(doc_chunk_ids)
+        released = [chunk for chunk in self.meta_store.release_duplicates(sorted(deleted))
+                    if chunk["id"] not in deleted and chunk["parent_id"] not in doc_ids]
+
+        self.vector_db.delete_chunks(chunk_ids)
+        for doc_id in doc_ids:
+            self.vector_db.delete_document(doc_id)
+        self.meta_store.delete_documents(doc_ids)
+        self.meta_store.delete_chunks(chunk_ids)
+        if self.processed_store is not None:
+            self.processed_store.delete(doc_ids)
+
+        if not released:
+            return
+        if self.embedder is None:
+            logger.warning(f"   ⚠️ {len(released)} duplicate chunks lost their canonical vector")
+            return
+
+        logger.info(f"   ↳ Re-embedding {len(released)} chunks whose canonical copy was removed")
+        self.vector_db.add_chunks(released, embeddings=self.embedder.encode([c["content"] for c in released]))
+        if self.deduplicator is not None:
+            self.deduplicator.index(released)
+
+    def remove_documents(self, doc_ids: List[str]) -> int:
+        """
+        Deletes whole documents from every store (e.g. after their vector
+        partition was dropped). Their files stay in the manifest, so they are
+        not ingested again until they change.
+        """
+        self._delete([], doc_ids)
+        return len(doc_ids)
+
+    def remove_missing_files(self, paths: Optional[List[str]] = None) -> int:
+        """
+        Deletes the documents of known files that no longer exist on disk
+        (or of the given paths) and returns how many files were removed.
+        """
+        if paths is None:
+            paths = [path for path in self.meta_store.load_manifest() if not Path(path).exists()]
+
+        for path in paths:
+            doc_ids = self.meta_store.documents_for_path(path)
+            if doc_ids:
+                self._delete([], doc_ids)
+                logger.info(f"   🗑️ Removed deleted file: {Path(path).name}")
+
+        self.meta_store.forget_files(paths)
+        return len(paths)
@@ -0,0 +1,328 @@
+import contextvars
+import logging
+import queue
+import threading
+import time
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Optional
+from intrafact.config import INGEST_ENCODE_BATCH_SIZE, INGEST_ENCODE_POOL_SIZE, INGEST_QUEUE_SIZE, DEDUP_ENABLED
+from intrafact.ingestion.file_ingestor import iter_ingest, iter_document_pages, document_id_for_path, load_document
+from intrafact.processing.chunker import TextChunker
+from intrafact.processing.deduplicator import ChunkDeduplicator
+from intrafact.processing.incremental import IncrementalIndexer
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a stage's input
+_DONE = object()
+
+class IngestPipeline:
+    """
+    Pipelined ingest: extract/normalize/chunk -> encode -> store.
+
+    The stages run concurrently and are connected by bounded queues, so
+    extraction, model inference and vector store writes overlap while memory
+    stays bounded. The encoder gathers chunks from many documents into one
+    pool before calling the model, and embeddings stay NumPy arrays all the
+    way to the vector store. Changed files are diffed against their stored
+    chunks and near-duplicate chunks are set aside, so only new, distinct
+    chunks reach the encoder.
+    """
+
+    def __init__(self, meta_store: MetadataStore, vector_db, normalizer, chunker: Optional[TextChunker], embedder,
+                 batch_size: int = INGEST_ENCODE_BATCH_SIZE,
+                 pool_size: int = INGEST_ENCODE_POOL_SIZE,
+                 queue_size: int = INGEST_QUEUE_SIZE,
+                 max_wait: float = 0.05,
+                 dedup: bool = DEDUP_ENABLED,
+                 processed_store=None):
+        self.meta_store = meta_store
+        self.vector_db = vector_db
+        self.normalizer = normalizer
+        # None: a TextChunker.for_embedder, built when the first document
+        # arrives so a run with nothing to ingest never loads the model
+        self._chunker = chunker
+        self.embedder = embedder
+        self.deduplicator = ChunkDeduplicator(meta_store) if dedup else None
+        # Normalized documents are saved here (if given), for reindex()
+        self.processed_store = processed_store
+        self.indexer = IncrementalIndexer(meta_store, vector_db, embedder, self.deduplicator, processed_store)
+
+        self.batch_size = batch_size
+        self.pool_size = max(pool_size, batch_size)
+        self.max_wait = max_wait
+
+        self.queue_size = queue_size
+
+    @property
+    def chunker(self) -> TextChunker:
+        if self._chunker is None:
+            self._chunker = TextChunker.for_embedder(self.embedder)
+        return self._chunker
+
+    def run(self, paths: Optional[List] = None) -> int:
+        """
+        Ingests every new or changed file (or only the given paths) and
+        returns the number of documents stored. Can be called repeatedly.
+        Documents of deleted files are removed: all of them on a full run,
+        those of the given paths that no longer exist otherwise.
+        """
+        with telemetry.span("ingest") as run_span:
+            if paths is None:
+                self.indexer.remove_missing_files()
+            else:
+                missing = [str(path) for path in paths if not Path(path).exists()]
+                if missing:
+                    self.indexer.remove_missing_files(missing)
+            return self._run_stages(run_span, lambda: self._source_stage(paths))
+
+    def reindex(self) -> int:
+        """
+        Re-chunks and re-embeds every document in the processed-object store
+        without reading the raw files, and returns the number of documents
+        stored. As with run(), only chunks missing from the stores are
+        embedded, so after changing the embedding model start from empty
+        vector and metadata stores.
+        """
+        if self.processed_store is None:
+            raise ValueError("reindex needs a processed_store")
+        with telemetry.span("reindex") as run_span:
+            self.backfill()
+            return self._run_stages(run_span, self._stored_source_stage)
+
+    def backfill(self) -> int:
+        """
+        Adds the documents of the metadata store that are missing from the
+        processed-object store (those ingested before it existed): from the
+        JSON objects earlier versions saved, else by extracting their file
+        again when it is unchanged. Returns the number added.
+        """
+        known = {doc_id: (file_path, file_hash) for doc_id, file_path, file_hash in self.meta_store.document_files()}
+
+        def document_id(knowledge_object: Dict) -> Optional[str]:
+            metadata = knowledge_object.get("metadata", {})
+            file_path = metadata.get("file_path")
+            doc_id = document_id_for_path(file_path) if file_path else knowledge_object.get("id")
+            # A copy of an older version of the file is left alone
+            return doc_id if known.get(doc_id, (None, None))[1] == metadata.get("file_hash") else None
+
+        added = self.processed_store.import_json_objects(document_id)
+
+        missing = [(doc_id, file_path, file_hash) for doc_id, (file_path, file_hash) in known.items()
+                   if not self.processed_store.contains(doc_id)]
+        for doc_id, file_path, file_hash in missing:
+            try:
+                if not file_path or not Path(file_path).exists():
+                    continue
+                data = load_document(Path(file_path))
+                if data is None or data["metadata"]["file_hash"] != file_hash:
+                    # Changed since: stored when it is next ingested
+                    continue
+                normalized_data = self.normalizer.normalize_pages(iter_document_pages(data), data["metadata"])
+                normalized_data["id"] = doc_id
+                for _ in self.processed_store.put(normalized_data)["pages"]:
+                    pass
+                added += 1
+            except Exception as e:
+                logger.error(f"❌ Error storing {file_path}: {e}")
+        self.processed_store.flush()
+
+        unstored = sum(1 for doc_id in known if not self.processed_store.contains(doc_id))
+        if unstored:
+            logger.warning(f"   ⚠️ {unstored} of {len(known)} documents are missing from the processed store; "
+                           f"they are not reindexed until their files are ingested again")
+        elif added:
+            logger.info(f"....Backfilled {added} documents into the processed store....")
+        return added
+
+    def _run_stages(self, run_span, source) -> int:
+        started = time.perf_counter()
+        self.encode_queue = queue.Queue(maxsize=self.queue_size)
+        self.store_queue = queue.Queue(maxsize=self.queue_size)
+        self.seen_count = 0
+        self.processed_count = 0
+        self.chunk_count = 0
+        # First exception that stopped the encode or store stage
+        self.stage_error = None
+
+        # Stage threads run in a copy of this context, so their spans belong to this run
+        encoder = threading.Thread(target=contextvars.copy_context().run, args=(self._encode_stage,),
+                                   name="intrafact-encode", daemon=True)
+        writer = threading.Thread(target=contextvars.copy_context().run, args=(self._store_stage,),
+                                  name="intrafact-store", daemon=True)
+        encoder.start()
+        writer.start()
+
+        try:
+            source()
+        finally:
+            self.encode_queue.put(_DONE)
+            encoder.join()
+            writer.join()
+            if self.processed_store is not None:
+                self.processed_store.flush()
+
+        if self.stage_error is not None:
+            raise self.stage_error
+
+        run_span.set(files=self.seen_count, documents=self.processed_count, chunks=self.chunk_count)
+        elapsed = time.perf_counter() - started
+        if self.chunk_count:
+            logger.info(f"....Pipeline stored {self.chunk_count} chunks in {elapsed:.1f}s "
+                        f"({self.chunk_count / elapsed:.1f} chunks/sec)....")
+        if self.deduplicator is not None and self.deduplicator.checked:
+            stats = self.deduplicator.stats()
+            logger.info(f"....Dedup: {stats['duplicates']} of {stats['checked']} new chunks were "
+                        f"near-duplicates ({stats['dedup_ratio']:.1%})....")
+        return self.processed_count
+
+    def _source_stage(self, paths: Optional[List] = None):
+        for file in iter_ingest(meta_store=self.meta_store, paths=paths):
+            if self.stage_error is not None:
+                break
+            self.seen_count += 1
+            metadata = file["metadata"]
+            original_file_name = metadata["file_name"]
+
+            if self.meta_store.document_exists(metadata["file_hash"], metadata["file_path"]):
+                logger.info(f"{original_file_name}: already processed, skipped")
+                self.meta_store.record_file(metadata)
+                continue
+
+            try:
+                normalized_data = self.normalizer.normalize_pages(iter_document_pages(file), metadata)
+                normalized_data["id"] = document_id_for_path(metadata["file_path"])
+                if self.processed_store is not None:
+                    # Saved as the chunker reads the pages
+                    normalized_data = self.processed_store.put(normalized_data)
+                # Large PDFs left to be streamed are also extracted inside the chunk span
+                self._chunk_stage(normalized_data, streamed=file["raw_text"] is None and file["pages"] is None)
+
+            except Exception as e:
+                logger.error(f"❌ Error processing {original_file_name}: {e}")
+
+    def _stored_source_stage(self):
+        for normalized_data in self.processed_store.iter_objects():
+            if self.stage_error is not None:
+                break
+            self.seen_count += 1
+            try:
+                self._chunk_stage(normalized_data)
+            except Exception as e:
+                logger.error(f"❌ Error processing {normalized_data['metadata'].get('file_name')}: {e}")
+
+    def _chunk_stage(self, normalized_data: Dict, **attributes):
+        # Pages are normalized and chunked one at a time
+        metadata = normalized_data["metadata"]
+        file_name = metadata["file_name"]
+        with telemetry.span("chunk", document=file_name, **attributes) as chunk_span:
+            chunks = self.chunker.process_chunks(normalized_data)
+            chunk_span.set(chunks=len(chunks))
+
+        logger.info(f"{file_name}: split into {len(chunks)} chunks")
+        # Even with no chunks: a known file emptied by an edit loses its document
+        self.encode_queue.put(self.indexer.plan(normalized_data["id"], metadata, chunks))
+
+    def _next_pool(self) -> Optional[List]:
+        """
+        Collects whole documents until pool_size chunks are gathered, the
+        input runs dry for max_wait seconds, or the source is done.
+        Returns None once the source is exhausted and nothing is left.
+        """
+        pool = []
+        pooled_chunks = 0
+
+        while pooled_chunks < self.pool_size:
+            try:
+                item = self.encode_queue.get(timeout=self.max_wait if pool else None)
+            except queue.Empty:
+                break
+
+            if item is _DONE:
+                # Re-queue so the next call also sees the end of input
+                self.encode_queue.put(_DONE)
+                break
+
+            pool.append(item)
+            pooled_chunks += len(item.added)
+
+        return pool or None
+
+    def _fail(self, stage: str, error: BaseException):
+        # Re-raised by _run_stages once every stage has stopped
+        logger.error(f"❌ {stage} stage stopped: {error}")
+        if self.stage_error is None:
+            self.stage_error = error
+
+    @staticmethod
+    def _drain(input_queue: queue.Queue):
+        # Consumes input up to the end marker, so no stage feeding it blocks on a full queue
+        while input_queue.get() is not _DONE:
+            pass
+
+    def _encode_stage(self):
+        try:
+            self._encode_pools()
+        except BaseException as e:
+            self._fail("Encode", e)
+        finally:
+            # A no-op after a normal end: _next_pool leaves the marker queued
+            self._drain(self.encode_queue)
+            self.store_queue.put(_DONE)
+
+    def _encode_pools(self):
+        # Stops early when the store stage has failed
+        while self.stage_error is None:
+            pool = self._next_pool()
+            if pool is None:
+                break
+
+            texts = [chunk["content"] for update in pool for chunk in update.added]
+            try:
+                # SentenceTransformer sorts the pool by length before splitting it
+                # into batch_size batches, so padding waste stays low
+                with telemetry.span("embed", documents=len(pool), chunks=len(texts), batch_size=self.batch_size):
+                    embeddings = self.embedder.encode(texts, batch_size=self.batch_size) if texts else None
+            except Exception as e:
+                names = ", ".join(update.file_name for update in pool)
+                logger.error(f"❌ Error embedding {names}: {e}")
+                self._discard(pool)
+                continue
+
+            # The whole pool is written as one batch
+            self.store_queue.put((pool, embeddings))
+
+    def _store_stage(self):
+        try:
+            self._store_pools()
+        except BaseException as e:
+            self._fail("Store", e)
+            self._drain(self.store_queue)
+
+    def _store_pools(self):
+        # MetadataStore hands this thread its own connection
+        while True:
+            item = self.store_queue.get()
+            if item is _DONE:
+                break
+
+            pool, embeddings = item
+            added = sum(len(update.added) for update in pool)
+            try:
+                with telemetry.span("store", documents=len(pool), chunks=added):
+                    self.indexer.apply(pool, embeddings=None if embeddings is None else np.asarray(embeddings))
+                self.processed_count += len(pool)
+                self.chunk_count += added
+
+            except Exception as e:
+                names = ", ".join(update.file_name for update in pool)
+                logger.error(f"❌ Error storing {names}: {e}")
+                self._discard(pool)
+
+    def _discard(self, pool: List):
+        # Chunks of a failed batch must not become canonical for later ones
+        if self.deduplicator is not None:
+            self.deduplicator.discard([chunk for update in pool for chunk in update.added])
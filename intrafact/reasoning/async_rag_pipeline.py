@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import time
+import httpx
+from openai import AsyncOpenAI
+from typing import AsyncIterator, Optional
+from intrafact.config import LLM_MAX_CONCURRENCY, LLM_TIMEOUT, LLM_MAX_RETRIES, CONTEXT_CANDIDATES
+from intrafact.reasoning.rag_pipeline import RAGPipeline
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
+
+class AsyncRAGPipeline(RAGPipeline):
+    """
+    asyncio-native RAGPipeline for serving many chat sessions from one process.
+
+    LLM calls go through an AsyncOpenAI client on a pooled keep-alive HTTP
+    connection, with per-request timeouts and the SDK's exponential-backoff
+    retries. Retrieval starts speculatively while the router decides and is
+    discarded on a DIRECT route. At most `max_concurrency` questions are in
+    flight at once.
+
+    A library entry point for applications that serve Intrafact from an
+    event loop; the CLI chat uses the synchronous RAGPipeline.
+    """
+
+    def __init__(self, model_name: str = None, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 timeout: float = LLM_TIMEOUT, max_retries: int = LLM_MAX_RETRIES, retriever=None,
+                 base_url: Optional[str] = None, api_key: Optional[str] = None):
+        super().__init__(model_name, retriever, base_url=base_url, api_key=api_key)
+
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency),
+            timeout=timeout
+        )
+        self.async_client = AsyncOpenAI(
+            base_url=self.base_url,
+            api_key=self.api_key,
+            http_client=self.http_client,
+            timeout=timeout,
+            max_retries=max_retries
+        )
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def aclose(self):
+        await self.async_client.close()
+
+    async def _ask_llm_router_async(self, query: str) -> Optional[bool]:
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "user", "content": self._router_prompt(query)}
+                ],
+                temperature=0.1,
+                max_tokens=5
+            )
+            decision = response.choices[0].message.content.strip().upper()
+            return "SEARCH" in decision
+
+        except Exception as e:
+            logger.warning(f"   ⚠️ Router Error: {e}. Defaulting to SEARCH.")
+            return None
+
+    async def _should_search_async(self, query: str) -> bool:
+        with telemetry.span("router") as router_span:
+            # Embeds the query unless the decision is cached; the encode is
+            # shared with the speculative retrieval (see Retriever.embed_query)
+            decision = await asyncio.to_thread(self._local_decision, query)
+            if decision is None:
+                started = time.perf_counter()
+                decision = await self._ask_llm_router_async(query)
+                decision = self._settle_llm_decision(query, decision, time.perf_counter() - started)
+            router_span.set(route="SEARCH" if decision else "DIRECT")
+            return decision
+
+    async def build_prompt_async(self, query: str) -> str:
+        # Speculative retrieval, started before routing so the two overlap
+        # from the first step (encoding the query) on
+        retrieval = asyncio.create_task(asyncio.to_thread(self.retriever.retrieve, query, CONTEXT_CANDIDATES))
+        try:
+            should_search = await self._should_search_async(query)
+        except BaseException:
+            retrieval.cancel()
+            raise
+
+        if should_search:
+            logger.info("   🔍 Route: Searching Database...")
+            return self._rag_prompt(query, await retrieval)
+
+        # The worker thread finishes on its own; its result is simply dropped
+        retrieval.cancel()
+        logger.info("   ⚡ Route: Direct Answer...")
+        return self._direct_prompt(query)
+
+    async def answer_question_async(self, query: str) -> str:
+        async with self.semaphore:
+            # Each asyncio task runs in its own context, so concurrent questions get separate traces
+            with telemetry.span("answer_question") as trace:
+                final_prompt = await self.build_prompt_async(query)
+                with telemetry.span("generation"):
+                    answer = await self._generate_async(final_prompt)
+            self._record_trace(trace)
+            return answer
+
+    async def _generate_async(self, final_prompt: str) -> str:
+        try:
+            response = await self.async_client.chat.completions.create(
+                model=self.model_name,
+                messages=[
+                    {"role": "user", "content": final_prompt}
+                ],
+                temperature=0.3
+            )
+            return response.choices[0].message.content
+
+        except Exception as e:
+            return f"❌ API Error: {e}"
+
+    async def stream_answer_async(self, query: str) -> AsyncIterator[str]:
+        """
+        Async stream_answer(): yields text deltas as they arrive and stores
+        self.last_timings and self.last_trace the same way.
+        """
+        async with self.semaphore:
+            trace = None
+            try:
+                with telemetry.span("answer_question", streamed=True) as trace:
+                    final_prompt = await self.build_prompt_async(query)
+
+                    started = time.perf_counter()
+                    first_token_at = None
+                    self.last_timings = {}
+
+                    try:
+                        with telemetry.span("generation") as generation_span:
+                            stream = await self.async_client.chat.completions.create(
+                                model=self.model_name,
+                                messages=[
+                                    {"role": "user", "content": final_prompt}
+                                ],
+                                temperature=0.3,
+                                stream=True
+                            )
+                            async for event in stream:
+                                if not event.choices:
+                                    continue
+                                delta = event.choices[0].delta.content
+                                if delta:
+                                    if first_token_at is None:
+                                        first_token_at = time.perf_counter()
+                                        generation_span.set(time_to_first_token=first_token_at - started)
+                                        telemetry.metrics.observe("intrafact_time_to_first_token_seconds",
+                                                                  first_token_at - started)
+                                    yield delta
+
+                    except Exception as e:
+                        yield f"❌ API Error: {e}"
+
+                    finally:
+                        finished = time.perf_counter()
+                        self.last_timings = {
+                            "time_to_first_token": (first_token_at - started) if first_token_at else None,
+                            "generation_time": finished - started
+                        }
+            finally:
+                if trace is not None:
+                    self._record_trace(trace)
@@ -0,0 +1,148 @@
+from typing import List, Dict, Tuple
+from intrafact.config import CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
+
+CONTEXT_SEPARATOR = "\n\n---\n\n"
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = text.lower().split()
+    if len(words) <= size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _append_without_overlap(left: str, right: str) -> str:
+    """
+    Joins two neighbouring chunk texts, dropping the prefix of `right` that
+    repeats the tail of `left` (the chunker's overlap).
+    """
+    words = right.split(maxsplit=1)
+    if words:
+        # The earliest match in the tail of `left` gives the longest overlap
+        position = left.find(words[0], max(0, len(left) - len(right)))
+        while position != -1:
+            if right.startswith(left[position:]):
+                return left + right[len(left) - position:]
+            position = left.find(words[0], position + 1)
+    return left + "\n" + right
+
+class ContextPacker:
+    """
+    Turns ranked retrieval hits into the context block of a prompt:
+    neighbouring chunks of the same document are merged into one span with
+    the overlap removed, near-duplicate passages are dropped, and passages
+    are added in rank order while they fit the token budget.
+    """
+
+    def __init__(self, tokenizer, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 dedup_threshold: float = CONTEXT_DEDUP_THRESHOLD):
+        self.tokenizer = tokenizer
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer(text, add_special_tokens=False, truncation=False, verbose=False)["input_ids"])
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        The longest prefix of `text` that is at most `max_tokens` tokens,
+        cut at a token boundary.
+        """
+        encoding = self.tokenizer(text, add_special_tokens=False, return_offsets_mapping=True,
+                                  truncation=False, verbose=False)
+        offsets = [(start, end) for start, end in encoding["offset_mapping"] if end > start]
+        if len(offsets) <= max_tokens:
+            return text
+        return text[:offsets[max_tokens - 1][1]] if max_tokens > 0 else ""
+
+    def merge_neighbors(self, results: List[Dict]) -> List[Dict]:
+        """
+        Merges hits sharing a parent_id with consecutive chunk_index values.
+        Each passage keeps the best (lowest) rank of the hits it contains.
+        """
+        by_document = {}
+        passages = []
+        for rank, result in enumerate(results):
+            metadata = result.get("metadata") or {}
+            parent_id = metadata.get("parent_id")
+            chunk_index = metadata.get("chunk_index")
+            entry = {
+                "rank": rank,
+                "content": result["content"],
+                "chunk_index": chunk_index,
+                "char_start": metadata.get("char_start"),
+                "char_end": metadata.get("char_end")
+            }
+            if parent_id is None or chunk_index is None:
+                passages.append(entry)
+            else:
+                by_document.setdefault(parent_id, {})[chunk_index] = entry
+
+        for chunks in by_document.values():
+            current = None
+            for chunk_index in sorted(chunks):
+                entry = chunks[chunk_index]
+                if current is not None and chunk_index == current["chunk_index"] + 1:
+                    if current["char_end"] is not None and entry["char_start"] is not None:
+                        # Character offsets into the same source: slice the overlap off exactly
+                        skip = max(0, current["char_end"] - entry["char_start"])
+                        current["content"] += entry["content"][skip:]
+                    else:
+                        current["content"] = _append_without_overlap(current["content"], entry["content"])
+                    current.update(
+                        chunk_index=chunk_index,
+                        char_end=entry["char_end"],
+                        rank=min(current["rank"], entry["rank"])
+                    )
+                else:
+                    current = entry
+                    passages.append(current)
+
+        return sorted(passages, key=lambda passage: passage["rank"])
+
+    def drop_near_duplicates(self, passages: List[Dict]) -> List[Dict]:
+        """
+        Drops passages whose word shingles mostly appear in a better-ranked
+        passage (overlap coefficient, so a passage contained in another one
+        counts as a duplicate too).
+        """
+        kept, kept_shingles = [], []
+        for passage in passages:
+            shingles = _shingles(passage["content"])
+            if any(len(shingles & other) / min(len(shingles), len(other)) >= self.dedup_threshold
+                   for other in kept_shingles):
+                continue
+            kept.append(passage)
+            kept_shingles.append(shingles)
+        return kept
+
+    def pack(self, results: List[Dict]) -> Tuple[str, Dict]:
+        """
+        Returns (context_text, stats) for the given ranked results.
+        A passage larger than the whole budget (e.g. a long run of merged
+        neighbours) is cut down to the budget left rather than skipped.
+        """
+        passages = self.drop_near_duplicates(self.merge_neighbors(results))
+
+        separator_tokens = self.count_tokens(CONTEXT_SEPARATOR)
+        selected, used_tokens, truncated = [], 0, 0
+        for passage in passages:
+            content = passage["content"]
+            tokens = self.count_tokens(content)
+            separator = separator_tokens if selected else 0
+            if used_tokens + separator + tokens > self.token_budget:
+                remaining = self.token_budget - used_tokens - separator
+                if tokens <= self.token_budget or remaining <= 0:
+                    continue
+                content = self.truncate(content, remaining)
+                tokens = remaining
+                truncated += 1
+            selected.append(content)
+            used_tokens += separator + tokens
+
+        stats = {
+            "hits": len(results),
+            "passages": len(passages),
+            "packed_passages": len(selected),
+            "truncated_passages": truncated,
+            "context_tokens": used_tokens
+        }
+        return CONTEXT_SEPARATOR.join(selected), stats
@@ -1,34 +1,90 @@
+import copy
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional
 from openai import OpenAI
 from dotenv import load_dotenv
+from intrafact.config import ROUTER_MODE, CONTEXT_CANDIDATES, BATCH_CONCURRENCY, BATCH_WINDOW
 from intrafact.retrieval.retriever import Retriever
+from intrafact.reasoning.router import QueryRouter
+from intrafact.reasoning.context_builder import ContextPacker
+from intrafact import telemetry
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 class RAGPipeline:
-    def __init__(self, model_name: str = None):
+    def __init__(self, model_name: str = None, retriever: Optional[Retriever] = None,
+                 base_url: Optional[str] = None, api_key: Optional[str] = None):
         # Load Config
-        self.api_key = os.getenv("OPENROUTER_API_KEY")
+        self.api_key = api_key or os.getenv("OPENROUTER_API_KEY")
         self.model_name = model_name or os.getenv("LLM_MODEL") or "google/gemma-3n-e4b-it:free"
         
         if not self.api_key:
             raise ValueError("❌ Missing API Key in .env")
 
-        print(f"   ...Initializing Pipeline (Model: {self.model_name})...")
+        logger.info(f"   ...Initializing Pipeline (Model: {self.model_name})...")
 
+        # Any OpenAI-compatible endpoint works (e.g. a local stub server for tests)
+        self.base_url = base_url or os.getenv("LLM_BASE_URL") or "https://openrouter.ai/api/v1"
         self.client = OpenAI(
-            base_url="https://openrouter.ai/api/v1",
+            base_url=self.base_url,
             api_key=self.api_key,
         )
+        self.last_timings = {}
         
-        self.retriever = Retriever()
+        self.retriever = retriever or Retriever()
+        # Shares the retriever's model, and its query-embedding cache via embed_query()
+        self.router = QueryRouter(self.retriever.embedder)
+        self.packer = ContextPacker(copy.deepcopy(self.retriever.embedder.tokenizer))
+        self.last_context_stats = {}
+        # Where the last answered question spent its time, in milliseconds
+        self.last_trace = {}
 
     def _should_search(self, query: str) -> bool:
         """
         Step 1: The Router.
+        The local embedding router decides confident cases in-process; the LLM
+        router is only asked about ambiguous queries (or about every query
+        when ROUTER_MODE is "llm").
+        """
+        with telemetry.span("router") as router_span:
+            decision = self._local_decision(query)
+            if decision is None:
+                decision = self._timed_llm_decision(query)
+            router_span.set(route="SEARCH" if decision else "DIRECT")
+            return decision
+
+    def _local_decision(self, query: str, query_vector=None) -> Optional[bool]:
+        """
+        Cached or local-router decision, or None if the LLM has to decide.
         """
+        cached = self.router.cached(query)
+        if cached is not None:
+            return cached
+
+        if ROUTER_MODE != "local":
+            return None
+
+        if query_vector is None:
+            query_vector = self.retriever.embed_query(query)
+        return self.router.route(query, query_vector)
+
+    def _settle_llm_decision(self, query: str, decision: Optional[bool], latency: float) -> bool:
+        if decision is None:
+            self.router.log(query, True, "llm-error", latency)
+            return True
+
+        self.router.log(query, decision, "llm", latency)
+        self.router.remember(query, decision)
+        return decision
+
+    def _router_prompt(self, query: str) -> str:
         # We merge instructions into the user prompt to be safe for all models
-        full_prompt = f"""
+        return f"""
         INSTRUCTIONS:
         You are an intelligent query router. Decide if a user's question requires retrieving external documents.
         Reply "SEARCH" if the user asks about specific projects, files, or facts.
@@ -39,6 +95,12 @@ class RAGPipeline:
         "{query}"
         """
 
+    def _ask_llm_router(self, query: str) -> Optional[bool]:
+        """
+        Asks the LLM for SEARCH or DIRECT. Returns None if the call fails.
+        """
+        full_prompt = self._router_prompt(query)
+
         try:
             response = self.client.chat.completions.create(
                 model=self.model_name,
@@ -49,31 +111,23 @@ class RAGPipeline:
                 max_tokens=5
             )
             decision = response.choices[0].message.content.strip().upper()
-            print(f"   🚦 Router Decision: {decision}")
             return "SEARCH" in decision
             
         except Exception as e:
-            print(f"   ⚠️ Router Error: {e}. Defaulting to SEARCH.")
-            return True
+            logger.warning(f"   ⚠️ Router Error: {e}. Defaulting to SEARCH.")
+            return None
 
-    def answer_question(self, query: str) -> str:
-        """
-        Step 2: The Execution.
-        """
-        # --- DECISION TIME ---
-        if self._should_search(query):
-            # PATH A: RAG
-            print("   🔍 Route: Searching Database...")
-            results = self.retriever.retrieve(query, limit=5)
-            
-            if not results:
-                # Fallback if search yields nothing
-                context_text = "No relevant documents found."
-            else:
-                context_text = "\n\n---\n\n".join([doc['content'] for doc in results])
-            
-            # Combine System + Context + Question into one block
-            final_prompt = f"""
+    def _rag_prompt(self, query: str, results) -> str:
+        stats = {}
+        if not results:
+            # Fallback if search yields nothing
+            context_text = "No relevant documents found."
+        else:
+            # Merge neighbouring chunks, drop duplicates, fit the token budget
+            context_text, stats = self.packer.pack(results)
+        
+        # Combine System + Context + Question into one block
+        prompt = f"""
             SYSTEM INSTRUCTIONS:
             You are a helpful AI assistant answering based strictly on the provided context.
             If the answer is not in the context, say "I don't know."
@@ -84,18 +138,69 @@ class RAGPipeline:
             USER QUESTION:
             {query}
             """
-            
-        else:
-            # PATH B: Direct Answer
-            print("   ⚡ Route: Direct Answer...")
-            final_prompt = f"""
+        self._report_prompt(prompt, stats)
+        return prompt
+
+    def _direct_prompt(self, query: str) -> str:
+        prompt = f"""
             SYSTEM INSTRUCTIONS:
             You are a helpful AI assistant. Answer the user's question politely and directly.
 
             USER QUESTION:
             {query}
             """
+        self._report_prompt(prompt)
+        return prompt
+
+    def _report_prompt(self, prompt: str, stats: dict = None):
+        stats = dict(stats or {}, prompt_tokens=self.packer.count_tokens(prompt))
+        self.last_context_stats = stats
+        telemetry.set_attributes(prompt_tokens=stats["prompt_tokens"])
+        if "hits" in stats:
+            telemetry.set_attributes(hits=stats["hits"], passages=stats["packed_passages"])
+            logger.info(f"   📦 Context: {stats['packed_passages']} passages from {stats['hits']} hits, "
+                        f"{stats['prompt_tokens']} prompt tokens")
+        else:
+            logger.info(f"   📦 Prompt: {stats['prompt_tokens']} tokens")
+
+    def build_prompt(self, query: str) -> str:
+        """
+        Step 2: Routing and retrieval, producing the final prompt.
+        """
+        # --- DECISION TIME ---
+        if self._should_search(query):
+            # PATH A: RAG
+            logger.info("   🔍 Route: Searching Database...")
+            results = self.retriever.retrieve(query, limit=CONTEXT_CANDIDATES)
+            return self._rag_prompt(query, results)
+
+        # PATH B: Direct Answer
+        logger.info("   ⚡ Route: Direct Answer...")
+        return self._direct_prompt(query)
+
+    def answer_question(self, query: str) -> str:
+        """
+        Step 3: The Execution.
+        """
+        with telemetry.span("answer_question") as trace:
+            answer = self.generate(self.build_prompt(query))
+        self._record_trace(trace)
+        return answer
+
+    def _record_trace(self, trace: telemetry.Span):
+        """
+        Splits the time of one question into router, encode, search,
+        generation and other (prompt building, packing).
+        """
+        self.last_trace = {"total_ms": trace.duration * 1000}
+        self.last_trace.update({f"{name}_ms": seconds * 1000 for name, seconds in trace.breakdown().items()})
+        logger.debug("   ⏱️ " + ", ".join(f"{name[:-3]} {ms:.1f} ms" for name, ms in self.last_trace.items()))
 
+    def generate(self, final_prompt: str) -> str:
+        with telemetry.span("generation"):
+            return self._generate(final_prompt)
+
+    def _generate(self, final_prompt: str) -> str:
         # --- GENERATE ANSWER ---
         try:
             response = self.client.chat.completions.create(
@@ -109,4 +214,98 @@ class RAGPipeline:
             return response.choices[0].message.content
             
         except Exception as e:
-            return f"❌ API Error: {e}"
\ No newline at end of file
+            return f"❌ API Error: {e}"
+
+    def stream_answer(self, query: str) -> Iterator[str]:
+        """
+        Streaming variant of answer_question(): yields text deltas as they
+        arrive. Time to first token and total generation time are stored in
+        self.last_timings once the stream ends, and the trace in self.last_trace
+        (also when the caller stops reading the stream early).
+        """
+        trace = None
+        try:
+            with telemetry.span("answer_question", streamed=True) as trace:
+                final_prompt = self.build_prompt(query)
+
+                started = time.perf_counter()
+                first_token_at = None
+                self.last_timings = {}
+
+                try:
+                    with telemetry.span("generation") as generation_span:
+                        stream = self.client.chat.completions.create(
+                            model=self.model_name,
+                            messages=[
+                                {"role": "user", "content": final_prompt}
+                            ],
+                            temperature=0.3,
+                            stream=True
+                        )
+                        for event in stream:
+                            if not event.choices:
+                                continue
+                            delta = event.choices[0].delta.content
+                            if delta:
+                                if first_token_at is None:
+                                    first_token_at = time.perf_counter()
+                                    generation_span.set(time_to_first_token=first_token_at - started)
+                                    telemetry.metrics.observe("intrafact_time_to_first_token_seconds",
+                                                              first_token_at - started)
+                                yield delta
+
+                except Exception as e:
+                    yield f"❌ API Error: {e}"
+
+                finally:
+                    finished = time.perf_counter()
+                    self.last_timings = {
+                        "time_to_first_token": (first_token_at - started) if first_token_at else None,
+                        "generation_time": finished - started
+                    }
+        finally:
+            # Also when the caller stops reading early: the span is closed by then
+            if trace is not None:
+                self._record_trace(trace)
+
+    def iter_answers(self, queries: List[str], max_concurrency: int = BATCH_CONCURRENCY,
+                     window: int = BATCH_WINDOW) -> Iterator[str]:
+        """
+        Answers many questions, yielding answers in input order as soon as
+        each one (and every one before it) is done.
+
+        Questions are processed in windows: each window is embedded and
+        routed in one batch, retrieved with one multi-vector search, and its
+        LLM calls are fanned out over `max_concurrency` threads.
+        """
+        with ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="intrafact-answer") as pool:
+            for start in range(0, len(queries), window):
+                batch = queries[start:start + window]
+
+                vectors = self.retriever.embed_queries(batch)
+                with telemetry.span("router", queries=len(batch)):
+                    decisions = [self._local_decision(query, vector) for query, vector in zip(batch, vectors)]
+
+                    # Ambiguous questions ask the LLM router, concurrently
+                    ambiguous = [i for i, decision in enumerate(decisions) if decision is None]
+                    llm_decisions = pool.map(self._timed_llm_decision, [batch[i] for i in ambiguous])
+                    for i, decision in zip(ambiguous, llm_decisions):
+                        decisions[i] = decision
+
+                search_positions = [i for i, decision in enumerate(decisions) if decision]
+                retrieved = self.retriever.retrieve_many([batch[i] for i in search_positions], limit=CONTEXT_CANDIDATES)
+                results = dict(zip(search_positions, retrieved))
+
+                prompts = [
+                    self._rag_prompt(query, results[i]) if i in results else self._direct_prompt(query)
+                    for i, query in enumerate(batch)
+                ]
+                yield from pool.map(self.generate, prompts)
+
+    def _timed_llm_decision(self, query: str) -> bool:
+        started = time.perf_counter()
+        decision = self._ask_llm_router(query)
+        return self._settle_llm_decision(query, decision, time.perf_counter() - started)
+
+    def answer_many(self, queries: List[str], max_concurrency: int = BATCH_CONCURRENCY) -> List[str]:
+        return list(self.iter_answers(queries, max_concurrency))
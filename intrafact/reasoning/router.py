@@ -0,0 +1,134 @@
+import json
+import logging
+import logging.handlers
+import time
+import numpy as np
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+from intrafact.config import (ROUTER_MARGIN, ROUTER_TOP_K, ROUTER_LOG_PATH, ROUTER_LOG_MAX_BYTES, ROUTER_LOG_BACKUPS,
+                              QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL)
+from intrafact.retrieval.query_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Labelled examples of each route. Queries are compared against these in
+# embedding space, so they should cover the phrasing users actually type.
+SEARCH_PROTOTYPES = [
+    "What does the project documentation say about deployment?",
+    "Summarize the design document for the ingestion service",
+    "Which file describes the database schema?",
+    "What did we decide in the architecture review?",
+    "Find the error code in the incident report",
+    "What are the requirements listed in the spec?",
+    "Who owns the billing module according to the docs?",
+    "Explain how our retrieval pipeline works",
+    "What is the release date in the roadmap?",
+    "Show me the notes from last week's meeting",
+    "What does the README say about setup?",
+    "According to the report, what were the quarterly numbers?",
+    "Which API endpoints are documented for the service?",
+    "What changed in the latest version of the policy?",
+    "Look up the configuration values for production",
+]
+
+DIRECT_PROTOTYPES = [
+    "Hi",
+    "Hello there",
+    "Good morning!",
+    "Thanks, that was helpful",
+    "How are you?",
+    "What is 2 + 2?",
+    "What is the capital of France?",
+    "Tell me a joke",
+    "Can you give me general advice on writing clean code?",
+    "What is a for loop in Python?",
+    "Translate 'thank you' into Spanish",
+    "Who are you?",
+    "What can you help me with?",
+    "Goodbye",
+    "Explain what machine learning is in simple terms",
+]
+
+class QueryRouter:
+    """
+    Local SEARCH/DIRECT router. A query embedding is scored against labelled
+    prototype embeddings (mean of the top-k cosine similarities per route);
+    when the two routes are closer than `margin` the decision is left to the
+    caller (e.g. the LLM router). Decisions are cached and, when `log_path`
+    is given, appended to a size-rotated JSONL log together with their
+    latency.
+    """
+
+    def __init__(self, embedder, margin: float = ROUTER_MARGIN, top_k: int = ROUTER_TOP_K,
+                 log_path: Optional[Path] = ROUTER_LOG_PATH or None):
+        self.embedder = embedder
+        self.margin = margin
+        self.top_k = top_k
+
+        # Written through a handler of its own (not a logger), so the records
+        # never reach the application's log handlers
+        self.log_handler = None
+        if log_path:
+            self.log_handler = logging.handlers.RotatingFileHandler(
+                log_path, maxBytes=ROUTER_LOG_MAX_BYTES, backupCount=ROUTER_LOG_BACKUPS,
+                encoding="utf-8", delay=True
+            )
+
+        self.decisions = LRUCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL)
+
+        self.search_vectors = self._normalize(embedder.encode(SEARCH_PROTOTYPES, use_cache=False))
+        self.direct_vectors = self._normalize(embedder.encode(DIRECT_PROTOTYPES, use_cache=False))
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.maximum(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12)
+
+    def _score(self, prototypes: np.ndarray, query_vector: np.ndarray) -> float:
+        similarities = prototypes @ query_vector
+        k = min(self.top_k, len(similarities))
+        return float(np.partition(similarities, -k)[-k:].mean())
+
+    def cached(self, query: str) -> Optional[bool]:
+        return self.decisions.get(" ".join(query.lower().split()))
+
+    def remember(self, query: str, should_search: bool):
+        self.decisions.put(" ".join(query.lower().split()), should_search)
+
+    def route(self, query: str, query_vector: np.ndarray) -> Optional[bool]:
+        """
+        Returns True for SEARCH, False for DIRECT, or None when ambiguous.
+        """
+        started = time.perf_counter()
+        query_vector = self._normalize(query_vector)
+
+        search_score = self._score(self.search_vectors, query_vector)
+        direct_score = self._score(self.direct_vectors, query_vector)
+        confidence = search_score - direct_score
+
+        decision = None
+        if abs(confidence) >= self.margin:
+            decision = confidence > 0
+            self.remember(query, decision)
+
+        self.log(query, decision, "local", time.perf_counter() - started,
+                 search_score=round(search_score, 4), direct_score=round(direct_score, 4))
+        return decision
+
+    def log(self, query: str, decision: Optional[bool], source: str, latency: float, **details):
+        label = "AMBIGUOUS" if decision is None else ("SEARCH" if decision else "DIRECT")
+        logger.info(f"   🚦 Router Decision: {label} ({source}, {latency * 1000:.2f} ms)")
+
+        if self.log_handler is None:
+            return
+
+        record = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "query": query,
+            "decision": label,
+            "source": source,
+            "latency_ms": round(latency * 1000, 3),
+            **details
+        }
+        self.log_handler.handle(logging.makeLogRecord({"msg": json.dumps(record, ensure_ascii=False)}))
@@ -0,0 +1,85 @@
+"""
+Process-wide shared resources, created on first use.
+
+Ingest, retrieval and the watch daemon all get the same embedding model,
+vector store client and metadata store from here, so each is loaded once per
+process. Heavy imports happen inside the getters. Load times are recorded
+and reported by startup_timings().
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+# Guards the dicts below. Each resource is created under a lock of its own,
+# so a slow factory (e.g. loading the model) never blocks the other getters.
+_lock = threading.Lock()
+_resources = {}
+_resource_locks = {}
+_timings = {}
+
+@contextmanager
+def timed(name: str):
+    """
+    Records how long the block took under `name` in startup_timings().
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with _lock:
+            _timings[name] = _timings.get(name, 0.0) + time.perf_counter() - started
+
+def _get(name: str, factory):
+    resource = _resources.get(name)
+    if resource is not None:
+        return resource
+
+    with _lock:
+        resource_lock = _resource_locks.setdefault(name, threading.RLock())
+    with resource_lock:
+        if name not in _resources:
+            with timed(name):
+                resource = factory()
+            with _lock:
+                _resources[name] = resource
+        return _resources[name]
+
+def get_embedder():
+    """
+    The shared TextEmbedder. The model itself loads on first encode/tokenizer use.
+    """
+    def create():
+        from intrafact.processing.embedder import TextEmbedder
+        return TextEmbedder()
+    return _get("embedder", create)
+
+def get_vector_db(collection_name: str = "intrafact_store"):
+    def create():
+        from intrafact.storage.vector_store import VectorDB
+        return VectorDB(collection_name)
+    return _get(f"vector_db:{collection_name}", create)
+
+def get_meta_store():
+    def create():
+        from intrafact.storage.metadata_store import MetadataStore
+        return MetadataStore()
+    return _get("meta_store", create)
+
+def get_processed_store():
+    """
+    The shared ProcessedStore, compacting in the background and flushed at exit.
+    """
+    def create():
+        import atexit
+        from intrafact.config import PROCESSED_COMPACT_INTERVAL
+        from intrafact.storage.processed_store import ProcessedStore
+        store = ProcessedStore()
+        store.start_compactor(PROCESSED_COMPACT_INTERVAL)
+        atexit.register(store.close)
+        return store
+    return _get("processed_store", create)
+
+def startup_timings() -> Dict[str, float]:
+    with _lock:
+        return dict(_timings)
@@ -1,34 +1,249 @@
-from typing import List, Dict
-from intrafact.storage.vector_store import VectorDB
-from intrafact.processing.embedder import TextEmbedder
+import contextvars
+import json
+import logging
+import re
+import threading
+import numpy as np
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Dict, Optional
+from intrafact.config import QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL, RETRIEVAL_MODE, RRF_K
+from intrafact.retrieval.query_cache import LRUCache
+from intrafact import registry, telemetry
+
+logger = logging.getLogger(__name__)
+
+# A single identifier-like token, i.e. one with an inner "_", "-" or "." or
+# mixing letters and digits (ERR-4021, report_v2.pdf, v2), or any quoted
+# string: looked up lexically without running the encoder. Plain words and
+# numbers ("hi.", "2024") still go through hybrid search.
+EXACT_TERM_PATTERN = re.compile(
+    r'^"[^"]+"$|^(?=\S*[^\W_][_.-][^\W_]|\S*[A-Za-z]\S*\d|\S*\d\S*[A-Za-z])\S+$'
+)
+
+def reciprocal_rank_fusion(result_lists: List[List[Dict]], limit: int, k: int = RRF_K) -> List[Dict]:
+    """
+    Merges ranked result lists by summing 1 / (k + rank) per chunk id.
+    The first list's copy of a chunk wins (with its raw "distance" or
+    "bm25"); "score" and "rrf_score" become the fused score.
+    """
+    fused_scores = {}
+    merged = {}
+    for results in result_lists:
+        for rank, result in enumerate(results):
+            fused_scores[result["id"]] = fused_scores.get(result["id"], 0.0) + 1.0 / (k + rank + 1)
+            merged.setdefault(result["id"], result)
+
+    ranked = sorted(fused_scores, key=fused_scores.get, reverse=True)[:limit]
+    return [{**merged[chunk_id], "score": fused_scores[chunk_id], "rrf_score": fused_scores[chunk_id]}
+            for chunk_id in ranked]
 
 class Retriever:
-    def __init__(self):
-        self.embedder = TextEmbedder()
-        self.vector_db = VectorDB()
+    def __init__(self, embedder=None, vector_db=None, meta_store=None):
+        # Defaults are the process-wide instances, shared with ingest
+        self.embedder = embedder or registry.get_embedder()
+        self.vector_db = vector_db or registry.get_vector_db()
+        self.meta_store = meta_store or registry.get_meta_store()
+        self.pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="intrafact-retrieve")
 
-    def retrieve(self, query: str, limit: int = 5) -> List[Dict]:
-        print("....Searching....")
+        # Level 1: normalized query text -> query embedding
+        self.query_vectors = LRUCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL)
+        # Encodes in progress, so concurrent callers (e.g. the router and a
+        # speculative retrieval) share one model call
+        self.pending_queries = {}
+        self.pending_lock = threading.Lock()
+        # Level 2: (query embedding, limit, filters, corpus generation) -> cleaned results
+        self.results = LRUCache(QUERY_CACHE_MAX_ENTRIES, QUERY_CACHE_TTL)
 
-        query_vector = self.embedder.model.encode(query).tolist()
-        results = self.vector_db.search(query_vector, limit)
+    def _normalize_query(self, query: str) -> str:
+        normalized = " ".join(query.split())
+        # Uncased models (like the default MiniLM) lowercase their input anyway
+        if getattr(self.embedder.tokenizer, "do_lower_case", False):
+            normalized = normalized.lower()
+        return normalized
 
-        cleaned_results = []
-        if not results['ids'] or len(results['ids'][0]) == 0:
+    def embed_query(self, query: str) -> np.ndarray:
+        key = self._normalize_query(query)
+        query_vector = self.query_vectors.get(key)
+        if query_vector is not None:
+            return query_vector
+
+        with self.pending_lock:
+            pending = self.pending_queries.get(key)
+            owner = pending is None
+            if owner:
+                pending = self.pending_queries[key] = Future()
+        if not owner:
+            return pending.result()
+
+        try:
+            query_vector = self.embedder.encode([key], use_cache=False)[0]
+            self.query_vectors.put(key, query_vector)
+            pending.set_result(query_vector)
+            return query_vector
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self.pending_lock:
+                del self.pending_queries[key]
+
+    def retrieve(self, query: str, limit: int = 5, where: Optional[Dict] = None,
+                 mode: str = RETRIEVAL_MODE) -> List[Dict]:
+        """
+        mode is "vector", "lexical" (BM25 over the metadata store) or "hybrid"
+        (both run concurrently and merged with reciprocal rank fusion).
+
+        Every result has a "score" where higher is better: the cosine
+        similarity in vector mode, the negated BM25 rank in lexical mode and
+        the fused score in hybrid mode. Scores are only comparable within one
+        mode; the raw value is kept as "distance" (squared L2 between unit
+        vectors), "bm25" (lower is better) or "rrf_score".
+        """
+        with telemetry.span("search", mode=mode) as search_span:
+            results = self._retrieve(query, limit, where, mode)
+            search_span.set(hits=len(results))
+            return results
+
+    def _retrieve(self, query: str, limit: int, where: Optional[Dict], mode: str) -> List[Dict]:
+        if mode == "vector":
+            return self.vector_retrieve(query, limit, where)
+        if mode == "lexical":
+            return self.lexical_retrieve(query, limit, where)
+        if mode != "hybrid":
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+
+        # Fast path: exact-term lookups skip the encoder entirely
+        if EXACT_TERM_PATTERN.match(query.strip()):
+            results = self.lexical_retrieve(query, limit, where)
+            if results:
+                return results
+
+        candidates = limit * 4
+        # The copied context keeps the vector search inside the current trace
+        vector_future = self.pool.submit(contextvars.copy_context().run, self.vector_retrieve, query, candidates, where)
+        lexical_results = self.lexical_retrieve(query, candidates, where)
+        vector_results = vector_future.result()
+
+        results = reciprocal_rank_fusion([vector_results, lexical_results], limit)
+        logger.info(f"Fused {len(vector_results)} vector + {len(lexical_results)} lexical hits into {len(results)}")
+        return results
+
+    def lexical_retrieve(self, query: str, limit: int = 5, where: Optional[Dict] = None) -> List[Dict]:
+        # Over-fetch when filtering, since the filter is applied after ranking
+        results = self.meta_store.search_chunks(query, limit * 4 if where else limit)
+        if where:
+            results = [r for r in results
+                       if all(r["metadata"].get(key) == value for key, value in where.items())]
+        return results[:limit]
+
+    def embed_queries(self, queries: List[str]) -> List[np.ndarray]:
+        """
+        Batched embed_query(): all cache misses are encoded in one model call.
+        """
+        keys = [self._normalize_query(query) for query in queries]
+        vectors = [self.query_vectors.get(key) for key in keys]
+
+        missing = list(dict.fromkeys(key for key, vector in zip(keys, vectors) if vector is None))
+        if missing:
+            encoded = dict(zip(missing, self.embedder.encode(missing, use_cache=False)))
+            for key, vector in encoded.items():
+                self.query_vectors.put(key, vector)
+            vectors = [encoded[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+        return vectors
+
+    def _result_key(self, query_vector: np.ndarray, limit: int, where: Optional[Dict]):
+        # A write to the collection bumps its generation, which invalidates every older entry
+        return (
+            query_vector.tobytes(),
+            limit,
+            json.dumps(where, sort_keys=True) if where else None,
+            self.vector_db.generation
+        )
+
+    @staticmethod
+    def _clean_results(results: Dict, position: int = 0) -> List[Dict]:
+        if not results['ids'] or len(results['ids'][position]) == 0:
             return []
-        
-        ids = results['ids'][0]
-        documents = results['documents'][0]
-        metadatas = results['metadatas'][0]
-        distances = results.get('distances', [[]])[0]
 
+        ids = results['ids'][position]
+        documents = results['documents'][position]
+        metadatas = results['metadatas'][position]
+        distances = (results.get('distances') or [[]] * len(results['ids']))[position]
+
+        cleaned_results = []
         for i in range(len(ids)):
+            distance = distances[i] if len(distances) > i else None
             cleaned_results.append({
                 "id": ids[i],
                 "content": documents[i],
                 "metadata": metadatas[i],
-                "score": distances[i] if len(distances) > i else 0.0
+                # Distances are 2 - 2 * cosine, so this is the cosine similarity
+                "score": 1.0 - distance / 2.0 if distance is not None else 0.0,
+                "distance": distance
             })
-        
-        print(f"Found {len(cleaned_results)} relevant chunks")
         return cleaned_results
+
+    def vector_retrieve(self, query: str, limit: int = 5, where: Optional[Dict] = None) -> List[Dict]:
+        logger.info("....Searching....")
+
+        query_vector = self.embed_query(query)
+
+        cache_key = self._result_key(query_vector, limit, where)
+        cached = self.results.get(cache_key)
+        if cached is not None:
+            logger.info(f"Found {len(cached)} relevant chunks (cached)")
+            return [dict(result) for result in cached]
+
+        results = self.vector_db.search(query_vector.tolist(), limit, where=where)
+        cleaned_results = self._clean_results(results)
+
+        self.results.put(cache_key, cleaned_results)
+        logger.info(f"Found {len(cleaned_results)} relevant chunks")
+        return [dict(result) for result in cleaned_results]
+
+    def retrieve_many(self, queries: List[str], limit: int = 5, where: Optional[Dict] = None,
+                      mode: str = RETRIEVAL_MODE) -> List[List[Dict]]:
+        """
+        Batched retrieve(): one encode call and one multi-vector search for
+        every query not already cached. Results are in input order.
+        """
+        with telemetry.span("search", mode=mode, queries=len(queries)):
+            return self._retrieve_many(queries, limit, where, mode)
+
+    def _retrieve_many(self, queries: List[str], limit: int, where: Optional[Dict], mode: str) -> List[List[Dict]]:
+        if mode == "lexical":
+            return [self.lexical_retrieve(query, limit, where) for query in queries]
+        if mode not in ("vector", "hybrid"):
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+
+        candidates = limit * 4 if mode == "hybrid" else limit
+        logger.info(f"....Searching {len(queries)} queries....")
+
+        query_vectors = self.embed_queries(queries)
+        cache_keys = [self._result_key(vector, candidates, where) for vector in query_vectors]
+        vector_results = [self.results.get(key) for key in cache_keys]
+
+        pending = [i for i, cached in enumerate(vector_results) if cached is None]
+        if pending:
+            results = self.vector_db.search_many(
+                [query_vectors[i].tolist() for i in pending], candidates, where=where
+            )
+            for position, i in enumerate(pending):
+                vector_results[i] = self._clean_results(results, position)
+                self.results.put(cache_keys[i], vector_results[i])
+
+        vector_results = [[dict(result) for result in results] for results in vector_results]
+        if mode == "vector":
+            return vector_results
+
+        return [
+            reciprocal_rank_fusion([results, self.lexical_retrieve(query, candidates, where)], limit)
+            for query, results in zip(queries, vector_results)
+        ]
+
+    def cache_stats(self) -> Dict:
+        return {
+            "query_embeddings": self.query_vectors.stats(),
+            "results": self.results.stats()
+        }
@@ -1,13 +1,63 @@
 import sqlite3
 import json
+import logging
+import re
+import threading
 from datetime import datetime
+from pathlib import Path
+from typing import List, Dict, Optional, Tuple
 from intrafact.config import SQLITE_DB_PATH
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Applied to every connection. WAL lets readers run alongside the ingest
+# writer; synchronous=NORMAL is durable across application crashes in WAL mode.
+CONNECTION_PRAGMAS = [
+    "PRAGMA journal_mode = WAL",
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA cache_size = -65536",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA mmap_size = 268435456",
+    "PRAGMA foreign_keys = OFF"
+]
+
+# Lookups by a list of keys run as "IN (...)" queries of at most this many
+# keys, below SQLite's bound-parameter limit
+SQL_BATCH = 500
 
 class MetadataStore:
-    def __init__(self):
-        self.conn = sqlite3.connect(str(SQLITE_DB_PATH))
+    """
+    SQLite-backed document, chunk and file-manifest store.
+    Safe to share across threads: each thread gets its own connection.
+    """
+
+    def __init__(self, db_path: Path = SQLITE_DB_PATH):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.create_tables()
 
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.db_path), timeout=30, check_same_thread=False)
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
     def create_tables(self):
         """
         Creates the schema if it doesn't exist.
@@ -35,26 +85,414 @@ class MetadataStore:
                 FOREIGN KEY(document_id) REFERENCES documents(id)
             )
         """)
+
+        # Table 2b: Full-text index over chunk content (BM25 lexical search).
+        # External-content table kept in sync by triggers; it references the
+        # implicit rowid of chunks, so run rebuild_lexical_index() after a VACUUM.
+        cursor.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts
+            USING fts5(content, content='chunks', content_rowid='rowid')
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, content) VALUES (new.rowid, new.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_update AFTER UPDATE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                INSERT INTO chunks_fts(rowid, content) VALUES (new.rowid, new.content);
+            END
+        """)
+
+        # Table 3: File manifest (stat snapshot of every raw file we have seen)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS file_manifest (
+                path TEXT PRIMARY KEY,
+                size INTEGER,
+                mtime_ns INTEGER,
+                inode INTEGER,
+                content_hash TEXT,
+                updated_at TIMESTAMP
+            )
+        """)
+
+        # Documents are keyed by their source path for incremental updates;
+        # older databases get the column backfilled from metadata_json
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(documents)")]
+        if "file_path" not in columns:
+            cursor.execute("ALTER TABLE documents ADD COLUMN file_path TEXT")
+            cursor.execute("UPDATE documents SET file_path = json_extract(metadata_json, '$.file_path')")
+
+        # Near-duplicate chunks point at the chunk whose vector they share
+        columns = [row[1] for row in cursor.execute("PRAGMA table_info(chunks)")]
+        if "canonical_id" not in columns:
+            cursor.execute("ALTER TABLE chunks ADD COLUMN canonical_id TEXT")
+
+        # Table 4: MinHash signatures and LSH band buckets of canonical chunks
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_signatures (
+                chunk_id TEXT PRIMARY KEY,
+                signature BLOB
+            )
+        """)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chunk_lsh (
+                band INTEGER,
+                bucket INTEGER,
+                chunk_id TEXT
+            )
+        """)
+
+        # Table 5: Persistent work queue of changed paths (watch mode)
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS ingest_queue (
+                path TEXT PRIMARY KEY,
+                enqueued_at REAL,
+                updated_at REAL
+            )
+        """)
+
+        # Indexes for the per-file and per-document lookups done during ingest
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_file_hash ON documents(file_hash)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_file_path ON documents(file_path)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_documents_ingested_at ON documents(ingested_at)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunks_canonical_id ON chunks(canonical_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunk_lsh_bucket ON chunk_lsh(band, bucket)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_chunk_lsh_chunk_id ON chunk_lsh(chunk_id)")
         self.conn.commit()
 
-    def register_document(self, doc_id: str, file_name: str, metadata: dict):
+    def register_document(self, doc_id: str, file_name: str, metadata: dict, chunks: List[Dict] = None):
+        """
+        Registers a document and (optionally) its chunks in one transaction.
+        """
+        self.register_documents([(doc_id, file_name, metadata, chunks)])
 
+    def register_documents(self, documents: List[Tuple[str, str, dict, List[Dict]]]):
+        """
+        Bulk registration of (doc_id, file_name, metadata, chunks) tuples in a
+        single transaction. Chunks are indexed for lexical search.
+        """
+        if not documents:
+            return
+
+        chunk_count = sum(len(chunks or []) for _, _, _, chunks in documents)
+        with telemetry.span("metadata_register", documents=len(documents), chunks=chunk_count):
+            now = datetime.now()
+            with self.conn:
+                self.conn.executemany("""
+                    INSERT OR REPLACE INTO documents (id, file_name, file_hash, file_path, ingested_at, metadata_json)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [
+                    (doc_id, file_name, metadata.get("file_hash", ""), metadata.get("file_path"), now,
+                     json.dumps(metadata))
+                    for doc_id, file_name, metadata, _ in documents
+                ])
+
+                # Upsert (not REPLACE) so the FTS update trigger fires for changed
+                # rows; unchanged chunks of a re-ingested document are left alone
+                self.conn.executemany("""
+                    INSERT INTO chunks (id, document_id, chunk_index, content, canonical_id)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(id) DO UPDATE SET
+                        document_id = excluded.document_id,
+                        chunk_index = excluded.chunk_index,
+                        content = excluded.content,
+                        canonical_id = excluded.canonical_id
+                    WHERE chunks.document_id IS NOT excluded.document_id
+                       OR chunks.chunk_index IS NOT excluded.chunk_index
+                       OR chunks.content IS NOT excluded.content
+                       OR chunks.canonical_id IS NOT excluded.canonical_id
+                """, [
+                    (c["id"], doc_id, c["chunk_index"], c["content"], c.get("canonical_id"))
+                    for doc_id, _, _, chunks in documents
+                    for c in chunks or []
+                ])
+
+        for _, file_name, _, _ in documents:
+            logger.info(f"   📝 Registered document metadata: {file_name}")
+
+    def document_exists(self, file_hash: str, file_path: str = None) -> bool:
+        """
+        True if a document with this content hash is stored (for `file_path`,
+        when given).
+        """
         cursor = self.conn.cursor()
-        cursor.execute("""
-            INSERT OR REPLACE INTO documents (id, file_name, file_hash, ingested_at, metadata_json)
-            VALUES (?, ?, ?, ?, ?)
-        """, (
-            doc_id, 
-            file_name, 
-            metadata.get("file_hash", ""), 
-            datetime.now(), 
-            json.dumps(metadata)
+        if file_path is None:
+            cursor.execute("SELECT id FROM documents WHERE file_hash = ?", (file_hash,))
+        else:
+            cursor.execute("SELECT id FROM documents WHERE file_hash = ? AND file_path = ?", (file_hash, file_path))
+        return cursor.fetchone() is not None
+
+    def documents_for_path(self, file_path: str) -> List[str]:
+        cursor = self.conn.execute("SELECT id FROM documents WHERE file_path = ?", (file_path,))
+        return [doc_id for (doc_id,) in cursor.fetchall()]
+
+    def chunk_ids(self, doc_id: str) -> List[str]:
+        return list(self.chunk_canonical_ids(doc_id))
+
+    def chunk_canonical_ids(self, doc_id: str) -> Dict[str, str]:
+        """
+        Returns {chunk_id: canonical_id} for a document's chunks; canonical_id
+        is None for chunks that have their own vector.
+        """
+        cursor = self.conn.execute(
+            "SELECT id, canonical_id FROM chunks WHERE document_id = ? ORDER BY chunk_index", (doc_id,)
+        )
+        return dict(cursor.fetchall())
+
+    def _select_in(self, query: str, keys: List) -> List[tuple]:
+        """
+        Runs `query`, whose "{keys}" placeholder is an IN list, over `keys`
+        in batches of SQL_BATCH.
+        """
+        rows = []
+        for i in range(0, len(keys), SQL_BATCH):
+            batch = keys[i:i + SQL_BATCH]
+            rows.extend(self.conn.execute(query.format(keys=",".join("?" * len(batch))), batch).fetchall())
+        return rows
+
+    def stored_vector_ids(self, chunk_ids: List[str]) -> set:
+        """
+        The subset of `chunk_ids` stored with a vector of their own (not duplicates).
+        """
+        return {chunk_id for (chunk_id,) in self._select_in(
+            "SELECT id FROM chunks WHERE id IN ({keys}) AND canonical_id IS NULL", list(chunk_ids)
+        )}
+
+    def delete_chunks(self, chunk_ids: List[str]):
+        rows = [(chunk_id,) for chunk_id in chunk_ids]
+        with self.conn:
+            self.conn.executemany("DELETE FROM chunk_lsh WHERE chunk_id = ?", rows)
+            self.conn.executemany("DELETE FROM chunk_signatures WHERE chunk_id = ?", rows)
+            self.conn.executemany("DELETE FROM chunks WHERE id = ?", rows)
+
+    def delete_documents(self, doc_ids: List[str]):
+        """
+        Deletes documents together with their chunks.
+        """
+        rows = [(doc_id,) for doc_id in doc_ids]
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM chunk_lsh WHERE chunk_id IN (SELECT id FROM chunks WHERE document_id = ?)", rows
+            )
+            self.conn.executemany(
+                "DELETE FROM chunk_signatures WHERE chunk_id IN (SELECT id FROM chunks WHERE document_id = ?)", rows
+            )
+            self.conn.executemany("DELETE FROM chunks WHERE document_id = ?", rows)
+            self.conn.executemany("DELETE FROM documents WHERE id = ?", rows)
+
+    def add_signatures(self, entries: List[Tuple[str, bytes, List[Tuple[int, int]]]]):
+        """
+        Stores (chunk_id, minhash_signature, [(band, bucket), ...]) entries.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO chunk_signatures (chunk_id, signature) VALUES (?, ?)",
+                [(chunk_id, signature) for chunk_id, signature, _ in entries]
+            )
+            self.conn.executemany("DELETE FROM chunk_lsh WHERE chunk_id = ?", [(entry[0],) for entry in entries])
+            self.conn.executemany(
+                "INSERT INTO chunk_lsh (band, bucket, chunk_id) VALUES (?, ?, ?)",
+                [(band, bucket, chunk_id) for chunk_id, _, buckets in entries for band, bucket in buckets]
+            )
+
+    def lsh_candidates(self, buckets: List[Tuple[int, int]]) -> List[str]:
+        found = []
+        for band, bucket in buckets:
+            found.extend(chunk_id for (chunk_id,) in self.conn.execute(
+                "SELECT chunk_id FROM chunk_lsh WHERE band = ? AND bucket = ?", (band, bucket)
+            ))
+        return list(dict.fromkeys(found))
+
+    def get_signatures(self, chunk_ids: List[str]) -> Dict[str, bytes]:
+        return dict(self._select_in(
+            "SELECT chunk_id, signature FROM chunk_signatures WHERE chunk_id IN ({keys})", list(chunk_ids)
         ))
-        self.conn.commit()
-        print(f"   📝 Registered document metadata: {file_name}")
 
-    def document_exists(self, file_hash: str) -> bool:
+    def release_duplicates(self, canonical_ids: List[str]) -> List[Dict]:
+        """
+        Detaches the chunks that reference any of `canonical_ids` (about to be
+        deleted) and returns them, with their document's metadata, so they can
+        get vectors of their own.
+        """
+        released = [{
+            "id": chunk_id,
+            "parent_id": document_id,
+            "chunk_index": chunk_index,
+            "content": content,
+            "metadata": json.loads(metadata_json) if metadata_json else {}
+        } for chunk_id, document_id, chunk_index, content, metadata_json in self._select_in("""
+            SELECT c.id, c.document_id, c.chunk_index, c.content, d.metadata_json
+            FROM chunks c
+            LEFT JOIN documents d ON d.id = c.document_id
+            WHERE c.canonical_id IN ({keys})
+        """, list(canonical_ids))]
+
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE chunks SET canonical_id = NULL WHERE id = ?", [(chunk["id"],) for chunk in released]
+            )
+        return released
+
+    def load_manifest(self, paths: Optional[List[str]] = None) -> dict:
+        """
+        Returns {path: (size, mtime_ns, inode, content_hash)} for every known
+        file (or for the known ones among `paths`). Loaded once per scan so
+        the per-file check is a dict lookup.
+        """
+        query = "SELECT path, size, mtime_ns, inode, content_hash FROM file_manifest"
+        if paths is None:
+            rows = self.conn.execute(query).fetchall()
+        else:
+            rows = self._select_in(query + " WHERE path IN ({keys})", list(paths))
+        return {row[0]: tuple(row[1:]) for row in rows}
+
+    def record_file(self, metadata: dict):
+        """
+        Stores the stat snapshot and hash of a file produced by the ingestor.
+        """
+        self.record_files([metadata])
+
+    def record_files(self, metadatas: List[dict]):
+        self.update_manifest_many([
+            (m["file_path"], m["file_size"], m["file_mtime_ns"], m["file_inode"], m["file_hash"])
+            for m in metadatas
+        ])
+
+    def update_manifest(self, path: str, size: int, mtime_ns: int, inode: int, content_hash: str):
+        self.update_manifest_many([(path, size, mtime_ns, inode, content_hash)])
+
+    def update_manifest_many(self, entries: List[Tuple[str, int, int, int, str]]):
+        """
+        Bulk manifest upsert of (path, size, mtime_ns, inode, content_hash) tuples.
+        """
+        now = datetime.now()
+        with self.conn:
+            self.conn.executemany("""
+                INSERT OR REPLACE INTO file_manifest (path, size, mtime_ns, inode, content_hash, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, [(*entry, now) for entry in entries])
+
+    def forget_files(self, paths: List[str]):
+        with self.conn:
+            self.conn.executemany("DELETE FROM file_manifest WHERE path = ?", [(path,) for path in paths])
+
+    def enqueue_paths(self, paths: List[str], now: float):
+        """
+        Queues changed paths. A path already queued keeps its original
+        enqueued_at (for lag) and gets a new updated_at.
+        """
+        with self.conn:
+            self.conn.executemany("""
+                INSERT INTO ingest_queue (path, enqueued_at, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT(path) DO UPDATE SET updated_at = excluded.updated_at
+            """, [(path, now, now) for path in paths])
+
+    def peek_queue(self, limit: int) -> List[Tuple[str, float]]:
+        cursor = self.conn.execute(
+            "SELECT path, enqueued_at FROM ingest_queue ORDER BY enqueued_at LIMIT ?", (limit,)
+        )
+        return cursor.fetchall()
+
+    def complete_paths(self, paths: List[str], taken_at: float):
+        """
+        Removes processed paths, except ones changed again after `taken_at`.
+        """
+        with self.conn:
+            self.conn.executemany(
+                "DELETE FROM ingest_queue WHERE path = ? AND updated_at <= ?", [(path, taken_at) for path in paths]
+            )
+
+    def queue_stats(self) -> Tuple[int, Optional[float]]:
+        """
+        Returns (queue depth, enqueued_at of the oldest queued path).
+        """
+        return self.conn.execute("SELECT COUNT(*), MIN(enqueued_at) FROM ingest_queue").fetchone()
+
+    def document_files(self) -> List[Tuple[str, str, str]]:
+        """
+        (document ID, file_path, file_hash) of every stored document.
+        """
+        return self.conn.execute("SELECT id, file_path, file_hash FROM documents").fetchall()
+
+    def count_documents(self) -> int:
+        return self.conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def list_documents(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """
+        Pages through documents, newest first, without loading metadata_json.
+        """
+        cursor = self.conn.execute("""
+            SELECT d.id, d.file_name, d.file_hash, d.ingested_at,
+                   (SELECT COUNT(*) FROM chunks c WHERE c.document_id = d.id)
+            FROM documents d
+            ORDER BY d.ingested_at DESC, d.id
+            LIMIT ? OFFSET ?
+        """, (limit, offset))
+        return [
+            {"id": doc_id, "file_name": file_name, "file_hash": file_hash,
+             "ingested_at": ingested_at, "chunk_count": chunk_count}
+            for doc_id, file_name, file_hash, ingested_at, chunk_count in cursor.fetchall()
+        ]
+
+    def sample_chunks(self, limit: int = 256) -> List[str]:
+        """
+        Contents of up to `limit` randomly chosen stored chunks.
+        """
+        cursor = self.conn.execute("SELECT content FROM chunks ORDER BY RANDOM() LIMIT ?", (limit,))
+        return [content for content, in cursor.fetchall()]
+
+    @staticmethod
+    def to_match_query(query: str) -> str:
+        """
+        Turns free text into an FTS5 query: every term is quoted (so punctuation
+        in identifiers like "ERR-4021" or "report_v2.pdf" is matched as a phrase),
+        quoted phrases are kept whole, and the terms are OR-ed for BM25 ranking.
+        """
+        terms = re.findall(r'"([^"]+)"|([^\s"]+)', query)
+        return " OR ".join(f'"{phrase or term}"' for phrase, term in terms)
+
+    def search_chunks(self, query: str, limit: int = 5) -> List[Dict]:
+        """
+        BM25 lexical search over chunk content. Results use the same shape as
+        Retriever.retrieve(): "bm25" is SQLite's BM25 rank (lower is better)
+        and "score" its negation (higher is better).
+        """
+        match_query = self.to_match_query(query)
+        if not match_query:
+            return []
 
         cursor = self.conn.cursor()
-        cursor.execute("SELECT id FROM documents WHERE file_hash = ?", (file_hash,))
-        return cursor.fetchone() is not None
\ No newline at end of file
+        cursor.execute("""
+            SELECT c.id, c.document_id, c.chunk_index, c.content, bm25(chunks_fts) AS rank, d.metadata_json
+            FROM chunks_fts
+            JOIN chunks c ON c.rowid = chunks_fts.rowid
+            LEFT JOIN documents d ON d.id = c.document_id
+            WHERE chunks_fts MATCH ?
+            ORDER BY rank
+            LIMIT ?
+        """, (match_query, limit))
+
+        results = []
+        for chunk_id, document_id, chunk_index, content, rank, metadata_json in cursor.fetchall():
+            metadata = json.loads(metadata_json) if metadata_json else {}
+            metadata.update({"parent_id": document_id, "chunk_index": chunk_index})
+            results.append({
+                "id": chunk_id,
+                "content": content,
+                "metadata": metadata,
+                "score": -rank,
+                "bm25": rank
+            })
+        return results
+
+    def rebuild_lexical_index(self):
+        with self.conn:
+            self.conn.execute("INSERT INTO chunks_fts(chunks_fts) VALUES ('rebuild')")
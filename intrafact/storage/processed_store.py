@@ -0,0 +1,459 @@
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Callable, List, Dict, Iterable, Iterator, Optional, Tuple
+from intrafact.config import (PROCESSED_DATA_DIR, PROCESSED_SEGMENT_MAX_BYTES, PROCESSED_FSYNC_EVERY,
+                              PROCESSED_COMPACT_RATIO)
+
+logger = logging.getLogger(__name__)
+
+SEGMENT_PATTERN = re.compile(r"objects-(\d{6})\.jsonl\.gz$")
+# zlib window bits for a gzip container
+GZIP_WBITS = 16 + zlib.MAX_WBITS
+COMPRESS_LEVEL = 6
+READ_BLOCK = 1 << 20
+# A document being written is compressed into memory up to this size, then spills to a temp file
+SPOOL_BYTES = 4 << 20
+
+class StoreLockedError(RuntimeError):
+    """
+    A write to a ProcessedStore opened read-only because another process
+    (or instance) holds its writer lock.
+    """
+
+def _line(record: Dict) -> bytes:
+    return (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+
+def _iter_records(view, offset: int, length: int) -> Iterator[Dict]:
+    # Decompresses one gzip member block by block, so a large document is never inflated at once
+    decompressor = zlib.decompressobj(GZIP_WBITS)
+    pending = b""
+    end = offset + length
+    for start in range(offset, end, READ_BLOCK):
+        pending += decompressor.decompress(view[start:min(start + READ_BLOCK, end)])
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            if line:
+                yield json.loads(line)
+    pending += decompressor.flush()
+    if pending.strip():
+        yield json.loads(pending)
+
+
+class ProcessedStore:
+    """
+    Append-only store of normalized documents (knowledge objects).
+
+    Each object is one gzip member in a segment file: a header line with its
+    ID and metadata, then one JSON line per (page_number, text) piece.
+    Segments are plain concatenated gzip, so `zcat objects-*.jsonl.gz` reads
+    them as JSONL. A SQLite index maps document IDs (and file hashes) to
+    (segment, offset, length); reads decompress straight from a memory-mapped
+    segment. Data is fsynced, and the index committed, every `fsync_every`
+    objects and on flush().
+
+    Storing a document again supersedes its old copy. Compaction copies the
+    live objects out of sealed segments that are at least `compact_ratio`
+    superseded and deletes those segments; start_compactor() runs it in the
+    background.
+
+    One instance at a time writes: it holds an exclusive lock on
+    objects.lock. Any other instance opens read-only, and its writes raise
+    StoreLockedError.
+    """
+
+    def __init__(self, path: Path = PROCESSED_DATA_DIR, segment_max_bytes: int = PROCESSED_SEGMENT_MAX_BYTES,
+                 fsync_every: int = PROCESSED_FSYNC_EVERY, compact_ratio: float = PROCESSED_COMPACT_RATIO):
+        self.path = Path(path)
+        self.segment_max_bytes = segment_max_bytes
+        self.fsync_every = max(fsync_every, 1)
+        self.compact_ratio = compact_ratio
+        # Re-entrant: compaction appends while holding it
+        self.lock = threading.RLock()
+        self.views = {}
+        self.unsynced = 0
+        self._compactor = None
+        self._stop = threading.Event()
+
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.read_only = not self._lock_writer()
+        self.conn = sqlite3.connect(str(self.path / "objects.db"), check_same_thread=False)
+        if self.read_only:
+            # The writer owns recovery and the schema; unindexed bytes are never read
+            self.file = None
+            return
+
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS objects (
+                doc_id TEXT PRIMARY KEY,
+                file_hash TEXT,
+                file_name TEXT,
+                segment INTEGER,
+                offset INTEGER,
+                length INTEGER,
+                pages INTEGER,
+                chars INTEGER,
+                stored_at REAL
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_objects_hash ON objects(file_hash)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_objects_location ON objects(segment, offset)")
+        self.conn.commit()
+
+        segments = self._segments()
+        self.active = segments[-1] if segments else 1
+        self._recover()
+        self.file = open(self._segment_path(self.active), "ab")
+        self.size = self.file.tell()
+
+    def _lock_writer(self) -> bool:
+        self.lock_file = open(self.path / "objects.lock", "a+")
+        try:
+            import fcntl
+        except ImportError:
+            # Windows: the single-writer lock is not enforced
+            return True
+        try:
+            fcntl.flock(self.lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.seek(0)
+            owner = self.lock_file.read().strip() or "unknown"
+            logger.warning(f"   ⚠️ Processed store {self.path} is being written by process {owner}; "
+                           f"opening it read-only")
+            return False
+        self.lock_file.truncate(0)
+        self.lock_file.write(str(os.getpid()))
+        self.lock_file.flush()
+        return True
+
+    def _check_writable(self):
+        if self.read_only:
+            raise StoreLockedError(f"Processed store {self.path} is open read-only: another process is "
+                                   f"writing it (stop it, or run this command there)")
+
+    def _segment_path(self, segment: int) -> Path:
+        return self.path / f"objects-{segment:06d}.jsonl.gz"
+
+    def _segments(self) -> List[int]:
+        return sorted(int(match.group(1)) for match in map(SEGMENT_PATTERN.match, os.listdir(self.path)) if match)
+
+    def _recover(self):
+        # Objects appended after the last index commit are not indexed: drop them
+        path = self._segment_path(self.active)
+        if not path.exists():
+            return
+        indexed_end = self.conn.execute(
+            "SELECT COALESCE(MAX(offset + length), 0) FROM objects WHERE segment = ?", (self.active,)
+        ).fetchone()[0]
+        size = path.stat().st_size
+        if size > indexed_end:
+            logger.warning(f"   ⚠️ Processed store: dropping {size - indexed_end} unindexed bytes "
+                           f"from {path.name}")
+            os.truncate(path, indexed_end)
+
+    def _sync(self):
+        if not self.unsynced:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.conn.commit()
+        self.unsynced = 0
+
+    def _rotate(self):
+        self._sync()
+        self.file.close()
+        self.active += 1
+        self.file = open(self._segment_path(self.active), "ab")
+        self.size = 0
+
+    def _append(self, doc_id: str, metadata: Dict, pages: int, chars: int, data, length: int,
+                stored_at: Optional[float] = None):
+        """
+        Appends one compressed object (bytes, or a file positioned at its
+        start) and points the index at it.
+        """
+        with self.lock:
+            if self.size and self.size + length > self.segment_max_bytes:
+                self._rotate()
+
+            offset = self.size
+            if isinstance(data, bytes):
+                self.file.write(data)
+            else:
+                shutil.copyfileobj(data, self.file)
+            # Visible to readers' mmaps; durable at the next sync
+            self.file.flush()
+            self.size = offset + length
+
+            self.conn.execute(
+                "INSERT OR REPLACE INTO objects VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (doc_id, metadata.get("file_hash"), metadata.get("file_name"), self.active, offset,
+                 length, pages, chars, stored_at or time.time())
+            )
+            self.unsynced += 1
+            if self.unsynced >= self.fsync_every:
+                self._sync()
+
+    def put(self, knowledge_object: Dict) -> Dict:
+        """
+        Stores a normalized document and returns it. An object with a
+        "content" string is written at once. An object with a "pages"
+        stream (TextNormalizer.normalize_pages) is returned with a stream
+        that writes each piece as it is read, and is stored once the stream
+        has been read to the end; pass the returned object on to the chunker.
+        """
+        self._check_writable()
+        header = {"id": knowledge_object["id"], "metadata": knowledge_object.get("metadata", {})}
+
+        if knowledge_object.get("pages") is None:
+            content = knowledge_object.get("content", "")
+            compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+            data = compressor.compress(_line(header))
+            if content:
+                data += compressor.compress(_line({"page": None, "text": content}))
+            data += compressor.flush()
+            self._append(header["id"], header["metadata"], int(bool(content)), len(content), data, len(data))
+            return knowledge_object
+
+        return {**knowledge_object, "pages": self._write_pages(header, knowledge_object["pages"])}
+
+    def _write_pages(self, header: Dict, pages: Iterable[Tuple[Optional[int], str]]
+                     ) -> Iterator[Tuple[Optional[int], str]]:
+        compressor = zlib.compressobj(COMPRESS_LEVEL, zlib.DEFLATED, GZIP_WBITS)
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+            spool.write(compressor.compress(_line(header)))
+            count = chars = 0
+            for page, text in pages:
+                spool.write(compressor.compress(_line({"page": page, "text": text})))
+                count += 1
+                chars += len(text)
+                yield page, text
+
+            # Only reached when the stream was read to the end: a document
+            # abandoned halfway is never stored
+            spool.write(compressor.flush())
+            length = spool.tell()
+            spool.seek(0)
+            self._append(header["id"], header["metadata"], count, chars, spool, length)
+
+    def _view(self, segment: int, end: int) -> mmap.mmap:
+        # Call with the lock held. A replaced view is not closed: readers may still use it
+        view = self.views.get(segment)
+        if view is None or len(view) < end:
+            with open(self._segment_path(segment), "rb") as f:
+                view = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.views[segment] = view
+        return view
+
+    def _locate(self, doc_id: str) -> Optional[Tuple]:
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT segment, offset, length FROM objects WHERE doc_id = ?", (doc_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            segment, offset, length = row
+            return self._view(segment, offset + length), offset, length
+
+    def _load(self, view, offset: int, length: int) -> Dict:
+        records = _iter_records(view, offset, length)
+        header = next(records)
+        return {
+            "id": header["id"],
+            "metadata": header["metadata"],
+            "pages": ((record["page"], record["text"]) for record in records)
+        }
+
+    def get(self, doc_id: str) -> Optional[Dict]:
+        """
+        The stored object for `doc_id`, with a lazy "pages" stream, or None.
+        """
+        location = self._locate(doc_id)
+        return self._load(*location) if location is not None else None
+
+    def contains(self, doc_id: str, file_hash: Optional[str] = None) -> bool:
+        """
+        True if `doc_id` is stored (from a file with `file_hash`, if given).
+        """
+        with self.lock:
+            row = self.conn.execute("SELECT file_hash FROM objects WHERE doc_id = ?", (doc_id,)).fetchone()
+        return row is not None and (file_hash is None or row[0] == file_hash)
+
+    def find_by_hash(self, file_hash: str) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute("SELECT doc_id FROM objects WHERE file_hash = ?", (file_hash,)).fetchall()
+        return [doc_id for doc_id, in rows]
+
+    def delete(self, doc_ids: List[str]):
+        """
+        Drops objects from the index; their bytes are reclaimed by compaction.
+        """
+        if not doc_ids:
+            return
+        self._check_writable()
+        with self.lock:
+            self.conn.executemany("DELETE FROM objects WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+            self.unsynced += 1
+            self._sync()
+
+    def import_json_objects(self, document_id: Callable[[Dict], Optional[str]]) -> int:
+        """
+        Moves the one-file-per-document JSON objects written by earlier
+        versions (in the store's directory) into the store, and returns how
+        many were imported. `document_id(knowledge_object)` gives the ID to
+        store each one under, or None to leave its file alone (e.g. a stale
+        copy of a file changed since). Imported files are deleted.
+        """
+        self._check_writable()
+        imported = []
+        for json_path in sorted(self.path.glob("*.json")):
+            try:
+                with open(json_path, encoding="utf-8") as f:
+                    knowledge_object = json.load(f)
+                doc_id = document_id(knowledge_object)
+            except Exception as e:
+                logger.error(f"   ❌ Failed to import {json_path.name}: {e}")
+                continue
+            if doc_id is None:
+                continue
+            if not self.contains(doc_id):
+                self.put({**knowledge_object, "id": doc_id, "pages": None})
+            imported.append(json_path)
+
+        # Deleted only once the objects are durable
+        self.flush()
+        for json_path in imported:
+            json_path.unlink()
+        if imported:
+            logger.info(f"   📥 Imported {len(imported)} JSON objects into the processed store")
+        return len(imported)
+
+    def iter_objects(self) -> Iterator[Dict]:
+        """
+        Yields every stored object (with a lazy "pages" stream) in storage
+        order, so the segments are read sequentially. Objects stored or
+        deleted during the export may or may not be included.
+        """
+        with self.lock:
+            doc_ids = [doc_id for doc_id, in self.conn.execute(
+                "SELECT doc_id FROM objects ORDER BY segment, offset"
+            )]
+        for doc_id in doc_ids:
+            # Located again: compaction may have moved it meanwhile
+            location = self._locate(doc_id)
+            if location is not None:
+                yield self._load(*location)
+
+    def __len__(self) -> int:
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+
+    def flush(self):
+        """
+        Makes every stored object durable.
+        """
+        if self.read_only:
+            return
+        with self.lock:
+            self._sync()
+
+    def _live_bytes(self) -> Dict[int, int]:
+        return dict(self.conn.execute("SELECT segment, SUM(length) FROM objects GROUP BY segment").fetchall())
+
+    def compact(self, ratio: Optional[float] = None) -> int:
+        """
+        Rewrites sealed segments of which at least `ratio` (compact_ratio by
+        default) is superseded or deleted, and returns the bytes reclaimed.
+        """
+        self._check_writable()
+        ratio = self.compact_ratio if ratio is None else ratio
+        reclaimed = 0
+
+        with self.lock:
+            self._sync()
+            live = self._live_bytes()
+            candidates = []
+            for segment in self._segments():
+                if segment == self.active:
+                    continue
+                size = self._segment_path(segment).stat().st_size
+                if size and 1 - live.get(segment, 0) / size >= ratio:
+                    candidates.append((segment, size))
+
+        for segment, size in candidates:
+            # One segment per lock hold, so writers are not blocked for the whole pass
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT doc_id, file_hash, file_name, offset, length, pages, chars, stored_at FROM objects "
+                    "WHERE segment = ? ORDER BY offset", (segment,)
+                ).fetchall()
+                view = self._view(segment, size) if rows else None
+                for doc_id, file_hash, file_name, offset, length, pages, chars, stored_at in rows:
+                    # The compressed bytes are copied as they are
+                    self._append(doc_id, {"file_hash": file_hash, "file_name": file_name}, pages, chars,
+                                 view[offset:offset + length], length, stored_at)
+                self.unsynced += 1
+                self._sync()
+
+                self.views.pop(segment, None)
+                os.remove(self._segment_path(segment))
+                moved = sum(row[4] for row in rows)
+                reclaimed += size - moved
+                logger.info(f"   🧹 Compacted processed segment {segment}: {len(rows)} objects kept, "
+                            f"{(size - moved) / 1e6:.1f} MB reclaimed")
+
+        return reclaimed
+
+    def start_compactor(self, interval: float):
+        """
+        Runs compact() every `interval` seconds on a daemon thread.
+        """
+        if self._compactor is not None or self.read_only:
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"❌ Processed store compaction failed: {e}")
+
+        self._compactor = threading.Thread(target=loop, name="intrafact-compact", daemon=True)
+        self._compactor.start()
+
+    def stats(self) -> Dict:
+        with self.lock:
+            objects = self.conn.execute("SELECT COUNT(*) FROM objects").fetchone()[0]
+            live = sum(self._live_bytes().values())
+            segments = self._segments()
+        size = sum(self._segment_path(segment).stat().st_size for segment in segments)
+        return {
+            "objects": objects,
+            "segments": len(segments),
+            "bytes": size,
+            "live_bytes": live,
+            "garbage_ratio": 1 - live / size if size else 0.0
+        }
+
+    def close(self):
+        self._stop.set()
+        if self._compactor is not None:
+            self._compactor.join()
+            self._compactor = None
+        with self.lock:
+            if self.file is not None:
+                self._sync()
+                self.file.close()
+            self.conn.close()
+            self.views.clear()
+            # Closing the file releases the writer lock
+            self.lock_file.close()
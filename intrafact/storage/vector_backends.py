@@ -0,0 +1,425 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+from pathlib import Path
+from typing import List, Dict, Iterator, Optional
+from intrafact.config import CHROMA_DB_DIR, VECTOR_INDEX_DIR, VECTOR_INDEX_DTYPE
+
+class VectorBackend(ABC):
+    """
+    Interface of the vector indexes behind VectorDB.
+
+    query() returns Chroma-shaped results: a dict of "ids", "documents",
+    "metadatas" and "distances", each holding one list per query vector.
+    `where` is an optional metadata filter in Chroma's syntax. get() and
+    iter_all() return "ids", "embeddings", "documents" and "metadatas" as
+    flat lists (embeddings as a float32 array, or None when not requested).
+    """
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings, documents: List[str], metadatas: List[Dict]):
+        ...
+
+    @abstractmethod
+    def query(self, query_embeddings, limit: int, where: Optional[Dict] = None) -> Dict:
+        ...
+
+    @abstractmethod
+    def update_metadata(self, ids: List[str], metadatas: List[Dict]):
+        ...
+
+    @abstractmethod
+    def delete(self, ids: Optional[List[str]] = None, where: Optional[Dict] = None):
+        ...
+
+    @abstractmethod
+    def count(self) -> int:
+        ...
+
+    @abstractmethod
+    def get(self, ids: List[str]) -> Dict:
+        ...
+
+    @abstractmethod
+    def iter_all(self, batch_size: int = 1000, embeddings: bool = True) -> Iterator[Dict]:
+        ...
+
+    @abstractmethod
+    def drop(self):
+        """
+        Deletes the collection and everything in it; the backend is unusable afterwards.
+        """
+        ...
+
+def _empty_rows() -> Dict:
+    return {"ids": [], "embeddings": None, "documents": [], "metadatas": []}
+
+
+class ChromaBackend(VectorBackend):
+
+    def __init__(self, collection_name: str, path: Path = CHROMA_DB_DIR):
+        import chromadb
+
+        self.client = chromadb.PersistentClient(path=str(path))
+        self.collection = self.client.get_or_create_collection(collection_name)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(
+            ids = ids,
+            embeddings= embeddings,
+            documents= documents,
+            metadatas= metadatas
+        )
+
+    def query(self, query_embeddings, limit, where=None):
+        return self.collection.query(
+            query_embeddings=query_embeddings,
+            n_results=limit,
+            where=where or None
+        )
+
+    def update_metadata(self, ids, metadatas):
+        self.collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids=None, where=None):
+        self.collection.delete(ids=ids, where=where or None)
+
+    def count(self):
+        return self.collection.count()
+
+    def _rows(self, result: Dict, embeddings: bool) -> Dict:
+        return {
+            "ids": result["ids"],
+            "embeddings": np.asarray(result["embeddings"], dtype=np.float32) if embeddings else None,
+            "documents": result["documents"],
+            "metadatas": result["metadatas"]
+        }
+
+    def get(self, ids):
+        if not ids:
+            return _empty_rows()
+        return self._rows(self.collection.get(ids=ids, include=["embeddings", "documents", "metadatas"]), True)
+
+    def iter_all(self, batch_size=1000, embeddings=True):
+        include = ["embeddings", "documents", "metadatas"] if embeddings else ["documents", "metadatas"]
+        offset = 0
+        while True:
+            result = self.collection.get(limit=batch_size, offset=offset, include=include)
+            if not result["ids"]:
+                return
+            yield self._rows(result, embeddings)
+            offset += len(result["ids"])
+
+    def drop(self):
+        self.client.delete_collection(self.collection.name)
+
+
+class NumpyBackend(VectorBackend):
+    """
+    Exact in-process index over a memory-mapped matrix of unit-normalized
+    embeddings, stored as float16 or as int8 with one float32 scale per row.
+
+    Rows live in fixed-size files that are opened with np.memmap, and a
+    SQLite sidecar maps rows to ids, documents and metadata, so reopening the
+    index reads nothing up front. Deleted rows are refilled by later
+    upserts, so the files track the live row count. Search is a blocked matrix product followed
+    by argpartition. Distances are squared L2 between unit vectors
+    (2 - 2 * cosine), the same scale as Chroma's default metric.
+    """
+
+    BLOCK_ROWS = 65536
+
+    def __init__(self, collection_name: str, path: Path = VECTOR_INDEX_DIR, dtype: str = VECTOR_INDEX_DTYPE):
+        if dtype not in ("float16", "int8"):
+            raise ValueError("dtype must be 'float16' or 'int8'")
+
+        self.dir = Path(path) / collection_name
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+
+        self.conn = sqlite3.connect(str(self.dir / "rows.db"), check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS rows (
+                row INTEGER PRIMARY KEY,
+                id TEXT UNIQUE,
+                document TEXT,
+                metadata_json TEXT
+            )
+        """)
+        self.conn.commit()
+
+        info_path = self.dir / "index.json"
+        if info_path.exists():
+            self.info = json.loads(info_path.read_text())
+        else:
+            self.info = {"dtype": dtype, "dim": None, "capacity": 0, "size": 0}
+
+        self.dtype = np.dtype(self.info["dtype"])
+        self.vectors = self.scales = self.valid = None
+        if self.info["dim"]:
+            self._map_files()
+
+    def _save_info(self):
+        (self.dir / "index.json").write_text(json.dumps(self.info))
+
+    def _map_files(self):
+        capacity, dim = self.info["capacity"], self.info["dim"]
+        self.vectors = np.memmap(self.dir / "vectors.bin", dtype=self.dtype, mode="r+", shape=(capacity, dim))
+        self.scales = np.memmap(self.dir / "scales.bin", dtype=np.float32, mode="r+", shape=(capacity,))
+        self.valid = np.memmap(self.dir / "valid.bin", dtype=np.bool_, mode="r+", shape=(capacity,))
+
+    def _reserve(self, rows_needed: int, dim: int):
+        if self.info["dim"] is None:
+            self.info["dim"] = dim
+        elif self.info["dim"] != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match index dimension {self.info['dim']}")
+
+        if rows_needed <= self.info["capacity"]:
+            return
+
+        capacity = max(rows_needed, 2 * self.info["capacity"], 1024)
+        for name, row_bytes in (("vectors.bin", dim * self.dtype.itemsize), ("scales.bin", 4), ("valid.bin", 1)):
+            file_path = self.dir / name
+            file_path.touch()
+            os.truncate(file_path, capacity * row_bytes)
+
+        self.vectors = self.scales = self.valid = None
+        self.info["capacity"] = capacity
+        self._save_info()
+        self._map_files()
+
+    def _encode_rows(self, embeddings: np.ndarray):
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        unit = embeddings / np.maximum(norms, 1e-12)
+
+        if self.dtype == np.int8:
+            scales = np.abs(unit).max(axis=1) / 127.0
+            quantized = np.rint(unit / np.maximum(scales, 1e-12)[:, None]).astype(np.int8)
+            return quantized, scales.astype(np.float32)
+
+        return unit.astype(np.float16), np.ones(len(unit), dtype=np.float32)
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+
+        with self.lock:
+            existing = dict(self._rows_for_ids(ids))
+            size = self.info["size"]
+
+            # Rows freed by delete() are refilled before the index grows
+            free = iter(np.flatnonzero(~self.valid[:size]).tolist() if self.valid is not None else [])
+            rows = []
+            for chunk_id in ids:
+                if chunk_id not in existing:
+                    row = next(free, None)
+                    if row is None:
+                        row = size
+                        size += 1
+                    existing[chunk_id] = row
+                rows.append(existing[chunk_id])
+
+            self._reserve(size, embeddings.shape[1])
+            values, scales = self._encode_rows(embeddings)
+            self.vectors[rows] = values
+            self.scales[rows] = scales
+            self.valid[rows] = True
+            for mapped in (self.vectors, self.scales, self.valid):
+                mapped.flush()
+
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO rows (row, id, document, metadata_json) VALUES (?, ?, ?, ?)",
+                [(row, chunk_id, document, json.dumps(metadata))
+                 for row, chunk_id, document, metadata in zip(rows, ids, documents, metadatas)]
+            )
+            self.conn.commit()
+
+            self.info["size"] = size
+            self._save_info()
+
+    def _rows_for_ids(self, ids: List[str]):
+        found = []
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            found.extend(self.conn.execute(
+                f"SELECT id, row FROM rows WHERE id IN ({placeholders})", batch
+            ).fetchall())
+        return found
+
+    def _rows_for_where(self, where: Dict) -> List[int]:
+        """
+        Rows matching a flat {key: value} equality filter.
+        """
+        clauses, params = [], []
+        for key, value in where.items():
+            if key.startswith("$") or isinstance(value, dict):
+                raise ValueError("NumpyBackend only supports flat {key: value} equality filters")
+            clauses.append("json_extract(metadata_json, ?) = ?")
+            params.extend([f'$."{key}"', value])
+
+        return [row for (row,) in self.conn.execute(
+            f"SELECT row FROM rows WHERE {' AND '.join(clauses)}", params
+        )]
+
+    def _allowed_rows(self, where: Dict) -> np.ndarray:
+        mask = np.zeros(self.info["capacity"], dtype=np.bool_)
+        mask[self._rows_for_where(where)] = True
+        return mask
+
+    def _top_k(self, queries: np.ndarray, limit: int, allowed: Optional[np.ndarray] = None):
+        size = self.info["size"]
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+
+        for start in range(0, size, self.BLOCK_ROWS):
+            end = min(start + self.BLOCK_ROWS, size)
+            scores = queries @ self.vectors[start:end].astype(np.float32).T
+            scores *= self.scales[start:end]
+            scores[:, ~self.valid[start:end]] = -np.inf
+            if allowed is not None:
+                scores[:, ~allowed[start:end]] = -np.inf
+
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(np.arange(start, end), scores.shape)], axis=1)
+
+            if best_scores.shape[1] > limit:
+                keep = np.argpartition(-best_scores, limit - 1, axis=1)[:, :limit]
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+
+        order = np.argsort(-best_scores, axis=1)
+        return np.take_along_axis(best_scores, order, axis=1), np.take_along_axis(best_rows, order, axis=1)
+
+    def query(self, query_embeddings, limit, where=None):
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        with self.lock:
+            if self.vectors is None or limit <= 0:
+                scores = rows = np.empty((len(queries), 0))
+            else:
+                allowed = self._allowed_rows(where) if where else None
+                scores, rows = self._top_k(queries, limit, allowed)
+
+            for query_scores, query_rows in zip(scores, rows):
+                hits = [(int(row), float(score)) for row, score in zip(query_rows, query_scores) if np.isfinite(score)]
+                stored = {}
+                if hits:
+                    placeholders = ",".join("?" * len(hits))
+                    for row, chunk_id, document, metadata_json in self.conn.execute(
+                        f"SELECT row, id, document, metadata_json FROM rows WHERE row IN ({placeholders})",
+                        [row for row, _ in hits]
+                    ):
+                        stored[row] = (chunk_id, document, json.loads(metadata_json))
+
+                hits = [(row, score) for row, score in hits if row in stored]
+                results["ids"].append([stored[row][0] for row, _ in hits])
+                results["documents"].append([stored[row][1] for row, _ in hits])
+                results["metadatas"].append([stored[row][2] for row, _ in hits])
+                results["distances"].append([max(0.0, 2.0 - 2.0 * score) for _, score in hits])
+
+        return results
+
+    def update_metadata(self, ids, metadatas):
+        with self.lock:
+            self.conn.executemany(
+                "UPDATE rows SET metadata_json = ? WHERE id = ?",
+                [(json.dumps(metadata), chunk_id) for chunk_id, metadata in zip(ids, metadatas)]
+            )
+            self.conn.commit()
+
+    def delete(self, ids=None, where=None):
+        with self.lock:
+            rows = [row for _, row in self._rows_for_ids(ids)] if ids else []
+            if where:
+                rows.extend(self._rows_for_where(where))
+            if not rows:
+                return
+            self.valid[rows] = False
+            self.valid.flush()
+            self.conn.executemany("DELETE FROM rows WHERE row = ?", [(row,) for row in rows])
+            self.conn.commit()
+
+    def count(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM rows").fetchone()[0]
+
+    def _read_rows(self, records: List[tuple], embeddings: bool) -> Dict:
+        # records are (row, id, document, metadata_json); call with the lock held
+        rows = [record[0] for record in records]
+        vectors = None
+        if embeddings:
+            if rows:
+                # Unit vectors, decoded from the stored float16/int8 rows
+                vectors = self.vectors[rows].astype(np.float32) * self.scales[rows][:, None]
+            else:
+                vectors = np.empty((0, self.info["dim"] or 0), dtype=np.float32)
+        return {
+            "ids": [record[1] for record in records],
+            "embeddings": vectors,
+            "documents": [record[2] for record in records],
+            "metadatas": [json.loads(record[3]) for record in records]
+        }
+
+    def get(self, ids):
+        with self.lock:
+            records = []
+            for i in range(0, len(ids), 500):
+                batch = ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                records.extend(self.conn.execute(
+                    f"SELECT row, id, document, metadata_json FROM rows WHERE id IN ({placeholders}) ORDER BY row",
+                    batch
+                ).fetchall())
+            return self._read_rows(records, True)
+
+    def iter_all(self, batch_size=1000, embeddings=True):
+        last_row = -1
+        while True:
+            with self.lock:
+                records = self.conn.execute(
+                    "SELECT row, id, document, metadata_json FROM rows WHERE row > ? ORDER BY row LIMIT ?",
+                    (last_row, batch_size)
+                ).fetchall()
+                if not records:
+                    return
+                batch = self._read_rows(records, embeddings)
+            yield batch
+            last_row = records[-1][0]
+
+    def drop(self):
+        with self.lock:
+            self.conn.close()
+            self.vectors = self.scales = self.valid = None
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+
+def create_backend(name: str, collection_name: str, path: Optional[Path] = None) -> VectorBackend:
+    if name == "chroma":
+        return ChromaBackend(collection_name, path=path or CHROMA_DB_DIR)
+    if name == "numpy":
+        return NumpyBackend(collection_name, path=path or VECTOR_INDEX_DIR)
+    raise ValueError(f"Unknown vector backend: {name}")
+
+def list_collections(name: str, path: Optional[Path] = None) -> List[str]:
+    """
+    Names of the collections stored by backend `name`.
+    """
+    if name == "chroma":
+        import chromadb
+
+        client = chromadb.PersistentClient(path=str(path or CHROMA_DB_DIR))
+        # Collection objects in older chromadb releases, names in newer ones
+        return [getattr(collection, "name", collection) for collection in client.list_collections()]
+    if name == "numpy":
+        root = Path(path or VECTOR_INDEX_DIR)
+        if not root.exists():
+            return []
+        return sorted(entry.name for entry in root.iterdir() if (entry / "rows.db").exists())
+    raise ValueError(f"Unknown vector backend: {name}")
+
@@ -1,46 +1,409 @@
-import chromadb
-from typing import List, Dict
-from intrafact.config import CHROMA_DB_DIR
+import heapq
+import logging
+import os
+import re
+import threading
+import zlib
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from pathlib import Path
+from typing import List, Dict, Optional, Union
+from intrafact.config import (CHROMA_DB_DIR, VECTOR_INDEX_DIR, VECTOR_BACKEND, VECTOR_PARTITION_KEY,
+                              VECTOR_PARTITION_TIME_BUCKET, VECTOR_PARTITION_SHARDS, VECTOR_SEARCH_WORKERS)
+from intrafact.storage.vector_backends import VectorBackend, create_backend, list_collections
+from intrafact import telemetry
+
+logger = logging.getLogger(__name__)
+
+# Corpus generation per collection. Bumped on every write so caches holding
+# search results (e.g. in Retriever) know when to invalidate, even when the
+# writer is a different VectorDB instance or process. It is persisted as the
+# size of "<collection_name>.generation" next to the collections (one byte
+# appended per write); a VectorDB given a backend instance has no directory
+# and falls back to this process-wide counter.
+_generations: Dict[str, int] = {}
+_generations_lock = threading.Lock()
+
+PARTITION_SCHEMES = ("none", "source_type", "file_type", "time", "hash")
+TIME_BUCKET_FORMATS = {"year": "%Y", "month": "%Y-%m", "day": "%Y-%m-%d"}
+# A partition is named "<scheme>.<key>" (e.g. "file_type.pdf") and stored as
+# the collection "<collection_name>__<scheme>.<key>". A rebuilt partition (or
+# unpartitioned collection) gets the suffix ".r<version>".
+PARTITION_SEPARATOR = "__"
+VERSION_PATTERN = re.compile(r"\.r(\d+)$")
+
+def partition_key(metadata: Dict, scheme: str, time_bucket: str = VECTOR_PARTITION_TIME_BUCKET,
+                  shards: int = VECTOR_PARTITION_SHARDS) -> Optional[str]:
+    """
+    The partition a chunk belongs to under `scheme`, derived from its
+    metadata, or None for the single unpartitioned collection.
+    """
+    if scheme == "none":
+        return None
+    if scheme in ("source_type", "file_type"):
+        value = str(metadata.get(scheme) or "unknown").lstrip(".")
+    elif scheme == "time":
+        mtime_ns = metadata.get("file_mtime_ns")
+        if mtime_ns is None:
+            value = "unknown"
+        else:
+            value = datetime.fromtimestamp(mtime_ns / 1e9, timezone.utc).strftime(TIME_BUCKET_FORMATS[time_bucket])
+    elif scheme == "hash":
+        value = f"shard{zlib.crc32(str(metadata.get('parent_id', '')).encode('utf-8')) % shards:03d}"
+    else:
+        raise ValueError(f"Unknown partition scheme: {scheme}")
+
+    # Valid as a Chroma collection name and as a directory name
+    return re.sub(r"[^A-Za-z0-9_-]", "_", value).strip("_-") or "unknown"
+
+def _take(values, indices: List[int]):
+    if isinstance(values, np.ndarray):
+        return values[indices]
+    return [values[i] for i in indices]
+
+def _empty_results(num_queries: int) -> Dict:
+    return {key: [[] for _ in range(num_queries)] for key in ("ids", "documents", "metadatas", "distances")}
+
 
 class VectorDB:
-    def __init__(self, collection_name: str = "intrafact_store"):
+    """
+    Chunk vectors, in one collection or split into partitions by a key
+    derived from each chunk's metadata (see partition_key()).
+
+    Writes go to the partition of each chunk's current key; a chunk whose key
+    changed (e.g. its file was edited in a new time bucket, or the scheme
+    changed) is moved, with its vector, when its metadata is next updated.
+    Deletes and searches cover every partition, searches on a thread pool
+    with the per-partition top-k lists merged by distance. Partitions can be
+    listed, dropped and rebuilt on their own; writes wait while one is.
+    """
+
+    def __init__(self, collection_name: str = "intrafact_store", backend: Union[str, VectorBackend] = VECTOR_BACKEND,
+                 partition_by: str = VECTOR_PARTITION_KEY, path: Optional[Path] = None,
+                 search_workers: int = VECTOR_SEARCH_WORKERS):
+
+        logger.info(f"....Initialising {collection_name}....")
+        if partition_by not in PARTITION_SCHEMES:
+            raise ValueError(f"partition_by must be one of {', '.join(PARTITION_SCHEMES)}")
+
+        self.collection_name = collection_name
+        self.partition_by = partition_by
+        self.path = path
+        self.search_workers = search_workers
+        self.lock = threading.Lock()
+        # Held by writes, and by drop/rebuild_partition for their whole run
+        self.write_lock = threading.RLock()
+        self._pool = None
+        self.versions: Dict[Optional[str], int] = {}
+        self.generation_path: Optional[Path] = None
+
+        if isinstance(backend, VectorBackend):
+            if partition_by != "none":
+                raise ValueError("Partitioning needs a backend name, so partitions can be created")
+            self.backend_name = None
+            self.partitions: Dict[Optional[str], VectorBackend] = {None: backend}
+            return
+
+        # Every existing partition is opened, whatever the current scheme, so
+        # data written under an earlier scheme is still searched (and moved)
+        self.backend_name = backend
+        self.partitions = {}
+        root = Path(path or (CHROMA_DB_DIR if backend == "chroma" else VECTOR_INDEX_DIR))
+        root.mkdir(parents=True, exist_ok=True)
+        self.generation_path = root / f"{collection_name}.generation"
+        found = {}
+        for name in list_collections(backend, path):
+            parsed = self._parse_collection(name)
+            if parsed is not None:
+                found.setdefault(parsed[0], []).append(parsed[1])
+        for partition, versions in found.items():
+            # Two versions: a rebuild was interrupted before the old one was
+            # dropped, and the old one is still complete
+            self.versions[partition] = min(versions)
+            self._partition(partition)
+            for version in sorted(versions)[1:]:
+                logger.warning(f"   ⚠️ Dropping the unfinished rebuild of partition {partition or '(unpartitioned)'}")
+                create_backend(backend, self._collection(partition, version), path).drop()
+        if partition_by == "none":
+            self._partition(None)
+        if len(self.partitions) > 1:
+            logger.info(f"....{len(self.partitions)} partitions ({partition_by})....")
+
+    def _collection(self, partition: Optional[str], version: int = 0) -> str:
+        name = self.collection_name if partition is None else f"{self.collection_name}{PARTITION_SEPARATOR}{partition}"
+        return f"{name}.r{version}" if version else name
+
+    def _parse_collection(self, name: str) -> Optional[tuple]:
+        # (partition, version) of one of this store's collections, else None
+        match = VERSION_PATTERN.search(name)
+        if match:
+            parsed = self._parse_collection(name[:match.start()])
+            if parsed is not None:
+                return parsed[0], int(match.group(1))
+        if name == self.collection_name:
+            return None, 0
+        prefix = self.collection_name + PARTITION_SEPARATOR
+        scheme, _, key = name[len(prefix):].partition(".")
+        if name.startswith(prefix) and scheme in PARTITION_SCHEMES and key and "." not in key:
+            return f"{scheme}.{key}", 0
+        return None
+
+    def _partition_of(self, metadata: Dict) -> Optional[str]:
+        key = partition_key(metadata, self.partition_by)
+        return None if key is None else f"{self.partition_by}.{key}"
+
+    def _partition(self, partition: Optional[str]) -> VectorBackend:
+        with self.lock:
+            backend = self.partitions.get(partition)
+            if backend is None:
+                name = self._collection(partition, self.versions.get(partition, 0))
+                backend = self.partitions[partition] = create_backend(self.backend_name, name, self.path)
+            return backend
+
+    def _backends(self) -> List[VectorBackend]:
+        with self.lock:
+            return list(self.partitions.values())
 
-        print(f"....Initialising {collection_name}....")
-        self.client = chromadb.PersistentClient(path=str(CHROMA_DB_DIR))
-        self.collection = self.client.get_or_create_collection(collection_name)
+    def _group(self, metadatas: List[Dict]) -> Dict[Optional[str], List[int]]:
+        groups = {}
+        for index, metadata in enumerate(metadatas):
+            groups.setdefault(self._partition_of(metadata), []).append(index)
+        return groups
 
-    def add_chunks(self, chunks: List[Dict]):
+    def add_chunks(self, chunks: List[Dict], embeddings=None):
+        """
+        Upserts chunks. Embeddings are taken from each chunk's "embedding" key
+        unless passed separately (e.g. as one NumPy array for the whole batch).
+        """
         if not chunks:
             return
-        
+
         ids = [c["id"] for c in chunks]
-        embeddings = [c["embedding"] for c in chunks]
+        if embeddings is None:
+            embeddings = [c["embedding"] for c in chunks]
         documents = [c["content"] for c in chunks]
+        metadatas = [self._chunk_metadata(c) for c in chunks]
+
+        groups = self._group(metadatas)
+        with self.write_lock, telemetry.span("vector_add", chunks=len(chunks), partitions=len(groups)):
+            for partition, indices in groups.items():
+                if len(groups) == 1:
+                    self._partition(partition).upsert(ids, embeddings, documents, metadatas)
+                else:
+                    self._partition(partition).upsert(_take(ids, indices), _take(embeddings, indices),
+                                                _take(documents, indices), _take(metadatas, indices))
+        self._bump_generation()
+        logger.info(f"....Stored {len(chunks)} vectors in VectorDB....")
+
+    @staticmethod
+    def _chunk_metadata(chunk: Dict) -> Dict:
+        meta = chunk["metadata"].copy()
+        if "parent_id" in chunk:
+            meta["parent_id"] = chunk["parent_id"]
+        if "chunk_index" in chunk:
+            meta["chunk_index"] = chunk["chunk_index"]
+        return meta
+
+    def update_chunk_metadata(self, chunks: List[Dict]):
+        """
+        Rewrites the metadata of already stored chunks (e.g. a new chunk_index
+        after an edit earlier in the document) without re-embedding them.
+        Chunks whose partition key changed move to their new partition.
+        """
+        if not chunks:
+            return
+
+        metadatas = {c["id"]: self._chunk_metadata(c) for c in chunks}
+        ids = list(metadatas)
+        with self.write_lock:
+            for partition, indices in self._group([metadatas[chunk_id] for chunk_id in ids]).items():
+                target = self._partition(partition)
+                group_ids = _take(ids, indices)
+
+                # Chunks stored in another partition move here with their vectors
+                with self.lock:
+                    others = [backend for other, backend in self.partitions.items() if other != partition]
+                for other in others:
+                    found = other.get(group_ids)
+                    if found["ids"]:
+                        target.upsert(found["ids"], found["embeddings"], found["documents"],
+                                      [metadatas[chunk_id] for chunk_id in found["ids"]])
+                        other.delete(ids=found["ids"])
+
+                target.update_metadata(group_ids, [metadatas[chunk_id] for chunk_id in group_ids])
+        self._bump_generation()
+
+    def delete_chunks(self, ids: List[str]):
+        if not ids:
+            return
+
+        with self.write_lock, telemetry.span("vector_delete", chunks=len(ids)):
+            for backend in self._backends():
+                backend.delete(ids=ids)
+        self._bump_generation()
+        logger.info(f"....Deleted {len(ids)} vectors from VectorDB....")
+
+    def delete_document(self, parent_id: str):
+        """
+        Deletes every vector of a document, whether or not its chunk IDs are known.
+        """
+        with self.write_lock:
+            for backend in self._backends():
+                backend.delete(where={"parent_id": parent_id})
+        self._bump_generation()
+
+    def _bump_generation(self):
+        if self.generation_path is None:
+            with _generations_lock:
+                _generations[self.collection_name] = _generations.get(self.collection_name, 0) + 1
+            return
+        # O_APPEND writes are atomic, so concurrent writers never lose a bump
+        fd = os.open(self.generation_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, b".")
+        finally:
+            os.close(fd)
+
+    @property
+    def generation(self) -> int:
+        if self.generation_path is None:
+            return _generations.get(self.collection_name, 0)
+        try:
+            return self.generation_path.stat().st_size
+        except FileNotFoundError:
+            return 0
 
-        metadatas = []
-        for c in chunks:
-            meta = c["metadata"].copy()
-            if "parent_id" in c:
-                meta["parent_id"] = c["parent_id"]
-            metadatas.append(meta)
-
-        self.collection.upsert(
-            ids = ids,
-            embeddings= embeddings,
-            documents= documents,
-            metadatas= metadatas
-        )
-        print(f"....Stored {len(chunks)} vectors in VectorDB....")
-     
     def count(self):
-            return self.collection.count()
-    
-    def search(self, query_vector: List[float], limit: int = 5):
-
-        results = self.collection.query(
-            query_embeddings=[query_vector],
-            n_results=limit
-        )
+            return sum(backend.count() for backend in self._backends())
+
+    def search(self, query_vector: List[float], limit: int = 5, where: Optional[Dict] = None):
+
+        results = self.search_many([query_vector], limit, where=where)
         return results
-        
-    
+
+    def _search_targets(self, where: Optional[Dict]) -> List[VectorBackend]:
+        # A filter on the partition key itself skips the current scheme's other
+        # partitions; data not yet moved out of other schemes' is still searched
+        value = (where or {}).get(self.partition_by)
+        if self.partition_by in ("source_type", "file_type") and isinstance(value, str):
+            wanted = self._partition_of({self.partition_by: value})
+            prefix = f"{self.partition_by}."
+            with self.lock:
+                return [backend for partition, backend in self.partitions.items()
+                        if partition == wanted or not (partition or "").startswith(prefix)]
+        return self._backends()
+
+    def search_many(self, query_vectors: List[List[float]], limit: int = 5, where: Optional[Dict] = None):
+        """
+        One backend query for many vectors; result lists are in input order.
+        With several partitions, they are queried in parallel and each
+        query's hits merged into the overall top `limit`.
+        """
+        if not len(query_vectors):
+            return {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        backends = self._search_targets(where)
+        if not backends:
+            return _empty_results(len(query_vectors))
+        if len(backends) == 1:
+            return backends[0].query(query_vectors, limit, where=where)
+
+        if self._pool is None:
+            with self.lock:
+                if self._pool is None:
+                    self._pool = ThreadPoolExecutor(max_workers=self.search_workers,
+                                                    thread_name_prefix="intrafact-search")
+        results = list(self._pool.map(lambda backend: backend.query(query_vectors, limit, where=where), backends))
+
+        merged = _empty_results(len(query_vectors))
+        for q in range(len(query_vectors)):
+            # Each partition's hits are sorted by distance, so a k-way heap merge yields the global top-k
+            hits = heapq.merge(
+                *(zip(r["distances"][q], r["ids"][q], r["documents"][q], r["metadatas"][q]) for r in results),
+                key=lambda hit: hit[0]
+            )
+            for distance, chunk_id, document, metadata in islice(hits, limit):
+                merged["distances"][q].append(distance)
+                merged["ids"][q].append(chunk_id)
+                merged["documents"][q].append(document)
+                merged["metadatas"][q].append(metadata)
+        return merged
+
+    def list_partitions(self) -> Dict[Optional[str], int]:
+        """
+        Vector count per partition name (None: the unpartitioned collection).
+        """
+        with self.lock:
+            partitions = list(self.partitions.items())
+        return {key: backend.count() for key, backend in sorted(partitions, key=lambda item: item[0] or "")}
+
+    def add_partition(self, key: str) -> VectorBackend:
+        """
+        Creates an empty partition for `key` under the current scheme (writes
+        create theirs on demand).
+        """
+        if self.partition_by == "none":
+            raise ValueError("The collection is not partitioned")
+        return self._partition(f"{self.partition_by}.{key}")
+
+    def drop_partition(self, partition: Optional[str]) -> List[str]:
+        """
+        Deletes a partition and every vector in it (e.g. to age out an old
+        time bucket). Returns the IDs of the documents that had chunks in it,
+        so the caller can remove them from the other stores as well (see
+        IncrementalIndexer.remove_documents).
+        """
+        with self.write_lock:
+            with self.lock:
+                backend = self.partitions.pop(partition, None)
+                self.versions.pop(partition, None)
+            if backend is None:
+                raise KeyError(f"No partition {partition!r} in {self.collection_name}")
+
+            doc_ids = sorted({metadata.get("parent_id") for batch in backend.iter_all(embeddings=False)
+                              for metadata in batch["metadatas"] if metadata.get("parent_id")})
+            backend.drop()
+        self._bump_generation()
+        logger.info(f"....Dropped partition {partition} ({len(doc_ids)} documents)....")
+        return doc_ids
+
+    def rebuild_partition(self, partition: Optional[str], embedder=None) -> int:
+        """
+        Copies a partition into a new collection, reclaiming the space of
+        deleted vectors, and returns its vector count. With an `embedder`, the
+        chunks are re-encoded instead (e.g. after changing the model).
+        Searches use the old copy until the new one replaces it; writes wait.
+        If the copy fails, the old one is kept. Other processes must not have
+        the store open meanwhile: they would drop the unfinished copy.
+        """
+        if self.backend_name is None:
+            raise ValueError("Rebuilding needs a backend name, so a new collection can be created")
+
+        with self.write_lock:
+            with self.lock:
+                backend = self.partitions.get(partition)
+                version = self.versions.get(partition, 0) + 1
+            if backend is None:
+                raise KeyError(f"No partition {partition!r} in {self.collection_name}")
+
+            rebuilt = create_backend(self.backend_name, self._collection(partition, version), self.path)
+            count = 0
+            try:
+                for batch in backend.iter_all(embeddings=embedder is None):
+                    embeddings = embedder.encode(batch["documents"]) if embedder is not None else batch["embeddings"]
+                    rebuilt.upsert(batch["ids"], embeddings, batch["documents"], batch["metadatas"])
+                    count += len(batch["ids"])
+            except BaseException:
+                rebuilt.drop()
+                raise
+
+            with self.lock:
+                self.partitions[partition] = rebuilt
+                self.versions[partition] = version
+            backend.drop()
+        self._bump_generation()
+
+        logger.info(f"....Rebuilt partition {partition or '(unpartitioned)'} ({count} vectors)....")
+        return count
@@ -0,0 +1,308 @@
+"""
+In-process tracing, metrics and logging setup.
+
+Stages run inside spans (`with telemetry.span("embed", chunks=n):`). A span
+records its duration in a latency histogram, adds its numeric attributes to
+counters, and, when TRACE_PATH is set, is written to a JSONL trace file.
+Spans nest through a context variable, so the root span of a trace (e.g. one
+answered question) gets a breakdown of where its time went. Metrics can be
+exported in the Prometheus text format or as JSON.
+"""
+import contextvars
+import itertools
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+from intrafact.config import LOG_LEVEL, LOG_FORMAT, TRACE_PATH
+
+# Upper bounds in seconds, from sub-millisecond cache hits to minute-long LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+SPAN_SECONDS = "intrafact_span_seconds"
+# Numeric span attributes that describe rather than count, so are not summed
+UNCOUNTED_ATTRIBUTES = {"batch_size", "time_to_first_token", "partitions"}
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    """
+    Sends the "intrafact" loggers to stdout at `level`. Safe to call again
+    to change the level.
+    """
+    logger = logging.getLogger("intrafact")
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(logging.Formatter(fmt))
+        logger.addHandler(handler)
+        logger.propagate = False
+    logger.setLevel(level)
+
+
+class Histogram:
+    """
+    Fixed-bucket latency histogram; percentiles are interpolated within a bucket.
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        index = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+        self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                return min(lower + (upper - lower) * (rank - seen) / count, self.max)
+            seen += count
+        return self.max
+
+
+class Metrics:
+    """
+    Process-wide histograms and counters, keyed by name and label set.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, tuple], float] = {}
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def count(self, name: str, value: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def reset(self):
+        with self.lock:
+            self.histograms.clear()
+            self.counters.clear()
+
+    def snapshot(self) -> Dict:
+        with self.lock:
+            histograms = [
+                {"name": name, "labels": dict(labels), "count": h.count, "sum": h.sum, "max": h.max,
+                 "p50": h.percentile(50), "p95": h.percentile(95), "p99": h.percentile(99)}
+                for (name, labels), h in sorted(self.histograms.items())
+            ]
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self.counters.items())]
+        return {"histograms": histograms, "counters": counters}
+
+    def stage_summary(self) -> Dict[str, Dict]:
+        """
+        Span latency per stage name, in milliseconds.
+        """
+        return {
+            row["labels"]["span"]: {"count": row["count"], "total_ms": row["sum"] * 1000,
+                                    "p50_ms": row["p50"] * 1000, "p95_ms": row["p95"] * 1000,
+                                    "p99_ms": row["p99"] * 1000}
+            for row in self.snapshot()["histograms"] if row["name"] == SPAN_SECONDS
+        }
+
+    def prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (other, labels), h in sorted(self.histograms.items()):
+                    if other != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(list(h.buckets) + [math.inf], h.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == math.inf else repr(bound)
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(labels)} {h.sum}")
+                    lines.append(f"{name}_count{_labels(labels)} {h.count}")
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (other, labels), value in sorted(self.counters.items()):
+                    if other == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + "}"
+
+metrics = Metrics()
+
+
+class _TraceWriter:
+    def __init__(self, path: str):
+        self.lock = threading.Lock()
+        self.file = open(path, "a", encoding="utf-8")
+
+    def write(self, record: Dict, flush: bool):
+        line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+        with self.lock:
+            self.file.write(line)
+            if flush:
+                self.file.flush()
+
+_writer: Optional[_TraceWriter] = None
+_writer_lock = threading.Lock()
+
+def set_trace_path(path: Optional[str]):
+    """
+    Starts appending finished spans to `path` (JSONL), or stops with None.
+    """
+    global _writer
+    with _writer_lock:
+        if _writer is not None:
+            _writer.file.close()
+        _writer = _TraceWriter(path) if path else None
+
+if TRACE_PATH:
+    set_trace_path(TRACE_PATH)
+
+_ids = itertools.count(1)
+_current: contextvars.ContextVar = contextvars.ContextVar("intrafact_span", default=None)
+_breakdown_lock = threading.Lock()
+
+
+class Span:
+    """
+    One timed operation. Attributes describe the work (document, chunks,
+    batch_size, bytes, tokens, cache_hits, ...); numeric ones are added to
+    the counter intrafact_span_<attribute>_total (see UNCOUNTED_ATTRIBUTES).
+    """
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else f"{os.getpid():x}-{next(_ids):x}"
+        self.span_id = next(_ids)
+        self.attributes = attributes
+        self.start_time = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        # Root only: self time per span name over the whole trace
+        self.self_times: Dict[str, float] = {}
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float = 1):
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def finish(self, duration: Optional[float] = None):
+        self.duration = time.perf_counter() - self.started if duration is None else duration
+
+        # Self time: a child's time is moved from its parent's name to its own
+        with _breakdown_lock:
+            times = self.root.self_times
+            times[self.name] = times.get(self.name, 0.0) + self.duration
+            if self.parent is not None:
+                times[self.parent.name] = times.get(self.parent.name, 0.0) - self.duration
+
+        metrics.observe(SPAN_SECONDS, self.duration, span=self.name)
+        for key, value in self.attributes.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and key not in UNCOUNTED_ATTRIBUTES:
+                metrics.count(f"intrafact_span_{key}_total", value, span=self.name)
+
+        writer = _writer
+        if writer is not None:
+            writer.write({
+                "trace_id": self.trace_id,
+                "span_id": self.span_id,
+                "parent_id": self.parent.span_id if self.parent is not None else None,
+                "name": self.name,
+                "start": self.start_time,
+                "duration_ms": round(self.duration * 1000, 3),
+                "thread": threading.current_thread().name,
+                "attributes": self.attributes
+            }, flush=self.parent is None)
+
+    def breakdown(self) -> Dict[str, float]:
+        """
+        Seconds spent in each span name across this trace, excluding time
+        spent in child spans; the root span's own share is "other".
+        """
+        with _breakdown_lock:
+            times = dict(self.self_times)
+        times["other"] = max(times.pop(self.name, 0.0), 0.0)
+        return times
+
+@contextmanager
+def span(name: str, **attributes):
+    parent = _current.get()
+    current = Span(name, parent, **attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            # Finished from another context (e.g. a generator closed elsewhere)
+            _current.set(parent)
+        current.finish()
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+def set_attributes(**attributes):
+    """
+    Adds attributes to the innermost open span, if any.
+    """
+    current = _current.get()
+    if current is not None:
+        current.set(**attributes)
+
+def record_span(name: str, seconds: float, **attributes):
+    """
+    Records a span measured elsewhere (e.g. in a worker process) as a
+    finished child of the current span.
+    """
+    Span(name, _current.get(), **attributes).finish(seconds)
+
+def count(name: str, value: float = 1, **labels):
+    metrics.count(name, value, **labels)
+
+def write_metrics(path: str):
+    """
+    Atomically writes the current metrics to `path`: JSON for a .json path,
+    the Prometheus text format otherwise (e.g. for node_exporter's textfile
+    collector).
+    """
+    if str(path).endswith(".json"):
+        content = json.dumps(metrics.snapshot(), indent=2)
+    else:
+        content = metrics.prometheus()
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
@@ -0,0 +1,45 @@
+import hashlib
+import re
+import numpy as np
+import pytest
+
+class PieceTokenizer:
+    """
+    Stand-in for a HuggingFace fast tokenizer: every run of up to 3
+    non-space characters is one token, with character offsets.
+    """
+
+    do_lower_case = True
+
+    def __call__(self, text, add_special_tokens=False, return_offsets_mapping=False, **kwargs):
+        offsets = [(match.start(), match.end()) for match in re.finditer(r"\S{1,3}", text)]
+        encoding = {"input_ids": list(range(len(offsets)))}
+        if return_offsets_mapping:
+            encoding["offset_mapping"] = offsets
+        return encoding
+
+class HashEmbedder:
+    """
+    Deterministic embedder without a model: each text maps to a vector
+    derived from its hash.
+    """
+
+    max_tokens = 64
+
+    def __init__(self, dim: int = 16):
+        self.dim = dim
+        self.tokenizer = PieceTokenizer()
+
+    def encode(self, texts, batch_size=32, use_cache=True, **kwargs):
+        return np.array([
+            np.frombuffer(hashlib.sha256(text.encode("utf-8")).digest()[:self.dim], dtype=np.uint8)
+            for text in texts
+        ], dtype=np.float32) - 127.5
+
+@pytest.fixture
+def tokenizer():
+    return PieceTokenizer()
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder()
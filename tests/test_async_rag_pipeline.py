@@ -0,0 +1,96 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from intrafact.benchmark.stub_llm import StubLLMServer, STUB_ANSWER
+from intrafact.reasoning.async_rag_pipeline import AsyncRAGPipeline
+from intrafact.retrieval.retriever import Retriever
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact.storage.vector_store import VectorDB
+
+QUESTION = "What does the design document say about deployment?"
+
+class SlowEmbedder:
+    """
+    Wraps an embedder, recording when each encode call ran.
+    """
+
+    def __init__(self, embedder, delay: float = 0.0):
+        self.embedder = embedder
+        self.tokenizer = embedder.tokenizer
+        self.max_tokens = embedder.max_tokens
+        self.delay = delay
+        self.calls = []
+
+    def encode(self, texts, **kwargs):
+        started = time.perf_counter()
+        time.sleep(self.delay)
+        self.calls.append((list(texts), started, time.perf_counter()))
+        return self.embedder.encode(texts)
+
+@pytest.fixture
+def stub():
+    server = StubLLMServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def make_pipeline(tmp_path, embedder, stub):
+    meta_store = MetadataStore(tmp_path / "metadata.db")
+    vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors")
+
+    def make(wrapped=None):
+        rag = AsyncRAGPipeline(model_name="stub", retriever=Retriever(wrapped or embedder, vector_db, meta_store),
+                               base_url=stub.base_url, api_key="test")
+        rag.router.log_handler = None
+        return rag
+
+    yield make
+    meta_store.close()
+
+def test_concurrent_embed_query_calls_share_one_encode(tmp_path, embedder):
+    slow = SlowEmbedder(embedder, delay=0.1)
+    meta_store = MetadataStore(tmp_path / "metadata.db")
+    retriever = Retriever(slow, VectorDB("test", backend="numpy", partition_by="none", path=tmp_path), meta_store)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        vectors = list(pool.map(retriever.embed_query, [QUESTION] * 4))
+    meta_store.close()
+
+    assert len(slow.calls) == 1
+    assert all((vector == vectors[0]).all() for vector in vectors)
+    assert retriever.pending_queries == {}
+
+def test_retrieval_starts_before_the_query_is_encoded(make_pipeline, embedder):
+    slow = SlowEmbedder(embedder, delay=0.2)
+    rag = make_pipeline(slow)
+    slow.calls.clear()  # the router's prototype embeddings
+    retrieve_started = []
+    retrieve = rag.retriever.retrieve
+
+    def recording_retrieve(*args, **kwargs):
+        retrieve_started.append(time.perf_counter())
+        return retrieve(*args, **kwargs)
+
+    rag.retriever.retrieve = recording_retrieve
+    asyncio.run(rag.build_prompt_async(QUESTION))
+
+    # One encode, shared by the router and the retrieval that started alongside it
+    assert [texts for texts, _, _ in slow.calls] == [[rag.retriever._normalize_query(QUESTION)]]
+    assert retrieve_started[0] < slow.calls[0][2]
+
+def test_stream_answer_async_records_timings_and_trace(make_pipeline):
+    rag = make_pipeline()
+
+    async def collect():
+        try:
+            return [delta async for delta in rag.stream_answer_async(QUESTION)]
+        finally:
+            await rag.aclose()
+
+    deltas = asyncio.run(collect())
+
+    assert "".join(deltas).strip() == STUB_ANSWER
+    assert rag.last_timings["time_to_first_token"] is not None
+    assert rag.last_timings["generation_time"] >= rag.last_timings["time_to_first_token"]
+    assert rag.last_trace["total_ms"] > 0 and "generation_ms" in rag.last_trace
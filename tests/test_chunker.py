@@ -0,0 +1,51 @@
+import random
+import pytest
+from intrafact.processing.chunker import TextChunker, PIECE_SEPARATOR
+
+def _text(words: int, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    return " ".join(
+        "".join(rng.choice("abcdefghij") for _ in range(rng.randint(1, 9))) + rng.choice(["", "", ".", ","])
+        for _ in range(words)
+    )
+
+@pytest.mark.parametrize("content_defined", [False, True])
+def test_chunks_fit_chunk_size_in_tokens(tokenizer, content_defined):
+    chunker = TextChunker(40, 8, tokenizer=tokenizer, content_defined=content_defined)
+    chunks = chunker.chunker(_text(2000))
+
+    assert len(chunks) > 10
+    for chunk in chunks:
+        assert len(tokenizer(chunk)["input_ids"]) <= chunker.chunk_size
+
+@pytest.mark.parametrize("content_defined", [False, True])
+def test_chunks_fit_chunk_size_in_characters(content_defined):
+    chunker = TextChunker(120, 20, content_defined=content_defined)
+    chunks = chunker.chunker(_text(2000, seed=1))
+
+    assert len(chunks) > 10
+    assert all(len(chunk) <= chunker.chunk_size for chunk in chunks)
+
+def test_word_larger_than_chunk_size_is_its_own_chunk():
+    chunker = TextChunker(10, 2)
+    assert chunker.chunker("short " + "x" * 30 + " tail") == ["short", "x" * 30, "tail"]
+
+@pytest.mark.parametrize("content_defined", [False, True])
+def test_page_spans_match_spans_of_joined_text(tokenizer, content_defined):
+    chunker = TextChunker(40, 8, tokenizer=tokenizer, content_defined=content_defined)
+    pages = [(number, _text(words, seed=number)) for number, words in enumerate([150, 3, 0, 90, 400, 1], 1)]
+    joined = PIECE_SEPARATOR.join(text for _, text in pages if text)
+
+    streamed = [(start, end, content) for start, end, content, _, _ in chunker.iter_page_spans(iter(pages))]
+    expected = [(start, end, joined[start:end]) for start, end in chunker.iter_spans(joined)]
+
+    assert streamed == expected
+
+def test_page_spans_report_pages(tokenizer):
+    chunker = TextChunker(40, 8, tokenizer=tokenizer)
+    pages = [(1, _text(100, seed=1)), (2, _text(100, seed=2))]
+
+    spans = list(chunker.iter_page_spans(pages))
+
+    assert spans[0][3] == 1 and spans[-1][4] == 2
+    assert any(first_page == 1 and last_page == 2 for _, _, _, first_page, last_page in spans)
@@ -0,0 +1,41 @@
+from intrafact.reasoning.context_builder import ContextPacker
+
+def _passage(parent_id: str, words: int, chunk_index: int = 0):
+    content = " ".join(f"{parent_id}{i}" for i in range(words))
+    return {"content": content, "metadata": {"parent_id": parent_id, "chunk_index": chunk_index}}
+
+def test_over_budget_passage_is_truncated(tokenizer):
+    packer = ContextPacker(tokenizer, token_budget=20)
+
+    context, stats = packer.pack([_passage("a", 100)])
+
+    assert stats["packed_passages"] == 1
+    assert stats["truncated_passages"] == 1
+    assert stats["context_tokens"] <= 20
+    assert packer.count_tokens(context) <= 20
+    assert _passage("a", 100)["content"].startswith(context)
+
+def test_over_budget_passage_fills_remaining_budget(tokenizer):
+    packer = ContextPacker(tokenizer, token_budget=30)
+
+    context, stats = packer.pack([_passage("a", 3), _passage("b", 100)])
+
+    assert stats["packed_passages"] == 2
+    assert stats["truncated_passages"] == 1
+    assert packer.count_tokens(context) <= 30
+
+def test_passage_within_budget_that_does_not_fit_is_skipped(tokenizer):
+    packer = ContextPacker(tokenizer, token_budget=30)
+
+    context, stats = packer.pack([_passage("a", 10), _passage("b", 25), _passage("c", 2)])
+
+    assert stats["packed_passages"] == 2
+    assert stats["truncated_passages"] == 0
+    assert "b0" not in context and "c0" in context
+
+def test_truncate_cuts_at_token_boundary(tokenizer):
+    packer = ContextPacker(tokenizer)
+
+    assert packer.truncate("abcdef gh", 1) == "abc"
+    assert packer.truncate("abcdef gh", 3) == "abcdef gh"
+    assert packer.truncate("abcdef gh", 0) == ""
@@ -0,0 +1,86 @@
+import pytest
+from intrafact.processing.deduplicator import ChunkDeduplicator
+from intrafact.processing.incremental import IncrementalIndexer
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact.storage.vector_store import VectorDB
+
+REPORT = "the quarterly report lists revenue costs and headcount for every region in detail"
+NEAR_COPY = "the quarterly report lists revenue costs and headcount for every region in detail today"
+UNRELATED = "deployment runs through the staging cluster before any production rollout happens"
+
+def _chunk(chunk_id: str, content: str, parent_id: str = "doc"):
+    return {"id": chunk_id, "parent_id": parent_id, "chunk_index": 0, "content": content,
+            "metadata": {"file_type": ".txt"}}
+
+@pytest.fixture
+def meta_store(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    yield store
+    store.close()
+
+def test_near_duplicates_within_a_run_reference_the_first_copy(meta_store):
+    dedup = ChunkDeduplicator(meta_store, threshold=0.8)
+
+    unique, duplicates = dedup.assign([_chunk("a", REPORT), _chunk("b", NEAR_COPY), _chunk("c", UNRELATED)])
+
+    assert [c["id"] for c in unique] == ["a", "c"]
+    assert [(c["id"], c["canonical_id"]) for c in duplicates] == [("b", "a")]
+    assert dedup.stats() == {"checked": 3, "duplicates": 1, "dedup_ratio": pytest.approx(1 / 3)}
+
+def test_indexed_chunks_are_matched_in_later_runs(meta_store):
+    first_run = ChunkDeduplicator(meta_store, threshold=0.8)
+    unique, _ = first_run.assign([_chunk("a", REPORT)])
+    first_run.index(unique)
+
+    unique, duplicates = ChunkDeduplicator(meta_store, threshold=0.8).assign([_chunk("b", NEAR_COPY)])
+
+    assert unique == [] and duplicates[0]["canonical_id"] == "a"
+
+def test_discarded_chunks_are_not_matched(meta_store):
+    dedup = ChunkDeduplicator(meta_store, threshold=0.8)
+    unique, _ = dedup.assign([_chunk("a", REPORT)])
+
+    dedup.discard(unique)
+    unique, duplicates = dedup.assign([_chunk("b", NEAR_COPY)])
+
+    assert [c["id"] for c in unique] == ["b"] and duplicates == []
+    assert dedup.pending_signatures.keys() == {"b"}
+
+def test_excluded_chunks_are_never_canonical(meta_store):
+    dedup = ChunkDeduplicator(meta_store, threshold=0.8)
+    dedup.index(dedup.assign([_chunk("a", REPORT)])[0])
+
+    unique, duplicates = dedup.assign([_chunk("b", REPORT)], exclude={"a"})
+
+    assert [c["id"] for c in unique] == ["b"] and duplicates == []
+    assert "canonical_id" not in unique[0]
+
+def test_dissimilar_chunks_stay_unique(meta_store):
+    dedup = ChunkDeduplicator(meta_store, threshold=0.8)
+
+    unique, duplicates = dedup.assign([_chunk("a", REPORT), _chunk("b", "the quarterly report is late again")])
+
+    assert len(unique) == 2 and duplicates == []
+
+def test_duplicate_of_a_deleted_chunk_gets_its_own_vector(tmp_path, meta_store, embedder):
+    vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors")
+    indexer = IncrementalIndexer(meta_store, vector_db, embedder=embedder,
+                                 deduplicator=ChunkDeduplicator(meta_store, threshold=0.8))
+
+    def ingest(doc_id, chunks):
+        metadata = {"file_name": f"{doc_id}.txt", "file_path": f"/{doc_id}.txt", "file_hash": doc_id,
+                    "file_size": 1, "file_mtime_ns": 1, "file_inode": 1}
+        update = indexer.plan(doc_id, metadata, chunks)
+        indexer.apply([update], embeddings=embedder.encode([c["content"] for c in update.added]) if update.added else None)
+        return update
+
+    ingest("a", [_chunk("a0", REPORT, "a")])
+    copy = ingest("b", [_chunk("b0", NEAR_COPY, "b")])
+    assert copy.duplicates[0]["canonical_id"] == "a0" and vector_db.count() == 1
+
+    ingest("a", [])
+
+    assert vector_db.partitions[None].get(["a0", "b0"])["ids"] == ["b0"]
+    assert meta_store.chunk_canonical_ids("b") == {"b0": None}
+    # The re-embedded chunk is canonical for later copies
+    assert ChunkDeduplicator(meta_store, threshold=0.8).assign([_chunk("c0", REPORT, "c")])[1][0]["canonical_id"] == "b0"
@@ -0,0 +1,23 @@
+import pytest
+from intrafact.processing import embedding_backends
+from intrafact.processing.embedding_backends import load_sentence_transformer, quantization_config
+
+def test_unknown_backend_is_rejected_before_loading_anything():
+    with pytest.raises(ValueError, match="onnx-int8"):
+        load_sentence_transformer("any-model", backend="tensorrt")
+
+@pytest.mark.parametrize("machine, cpuinfo, expected", [
+    ("aarch64", "", "arm64"),
+    ("x86_64", "flags: avx2 avx512f avx512_vnni", "avx512_vnni"),
+    ("x86_64", "flags: avx2 avx512f", "avx512"),
+    ("x86_64", "flags: sse4_2 avx2", "avx2"),
+])
+def test_quantization_config_matches_the_cpu(monkeypatch, tmp_path, machine, cpuinfo, expected):
+    cpuinfo_path = tmp_path / "cpuinfo"
+    cpuinfo_path.write_text(cpuinfo)
+    real_open = open
+    monkeypatch.setattr(embedding_backends.platform, "machine", lambda: machine)
+    monkeypatch.setattr("builtins.open", lambda path, *args, **kwargs: real_open(
+        cpuinfo_path if path == "/proc/cpuinfo" else path, *args, **kwargs))
+
+    assert quantization_config() == expected
@@ -0,0 +1,76 @@
+import sqlite3
+import time
+import numpy as np
+from intrafact.processing.embedding_cache import EmbeddingCache
+
+def _vectors(texts, dim: int = 8):
+    return np.stack([np.full(dim, float(len(text)), dtype=np.float32) + np.arange(dim) for text in texts])
+
+def test_lookups_do_not_wait_for_the_write_lock(tmp_path):
+    cache = EmbeddingCache("model", 8, max_entries=10, cache_dir=tmp_path, touch_interval=3600)
+    cache.put_many(["alpha", "beta"], _vectors(["alpha", "beta"]))
+
+    # Another process holding the write lock
+    other = sqlite3.connect(str(tmp_path / "model-8.db"), timeout=0)
+    other.execute("BEGIN IMMEDIATE")
+    try:
+        started = time.perf_counter()
+        embeddings, missing = cache.get_many(["alpha", "gamma", "beta"])
+        assert time.perf_counter() - started < 1
+    finally:
+        other.rollback()
+        other.close()
+
+    assert missing == [1]
+    assert np.array_equal(embeddings[[0, 2]], _vectors(["alpha", "beta"]))
+
+def test_rewritten_row_is_a_miss(tmp_path):
+    cache = EmbeddingCache("model", 8, max_entries=10, cache_dir=tmp_path)
+    cache.put_many(["alpha"], _vectors(["alpha"]))
+    slot = cache.conn.execute("SELECT slot FROM entries").fetchone()[0]
+
+    # A writer half way through replacing the row
+    cache.row_keys[slot] = 0
+
+    embeddings, missing = cache.get_many(["alpha"])
+    assert missing == [0] and not embeddings.any()
+
+def test_hits_and_misses(tmp_path):
+    cache = EmbeddingCache("model", 8, max_entries=10, cache_dir=tmp_path)
+    cache.put_many(["alpha", "alpha  "], _vectors(["alpha", "alpha"]))
+
+    # Whitespace differences share an entry
+    embeddings, missing = cache.get_many(["alpha", " alpha", "beta"])
+
+    assert missing == [2]
+    assert np.array_equal(embeddings[0], embeddings[1])
+    assert cache.stats()["entries"] == 1
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (2, 1)
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = EmbeddingCache("model", 8, max_entries=3, cache_dir=tmp_path, touch_interval=3600)
+    cache.put_many(["a", "bb", "ccc"], _vectors(["a", "bb", "ccc"]))
+    time.sleep(0.01)
+    # Used recently, so it survives even though its hit is not written yet
+    cache.get_many(["a"])
+    time.sleep(0.01)
+
+    cache.put_many(["dddd", "eeeee"], _vectors(["dddd", "eeeee"]))
+
+    _, missing = cache.get_many(["a", "bb", "ccc", "dddd", "eeeee"])
+    assert missing == [1, 2]
+    assert cache.stats()["evictions"] == 2
+    assert cache.stats()["entries"] == 3
+
+def test_entries_survive_reopen_and_capacity_change(tmp_path):
+    texts = [f"text {i}" for i in range(6)]
+    EmbeddingCache("model", 8, max_entries=6, cache_dir=tmp_path).put_many(texts, _vectors(texts))
+
+    embeddings, missing = EmbeddingCache("model", 8, max_entries=6, cache_dir=tmp_path).get_many(texts)
+    assert missing == [] and np.array_equal(embeddings, _vectors(texts))
+
+    smaller = EmbeddingCache("model", 8, max_entries=4, cache_dir=tmp_path)
+    embeddings, missing = smaller.get_many(texts)
+    assert len(missing) == 2 and smaller.stats()["entries"] == 4
+    hits = [i for i in range(6) if i not in missing]
+    assert np.array_equal(embeddings[hits], _vectors([texts[i] for i in hits]))
@@ -0,0 +1,78 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+import numpy as np
+import pytest
+from intrafact.processing.embedding_server import EmbeddingClient, EmbeddingServer, MicroBatcher
+
+class CountingEmbedder:
+    model_name = "hash"
+    backend = "torch"
+
+    def __init__(self, embedder):
+        self.embedder = embedder
+        self.calls = []
+        self.model = SimpleNamespace(get_sentence_embedding_dimension=lambda: embedder.dim, max_seq_length=64,
+                                     tokenizer=SimpleNamespace(name_or_path="piece"))
+
+    def encode(self, texts, batch_size=32, use_cache=True):
+        self.calls.append((len(texts), use_cache))
+        if "boom" in texts:
+            raise ValueError("cannot encode boom")
+        return self.embedder.encode(texts)
+
+@pytest.fixture
+def server(tmp_path, embedder):
+    embedding_server = EmbeddingServer(CountingEmbedder(embedder), tmp_path / "embed.sock", max_wait=0.05)
+    thread = threading.Thread(target=embedding_server.serve_forever, daemon=True)
+    thread.start()
+    yield embedding_server
+    embedding_server.shutdown()
+    embedding_server.server_close()
+
+def test_concurrent_requests_share_a_model_call(embedder):
+    counting = CountingEmbedder(embedder)
+    batcher = MicroBatcher(counting, max_batch=64, max_wait=0.2)
+    texts = [[f"text {i}", f"more {i}"] for i in range(8)]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(batcher.submit, texts))
+
+    for request, result in zip(texts, results):
+        assert np.array_equal(result, embedder.encode(request))
+    stats = batcher.stats()
+    assert stats["requests"] == 8 and stats["texts"] == 16
+    assert stats["batches"] == len(counting.calls) < 8
+
+def test_batch_is_sent_when_full(embedder):
+    counting = CountingEmbedder(embedder)
+    batcher = MicroBatcher(counting, max_batch=2, max_wait=10.0)
+
+    assert batcher.submit(["a", "b"]).shape == (2, embedder.dim)
+    assert counting.calls == [(2, True)]
+
+def test_errors_reach_every_request_of_the_group(embedder):
+    batcher = MicroBatcher(CountingEmbedder(embedder), max_wait=0.0)
+
+    with pytest.raises(ValueError, match="boom"):
+        batcher.submit(["boom"])
+    assert batcher.submit(["fine"]).shape == (1, embedder.dim)
+
+def test_client_encodes_through_the_server(server, embedder):
+    client = EmbeddingClient(server.socket_path)
+
+    assert client.available()
+    assert client.info()["dim"] == embedder.dim
+    assert np.array_equal(client.encode(["alpha", "beta"], use_cache=False), embedder.encode(["alpha", "beta"]))
+    with pytest.raises(RuntimeError, match="boom"):
+        client.encode(["boom"])
+    assert client.stats()["requests"] == 2
+
+def test_second_server_on_a_live_socket_is_refused(server, embedder):
+    with pytest.raises(RuntimeError, match="already running"):
+        EmbeddingServer(CountingEmbedder(embedder), server.socket_path)
+
+def test_client_without_a_server_is_unavailable(tmp_path):
+    client = EmbeddingClient(tmp_path / "missing.sock")
+
+    assert not client.available()
@@ -0,0 +1,55 @@
+import pytest
+from intrafact.benchmark.corpus import write_pdf
+from intrafact.config import PDF_STREAM_MIN_PAGES
+from intrafact.ingestion import file_ingestor
+from intrafact.ingestion.file_ingestor import iter_document_pages, load_document
+
+PARAGRAPHS = [f"Section {i} describes the retention policy for archive number {i}." for i in range(12)]
+
+@pytest.fixture
+def raw_dir(tmp_path, monkeypatch):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    monkeypatch.setattr(file_ingestor, "RAW_DATA_DIR", raw)
+    write_pdf(raw / "report.pdf", PARAGRAPHS, lines_per_page=4)
+    (raw / "notes.txt").write_text("Plain notes about the archive.")
+    return raw
+
+def test_small_pdf_is_extracted_eagerly(raw_dir):
+    item = load_document(raw_dir / "report.pdf", stream_min_pages=100)
+
+    assert item["page_count"] == 6 and item["raw_text"] is None
+    assert [number for number, _ in item["pages"]] == [1, 2, 3, 4, 5, 6]
+    assert "archive number 11" in item["pages"][-1][1]
+    assert item["chars"] == sum(len(text) for _, text in item["pages"])
+
+def test_large_pdf_is_streamed_by_the_consumer(raw_dir):
+    eager = load_document(raw_dir / "report.pdf", stream_min_pages=100)
+
+    item = load_document(raw_dir / "report.pdf", stream_min_pages=2)
+
+    assert item["pages"] is None and item["raw_text"] is None and item["chars"] is None
+    assert list(iter_document_pages(item)) == eager["pages"]
+
+def test_unchanged_file_is_not_extracted(raw_dir):
+    first = load_document(raw_dir / "notes.txt")
+
+    item = load_document(raw_dir / "notes.txt", known_hash=first["metadata"]["file_hash"])
+
+    assert item == {"metadata": first["metadata"], "unchanged": True}
+
+def test_ingestor_returns_the_text_of_every_file(raw_dir):
+    # Long enough to be streamed by load_document() with the default settings
+    paragraphs = [f"Entry {i} of the audit log." for i in range(PDF_STREAM_MIN_PAGES)]
+    write_pdf(raw_dir / "log.pdf", paragraphs, lines_per_page=2)
+    assert load_document(raw_dir / "log.pdf")["pages"] is None
+
+    items = {item["metadata"]["file_name"]: item for item in file_ingestor.ingestor()}
+
+    assert items["notes.txt"]["raw_text"] == "Plain notes about the archive."
+    assert "archive number 11." in items["report.pdf"]["raw_text"]
+    pdf = items["log.pdf"]
+    assert pdf["page_count"] == PDF_STREAM_MIN_PAGES
+    assert all(f"Entry {i} of" in pdf["raw_text"] for i in range(PDF_STREAM_MIN_PAGES))
+    assert pdf["raw_text"] == "\n".join(text for _, text in pdf["pages"])
+    assert list(iter_document_pages(pdf)) == pdf["pages"]
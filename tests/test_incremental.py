@@ -0,0 +1,86 @@
+import hashlib
+import pytest
+from intrafact.processing.incremental import IncrementalIndexer
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact.storage.vector_store import VectorDB
+
+def _document(path: str, paragraphs):
+    doc_id = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+    metadata = {"file_name": path.rsplit("/", 1)[-1], "file_path": path, "file_hash": str(hash(tuple(paragraphs))),
+                "file_size": 1, "file_mtime_ns": 1, "file_inode": 1, "file_type": ".txt"}
+    chunks = [{
+        "id": hashlib.sha256(f"{doc_id}:{text}".encode("utf-8")).hexdigest()[:16],
+        "parent_id": doc_id, "chunk_index": i, "content": text, "metadata": {"file_type": ".txt"}
+    } for i, text in enumerate(paragraphs)]
+    return doc_id, metadata, chunks
+
+def _vector_ids(vector_db):
+    return {chunk_id for backend in vector_db.partitions.values()
+            for batch in backend.iter_all(embeddings=False) for chunk_id in batch["ids"]}
+
+@pytest.fixture
+def stores(tmp_path):
+    meta_store = MetadataStore(tmp_path / "metadata.db")
+    vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors")
+    yield meta_store, vector_db
+    meta_store.close()
+
+def _ingest(indexer, embedder, path, paragraphs, doc_id=None):
+    planned_id, metadata, chunks = _document(path, paragraphs)
+    update = indexer.plan(doc_id or planned_id, metadata, chunks)
+    indexer.apply([update], embeddings=embedder.encode([c["content"] for c in update.added]) if update.added else None)
+    return update
+
+def test_edit_embeds_only_new_chunks(stores, embedder):
+    meta_store, vector_db = stores
+    indexer = IncrementalIndexer(meta_store, vector_db)
+    first = _ingest(indexer, embedder, "/docs/a.txt", ["alpha one", "beta two", "gamma three"])
+    assert len(first.added) == 3 and not first.kept
+
+    update = _ingest(indexer, embedder, "/docs/a.txt", ["beta two", "gamma three", "delta four"])
+
+    assert [c["content"] for c in update.added] == ["delta four"]
+    assert [c["content"] for c in update.kept] == ["beta two", "gamma three"]
+    assert update.removed_ids == [first.chunks[0]["id"]]
+    assert _vector_ids(vector_db) == {c["id"] for c in update.chunks}
+    assert meta_store.chunk_ids(update.doc_id) == [c["id"] for c in update.chunks]
+    # Kept chunks moved up one position without being re-embedded
+    kept = vector_db.partitions[None].get([update.kept[0]["id"]])
+    assert kept["metadatas"][0]["chunk_index"] == 0
+
+def test_document_under_an_old_id_is_replaced(stores, embedder):
+    meta_store, vector_db = stores
+    indexer = IncrementalIndexer(meta_store, vector_db)
+    _ingest(indexer, embedder, "/docs/a.txt", ["alpha one"], doc_id="legacy-random-id")
+
+    update = _ingest(indexer, embedder, "/docs/a.txt", ["alpha one"])
+
+    assert update.stale_doc_ids == ["legacy-random-id"]
+    assert len(update.added) == 1
+    assert meta_store.documents_for_path("/docs/a.txt") == [update.doc_id]
+    assert _vector_ids(vector_db) == {update.chunks[0]["id"]}
+
+def test_emptied_file_removes_its_document(stores, embedder):
+    meta_store, vector_db = stores
+    indexer = IncrementalIndexer(meta_store, vector_db)
+    first = _ingest(indexer, embedder, "/docs/a.txt", ["alpha one", "beta two"])
+    _ingest(indexer, embedder, "/docs/b.txt", ["other file"])
+
+    update = _ingest(indexer, embedder, "/docs/a.txt", [])
+
+    assert update.stale_doc_ids == [first.doc_id]
+    assert meta_store.documents_for_path("/docs/a.txt") == []
+    assert meta_store.count_documents() == 1
+    assert len(_vector_ids(vector_db)) == 1
+    # The file stays in the manifest, so it is not re-read until it changes
+    assert "/docs/a.txt" in meta_store.load_manifest()
+
+def test_missing_files_are_removed(stores, embedder, tmp_path):
+    meta_store, vector_db = stores
+    indexer = IncrementalIndexer(meta_store, vector_db)
+    path = str(tmp_path / "gone.txt")
+    _ingest(indexer, embedder, path, ["alpha one"])
+
+    assert indexer.remove_missing_files() == 1
+    assert meta_store.count_documents() == 0 and vector_db.count() == 0
+    assert meta_store.load_manifest() == {}
@@ -0,0 +1,96 @@
+import threading
+import pytest
+from intrafact.normalization.normalizer import TextNormalizer
+from intrafact.processing.ingest_pipeline import IngestPipeline
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact.storage.vector_store import VectorDB
+
+class StageCrash(BaseException):
+    """Escapes the per-batch `except Exception` of a stage, like a dying thread."""
+
+@pytest.fixture
+def files(tmp_path):
+    raw = tmp_path / "raw"
+    raw.mkdir()
+    paths = []
+    for i in range(12):
+        path = raw / f"doc{i}.txt"
+        path.write_text(" ".join(f"document{i} sentence{j} words{j * i}." for j in range(120)))
+        paths.append(path)
+    return paths
+
+@pytest.fixture
+def make_pipeline(tmp_path, embedder):
+    stores = []
+
+    def make(**kwargs):
+        meta_store = MetadataStore(tmp_path / "metadata.db")
+        vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors")
+        stores.append(meta_store)
+        return IngestPipeline(meta_store, vector_db, TextNormalizer(), None, embedder, dedup=False, **kwargs)
+
+    yield make
+    for meta_store in stores:
+        meta_store.close()
+
+def _run_in_thread(pipeline, paths, timeout: float = 60):
+    outcome = {}
+
+    def run():
+        try:
+            outcome["stored"] = pipeline.run(paths)
+        except BaseException as e:
+            outcome["error"] = e
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "pipeline deadlocked"
+    return outcome
+
+def test_run_stores_every_chunk_once(files, make_pipeline):
+    pipeline = make_pipeline(pool_size=8, batch_size=4)
+
+    assert pipeline.run(files) == len(files)
+
+    assert pipeline.chunk_count > len(files)
+    assert pipeline.vector_db.count() == pipeline.chunk_count
+    assert pipeline.meta_store.count_documents() == len(files)
+
+    # Unchanged files are skipped before extraction
+    assert pipeline.run(files) == 0
+    assert pipeline.seen_count == 0
+
+def test_encode_error_skips_only_that_pool(files, make_pipeline):
+    pipeline = make_pipeline(pool_size=1, batch_size=1)
+    # Built from the real embedder before it is replaced
+    assert pipeline.chunker
+    encode = pipeline.embedder.encode
+    calls = []
+
+    def flaky(texts, **kwargs):
+        calls.append(len(texts))
+        if len(calls) == 2:
+            raise RuntimeError("model failure")
+        return encode(texts, **kwargs)
+    pipeline.embedder = type("Flaky", (), {"encode": staticmethod(flaky)})()
+
+    assert pipeline.run(files) == len(files) - 1
+
+@pytest.mark.parametrize("stage", ["encode", "store"])
+def test_dead_stage_stops_the_run(files, make_pipeline, stage):
+    pipeline = make_pipeline(pool_size=1, batch_size=1, queue_size=1)
+    assert pipeline.chunker
+
+    def crash(*args, **kwargs):
+        raise StageCrash(stage)
+    if stage == "encode":
+        pipeline.embedder = type("Crashing", (), {"encode": staticmethod(crash)})()
+    else:
+        pipeline.indexer.apply = crash
+
+    outcome = _run_in_thread(pipeline, files)
+
+    assert isinstance(outcome.get("error"), StageCrash)
+    # The source stopped early instead of extracting everything for nothing
+    assert pipeline.seen_count < len(files)
@@ -0,0 +1,71 @@
+import pytest
+from intrafact.storage.metadata_store import SQL_BATCH, MetadataStore
+
+@pytest.fixture
+def store(tmp_path):
+    meta_store = MetadataStore(tmp_path / "metadata.db")
+    yield meta_store
+    meta_store.close()
+
+def _register(store, doc_id: str, count: int, canonical_every: int = 0):
+    chunks = [{
+        "id": f"{doc_id}_{i}", "chunk_index": i, "content": f"chunk {i} of {doc_id}",
+        "canonical_id": "canon" if canonical_every and i % canonical_every == 0 else None
+    } for i in range(count)]
+    store.register_document(doc_id, f"{doc_id}.txt", {"file_hash": doc_id, "file_path": f"/{doc_id}.txt"}, chunks)
+    return [chunk["id"] for chunk in chunks]
+
+def _count_selects(store, call):
+    statements = []
+    store.conn.set_trace_callback(statements.append)
+    try:
+        result = call()
+    finally:
+        store.conn.set_trace_callback(None)
+    return result, sum(statement.lstrip().upper().startswith("SELECT") for statement in statements)
+
+def test_stored_vector_ids_are_looked_up_in_batches(store):
+    chunk_ids = _register(store, "doc", 2 * SQL_BATCH + 10, canonical_every=3)
+
+    found, selects = _count_selects(store, lambda: store.stored_vector_ids(chunk_ids + ["missing"]))
+
+    assert found == {chunk_id for i, chunk_id in enumerate(chunk_ids) if i % 3}
+    assert selects == 3
+
+def test_signatures_are_looked_up_in_batches(store):
+    entries = [(f"c{i}", bytes([i % 256]) * 8, [(0, i)]) for i in range(SQL_BATCH + 1)]
+    store.add_signatures(entries)
+
+    signatures, selects = _count_selects(store, lambda: store.get_signatures([f"c{i}" for i in range(SQL_BATCH + 5)]))
+
+    assert signatures == {chunk_id: signature for chunk_id, signature, _ in entries}
+    assert selects == 2
+    assert store.lsh_candidates([(0, 3), (0, 4), (1, 3)]) == ["c3", "c4"]
+
+def test_release_duplicates_detaches_chunks(store):
+    _register(store, "doc", 6, canonical_every=2)
+
+    released = store.release_duplicates(["canon"])
+
+    assert sorted(chunk["id"] for chunk in released) == ["doc_0", "doc_2", "doc_4"]
+    assert released[0]["metadata"]["file_hash"] == "doc"
+    assert store.stored_vector_ids([f"doc_{i}" for i in range(6)]) == {f"doc_{i}" for i in range(6)}
+
+def test_manifest_lookup_by_paths(store):
+    store.update_manifest_many([(f"/f{i}", i, i * 10, i, f"h{i}") for i in range(SQL_BATCH + 20)])
+
+    manifest = store.load_manifest([f"/f{i}" for i in range(5, SQL_BATCH + 20)] + ["/unknown"])
+
+    assert len(manifest) == SQL_BATCH + 15
+    assert manifest["/f7"] == (7, 70, 7, "h7")
+    assert len(store.load_manifest()) == SQL_BATCH + 20
+
+def test_reregistered_chunks_are_reindexed_for_search(store):
+    store.register_document("doc", "doc.txt", {}, [{"id": "doc_0", "chunk_index": 0, "content": "old wording"}])
+    store.register_document("doc", "doc.txt", {}, [{"id": "doc_0", "chunk_index": 0, "content": "new phrasing"}])
+
+    assert store.search_chunks("old") == []
+    assert [r["id"] for r in store.search_chunks("phrasing")] == ["doc_0"]
+
+    store.delete_documents(["doc"])
+    assert store.search_chunks("phrasing") == [] and store.count_documents() == 0
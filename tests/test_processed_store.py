@@ -0,0 +1,80 @@
+import pytest
+from intrafact.storage.processed_store import ProcessedStore, StoreLockedError
+
+def _document(doc_id: str, text: str):
+    return {"id": doc_id, "content": text, "metadata": {"file_name": f"{doc_id}.txt", "file_hash": text}}
+
+def _text(store: ProcessedStore, doc_id: str) -> str:
+    return "".join(text for _, text in store.get(doc_id)["pages"])
+
+def test_objects_survive_reopen(tmp_path):
+    store = ProcessedStore(tmp_path)
+    for i in range(5):
+        store.put(_document(f"doc{i}", f"text of document {i} " * 20))
+    # Paged objects are stored once their stream has been read
+    stored = store.put({"id": "paged", "metadata": {}, "pages": iter([(1, "first page"), (2, "second page")])})
+    assert list(stored["pages"]) == [(1, "first page"), (2, "second page")]
+    store.close()
+
+    reopened = ProcessedStore(tmp_path)
+    assert len(reopened) == 6
+    assert _text(reopened, "doc3") == "text of document 3 " * 20
+    assert list(reopened.get("paged")["pages"]) == [(1, "first page"), (2, "second page")]
+    assert reopened.get("missing") is None
+    reopened.close()
+
+def test_compaction_keeps_latest_objects(tmp_path):
+    store = ProcessedStore(tmp_path, segment_max_bytes=256, compact_ratio=0.5)
+    for version in range(3):
+        for i in range(10):
+            store.put(_document(f"doc{i}", f"version {version} of document {i} " * 10))
+    store.delete(["doc9"])
+
+    before = store.stats()
+    reclaimed = store.compact()
+    after = store.stats()
+
+    assert reclaimed > 0
+    assert after["bytes"] < before["bytes"]
+    assert after["objects"] == 9
+    for i in range(9):
+        assert _text(store, f"doc{i}") == f"version 2 of document {i} " * 10
+    store.close()
+
+    reopened = ProcessedStore(tmp_path)
+    assert len(reopened) == 9
+    assert reopened.get("doc9") is None
+    assert [obj["id"] for obj in reopened.iter_objects()] and _text(reopened, "doc4").startswith("version 2")
+    reopened.close()
+
+def test_second_instance_is_read_only(tmp_path):
+    writer = ProcessedStore(tmp_path)
+    writer.put(_document("doc", "shared text"))
+    writer.flush()
+
+    reader = ProcessedStore(tmp_path)
+    assert reader.read_only
+    assert _text(reader, "doc") == "shared text"
+    with pytest.raises(StoreLockedError):
+        reader.put(_document("other", "text"))
+
+    reader.close()
+    writer.close()
+
+def test_normalizer_stores_objects_or_saves_json_files(tmp_path, monkeypatch):
+    import json
+    from intrafact.normalization import normalizer as normalizer_module
+    from intrafact.normalization.normalizer import TextNormalizer
+
+    monkeypatch.setattr(normalizer_module, "PROCESSED_DATA_DIR", tmp_path / "json")
+    norm = TextNormalizer()
+    knowledge_object = norm.normalize("  some   text  ", {"file_name": "notes.txt"})
+
+    save_path = norm.save_object(knowledge_object, "notes.txt")
+    assert save_path.parent == tmp_path / "json" and save_path.name.startswith("notes_txt_")
+    assert json.loads(save_path.read_text(encoding="utf-8")) == knowledge_object
+
+    store = ProcessedStore(tmp_path / "store")
+    norm.store_object(knowledge_object, store)
+    assert _text(store, knowledge_object["id"]) == "some text"
+    store.close()
@@ -0,0 +1,49 @@
+import pytest
+from intrafact.benchmark.stub_llm import StubLLMServer, STUB_ANSWER
+from intrafact.reasoning.rag_pipeline import RAGPipeline
+from intrafact.retrieval.retriever import Retriever
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact.storage.vector_store import VectorDB
+
+@pytest.fixture
+def stub():
+    server = StubLLMServer().start()
+    yield server
+    server.stop()
+
+@pytest.fixture
+def pipeline(tmp_path, embedder, stub):
+    meta_store = MetadataStore(tmp_path / "metadata.db")
+    vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors")
+    rag = RAGPipeline(model_name="stub", retriever=Retriever(embedder, vector_db, meta_store),
+                      base_url=stub.base_url, api_key="test")
+    rag.router.log_handler = None
+    yield rag
+    meta_store.close()
+
+def test_stream_answer_yields_stub_answer(pipeline, stub):
+    deltas = list(pipeline.stream_answer("What does the design document say about deployment?"))
+
+    assert len(deltas) == len(STUB_ANSWER.split(" "))
+    assert "".join(deltas).strip() == STUB_ANSWER
+    assert pipeline.last_timings["time_to_first_token"] is not None
+    assert pipeline.last_timings["generation_time"] >= pipeline.last_timings["time_to_first_token"]
+    assert stub.requests >= 1
+
+def test_stream_answer_reports_api_errors(pipeline, stub):
+    stub.stop()
+
+    deltas = list(pipeline.stream_answer("Hello there"))
+
+    assert len(deltas) == 1 and deltas[0].startswith("❌ API Error")
+
+def test_stream_answer_records_trace_when_cut_short(pipeline):
+    pipeline.last_trace = {"total_ms": -1.0}
+
+    stream = pipeline.stream_answer("What does the design document say about deployment?")
+    assert next(stream)
+    stream.close()
+
+    assert pipeline.last_trace["total_ms"] > 0
+    assert "generation_ms" in pipeline.last_trace
+    assert pipeline.last_timings["time_to_first_token"] is not None
@@ -0,0 +1,40 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from intrafact import registry
+
+def test_resource_is_created_once_under_concurrent_use():
+    created = []
+    release = threading.Event()
+
+    def factory():
+        created.append(object())
+        release.wait(5)
+        return created[-1]
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        futures = [pool.submit(registry._get, "test:shared", factory) for _ in range(8)]
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert len(created) == 1
+    assert all(result is created[0] for result in results)
+    assert "test:shared" in registry.startup_timings()
+
+def test_slow_factory_does_not_block_other_resources():
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "slow"
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        future = pool.submit(registry._get, "test:slow", slow)
+        assert started.wait(5)
+        try:
+            # Would deadlock (until the timeout) if creation held the global lock
+            assert registry._get("test:fast", lambda: "fast") == "fast"
+            assert registry.startup_timings()["test:fast"] >= 0
+        finally:
+            release.set()
+        assert future.result() == "slow"
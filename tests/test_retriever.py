@@ -0,0 +1,130 @@
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+import pytest
+from intrafact.retrieval.query_cache import LRUCache
+from intrafact.retrieval.retriever import EXACT_TERM_PATTERN, Retriever, reciprocal_rank_fusion
+from intrafact.storage.metadata_store import MetadataStore
+from intrafact.storage.vector_store import VectorDB
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+
+def _chunk(embedder, chunk_id: str, content: str):
+    return {"id": chunk_id, "parent_id": chunk_id, "chunk_index": 0, "content": content,
+            "metadata": {"file_type": ".txt"}, "embedding": embedder.encode([content])[0].tolist()}
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_entries=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["entries"] == 2
+    assert cache.stats()["hits"] == 3 and cache.stats()["misses"] == 1
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(ttl_seconds=0)
+    cache.put("a", 1)
+
+    assert cache.get("a", "missing") == "missing"
+    assert cache.stats()["entries"] == 0
+
+def test_vector_results_are_cached_until_a_write(tmp_path, embedder):
+    meta_store = MetadataStore(tmp_path / "metadata.db")
+    vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors")
+    vector_db.add_chunks([_chunk(embedder, "a", "alpha")])
+    retriever = Retriever(embedder, vector_db, meta_store)
+
+    assert [r["id"] for r in retriever.vector_retrieve("beta")] == ["a"]
+    assert [r["id"] for r in retriever.vector_retrieve("beta")] == ["a"]
+    assert retriever.results.stats()["hits"] == 1
+
+    vector_db.add_chunks([_chunk(embedder, "b", "beta")])
+    assert retriever.vector_retrieve("beta")[0]["id"] == "b"
+
+    # So does a write through another instance
+    VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors").delete_chunks(["a"])
+    retriever.vector_retrieve("beta")
+    assert retriever.results.stats()["misses"] == 3
+    meta_store.close()
+
+def test_generation_is_shared_across_processes(tmp_path, embedder):
+    vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path)
+    before = vector_db.generation
+
+    subprocess.run([sys.executable, "-c", textwrap.dedent(f"""
+        from intrafact.storage.vector_store import VectorDB
+        db = VectorDB("test", backend="numpy", partition_by="none", path={str(tmp_path)!r})
+        db.add_chunks([{{"id": "a", "parent_id": "a", "chunk_index": 0, "content": "alpha",
+                        "metadata": {{}}, "embedding": [1.0] + [0.0] * 15}}])
+    """)], cwd=PROJECT_ROOT, check=True)
+
+    assert vector_db.generation > before
+    assert VectorDB("test", backend="numpy", partition_by="none", path=tmp_path).generation == vector_db.generation
+
+DOCUMENTS = {
+    "doc1": ["The deploy failed with ERR-4021 on the staging cluster.", "Rollback steps for the staging cluster."],
+    "doc2": ["Quarterly numbers are in report_v2.pdf.", "The cluster was resized in March."],
+}
+
+@pytest.fixture
+def lexical_store(tmp_path):
+    meta_store = MetadataStore(tmp_path / "metadata.db")
+    meta_store.register_documents([
+        (doc_id, f"{doc_id}.txt", {"file_type": ".txt"},
+         [{"id": f"{doc_id}_{i}", "chunk_index": i, "content": content} for i, content in enumerate(chunks)])
+        for doc_id, chunks in DOCUMENTS.items()
+    ])
+    yield meta_store
+    meta_store.close()
+
+class NoEncoder:
+    tokenizer = None
+
+    def encode(self, texts, **kwargs):
+        raise AssertionError("the encoder should not run")
+
+def test_match_query_quotes_terms_and_keeps_phrases():
+    assert MetadataStore.to_match_query('ERR-4021 "staging cluster" now') == '"ERR-4021" OR "staging cluster" OR "now"'
+    assert MetadataStore.to_match_query("   ") == ""
+
+def test_search_chunks_ranks_by_bm25(lexical_store):
+    results = lexical_store.search_chunks("staging cluster", limit=5)
+
+    # Both terms outrank "cluster" alone
+    assert {r["id"] for r in results[:2]} == {"doc1_0", "doc1_1"}
+    assert results[2]["id"] == "doc2_1" and len(results) == 3
+    assert [r["score"] for r in results] == sorted((r["score"] for r in results), reverse=True)
+    assert all(r["score"] == -r["bm25"] for r in results)
+    assert results[0]["metadata"]["parent_id"] == "doc1"
+    assert lexical_store.search_chunks("ERR-4021")[0]["id"] == "doc1_0"
+
+def test_reciprocal_rank_fusion_sums_ranks():
+    vector = [{"id": "a", "distance": 0.1}, {"id": "b", "distance": 0.2}]
+    lexical = [{"id": "b", "bm25": -3.0}, {"id": "c", "bm25": -1.0}]
+
+    fused = reciprocal_rank_fusion([vector, lexical], limit=2, k=60)
+
+    assert [r["id"] for r in fused] == ["b", "a"]
+    assert fused[0]["distance"] == 0.2 and "bm25" not in fused[0]
+    assert fused[0]["score"] == fused[0]["rrf_score"] == pytest.approx(1 / 62 + 1 / 61)
+
+@pytest.mark.parametrize("query, exact", [
+    ("ERR-4021", True), ("report_v2.pdf", True), ("v2", True), ('"staging cluster"', True),
+    ("hi.", False), ("2024", False), ("deployment", False), ("what failed?", False),
+])
+def test_exact_term_pattern(query, exact):
+    assert bool(EXACT_TERM_PATTERN.match(query)) is exact
+
+def test_hybrid_exact_term_skips_the_encoder(tmp_path, lexical_store):
+    vector_db = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "vectors")
+    retriever = Retriever(NoEncoder(), vector_db, lexical_store)
+
+    results = retriever.retrieve("report_v2.pdf", mode="hybrid")
+
+    assert results[0]["id"] == "doc2_0"
+    assert "bm25" in results[0]
@@ -0,0 +1,39 @@
+import json
+from intrafact.reasoning import router as router_module
+from intrafact.reasoning.router import DIRECT_PROTOTYPES, SEARCH_PROTOTYPES, QueryRouter
+
+def test_routes_to_the_nearest_prototypes(embedder):
+    router = QueryRouter(embedder, top_k=1)
+    search_query, direct_query = SEARCH_PROTOTYPES[0], DIRECT_PROTOTYPES[0]
+
+    assert router.route(search_query, embedder.encode([search_query])[0]) is True
+    assert router.route(direct_query, embedder.encode([direct_query])[0]) is False
+    assert router.cached(search_query.upper()) is True
+    assert router.cached(direct_query) is False
+
+def test_ambiguous_queries_are_not_cached(embedder):
+    router = QueryRouter(embedder, margin=10.0)
+    query = SEARCH_PROTOTYPES[0]
+
+    assert router.route(query, embedder.encode([query])[0]) is None
+    assert router.cached(query) is None
+
+def test_decisions_are_not_logged_to_a_file_by_default(embedder):
+    assert QueryRouter(embedder).log_handler is None
+
+def test_decision_log_is_jsonl_and_rotates(tmp_path, embedder, monkeypatch):
+    monkeypatch.setattr(router_module, "ROUTER_LOG_MAX_BYTES", 600)
+    monkeypatch.setattr(router_module, "ROUTER_LOG_BACKUPS", 2)
+    log_path = tmp_path / "router.jsonl"
+    router = QueryRouter(embedder, top_k=1, log_path=log_path)
+
+    for i in range(20):
+        query = f"{SEARCH_PROTOTYPES[0]} #{i}"
+        router.route(query, embedder.encode([query])[0])
+    router.log_handler.close()
+
+    records = [json.loads(line) for line in log_path.read_text().splitlines()]
+    assert records[-1]["query"].endswith("#19")
+    assert {"decision", "source", "latency_ms", "search_score", "direct_score"} <= records[-1].keys()
+    assert sorted(path.name for path in tmp_path.iterdir()) == ["router.jsonl", "router.jsonl.1", "router.jsonl.2"]
+    assert all(path.stat().st_size <= 600 for path in tmp_path.iterdir())
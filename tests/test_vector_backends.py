@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from intrafact.storage.vector_backends import NumpyBackend, VectorBackend
+
+def _rows(count: int, dim: int = 8, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    ids = [f"chunk{i}" for i in range(count)]
+    return ids, rng.normal(size=(count, dim)).astype(np.float32), [f"content {i}" for i in ids], \
+        [{"parent_id": f"doc{i % 5}", "chunk_index": i} for i in range(count)]
+
+@pytest.mark.parametrize("dtype", ["float16", "int8"])
+def test_query_finds_stored_vector(tmp_path, dtype):
+    backend = NumpyBackend("test", path=tmp_path, dtype=dtype)
+    ids, embeddings, documents, metadatas = _rows(200)
+    backend.upsert(ids, embeddings, documents, metadatas)
+
+    results = backend.query(embeddings[[7, 42]], limit=3)
+
+    assert [hits[0] for hits in results["ids"]] == ["chunk7", "chunk42"]
+    assert all(distances == sorted(distances) for distances in results["distances"])
+    assert backend.query(embeddings[:1], limit=5, where={"parent_id": "doc2"})["metadatas"][0][0]["parent_id"] == "doc2"
+
+def test_reopen_keeps_rows(tmp_path):
+    ids, embeddings, documents, metadatas = _rows(50)
+    NumpyBackend("test", path=tmp_path).upsert(ids, embeddings, documents, metadatas)
+
+    reopened = NumpyBackend("test", path=tmp_path)
+
+    assert reopened.count() == 50
+    assert reopened.get(["chunk3"])["documents"] == ["content chunk3"]
+
+def test_deleted_rows_are_reused(tmp_path):
+    backend = NumpyBackend("test", path=tmp_path)
+    ids, embeddings, documents, metadatas = _rows(50)
+    backend.upsert(ids, embeddings, documents, metadatas)
+    size = backend.info["size"]
+
+    for _ in range(3):
+        backend.delete(ids=ids[:20])
+        backend.upsert(ids[:20], embeddings[:20], documents[:20], metadatas[:20])
+    backend.delete(where={"parent_id": "doc1"})
+    backend.upsert(["new"], embeddings[:1], ["new"], [{}])
+
+    assert backend.info["size"] == size
+    assert backend.count() == 41
+    assert backend.query(embeddings[5:6], limit=1)["ids"] == [["chunk5"]]
+
+def test_backend_interface_is_abstract():
+    with pytest.raises(TypeError):
+        VectorBackend()
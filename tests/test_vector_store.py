@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+from intrafact.storage.vector_store import VectorDB
+
+def _chunks(count: int, dim: int = 16, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    return [{
+        "id": f"chunk{i}",
+        "parent_id": f"doc{i % 7}",
+        "chunk_index": i // 7,
+        "content": f"content {i}",
+        "metadata": {"file_type": [".txt", ".md", ".pdf"][i % 3], "source_type": "local_file"},
+        "embedding": rng.normal(size=dim).tolist()
+    } for i in range(count)]
+
+@pytest.mark.parametrize("partition_by", ["file_type", "hash"])
+@pytest.mark.parametrize("where", [None, {"file_type": ".md"}])
+def test_partitioned_search_matches_unpartitioned(tmp_path, partition_by, where):
+    chunks = _chunks(300)
+    flat = VectorDB("test", backend="numpy", partition_by="none", path=tmp_path / "flat")
+    partitioned = VectorDB("test", backend="numpy", partition_by=partition_by, path=tmp_path / partition_by)
+    flat.add_chunks(chunks)
+    partitioned.add_chunks(chunks)
+    assert len(partitioned.list_partitions()) > 1
+
+    queries = np.random.default_rng(1).normal(size=(5, 16)).tolist()
+    expected = flat.search_many(queries, limit=10, where=where)
+    results = partitioned.search_many(queries, limit=10, where=where)
+
+    assert results["ids"] == expected["ids"]
+    assert np.allclose(results["distances"], expected["distances"])
+    if where:
+        assert all(metadata["file_type"] == ".md" for hits in results["metadatas"] for metadata in hits)
+
+def test_rebuild_partition_keeps_vectors_and_reopens(tmp_path):
+    db = VectorDB("test", backend="numpy", partition_by="file_type", path=tmp_path)
+    chunks = _chunks(90)
+    db.add_chunks(chunks)
+    db.delete_chunks([chunk["id"] for chunk in chunks[:30]])
+    before = db.search_many([chunks[40]["embedding"]], limit=5)
+
+    assert db.rebuild_partition("file_type.md") == 20
+    assert db.search_many([chunks[40]["embedding"]], limit=5)["ids"] == before["ids"]
+
+    reopened = VectorDB("test", backend="numpy", partition_by="file_type", path=tmp_path)
+    assert reopened.list_partitions() == {"file_type.md": 20, "file_type.pdf": 20, "file_type.txt": 20}
+
+def test_drop_partition_returns_its_documents(tmp_path):
+    db = VectorDB("test", backend="numpy", partition_by="file_type", path=tmp_path)
+    db.add_chunks(_chunks(21))
+
+    doc_ids = db.drop_partition("file_type.pdf")
+
+    assert doc_ids == sorted({f"doc{i % 7}" for i in range(2, 21, 3)})
+    assert "file_type.pdf" not in db.list_partitions()
+    assert db.count() == 14
@@ -0,0 +1,104 @@
+import time
+import pytest
+from intrafact.ingestion.watcher import DirectoryWatcher, IngestDaemon
+from intrafact.storage.metadata_store import MetadataStore
+
+@pytest.fixture
+def meta_store(tmp_path):
+    store = MetadataStore(tmp_path / "metadata.db")
+    yield store
+    store.close()
+
+@pytest.fixture
+def root(tmp_path):
+    path = tmp_path / "raw"
+    path.mkdir()
+    return path
+
+def _queued(meta_store):
+    return [path for path, _ in meta_store.peek_queue(100)]
+
+def _wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.02)
+    return True
+
+def test_only_visible_supported_files_under_the_root_are_watched(meta_store, root, tmp_path):
+    watcher = DirectoryWatcher(meta_store, root=root, debounce=0)
+
+    for path in [root / "notes.txt", root / "sub" / "spec.md", root / ".notes.txt.swp", root / ".git" / "a.txt",
+                 root / "image.bin", tmp_path / "elsewhere.txt"]:
+        watcher.notify(path)
+
+    assert watcher.flush() == 2
+    assert sorted(_queued(meta_store)) == [str(root / "notes.txt"), str(root / "sub" / "spec.md")]
+
+def test_events_are_debounced(meta_store, root):
+    watcher = DirectoryWatcher(meta_store, root=root, debounce=0.2)
+    path = root / "notes.txt"
+
+    watcher.notify(path)
+    time.sleep(0.15)
+    watcher.notify(path)
+    time.sleep(0.1)
+    assert watcher.flush() == 0 and watcher.debouncing == 1
+
+    time.sleep(0.15)
+    assert watcher.flush() == 1 and watcher.debouncing == 0
+    assert _queued(meta_store) == [str(path)]
+
+def test_path_changed_while_ingesting_stays_queued(meta_store, root):
+    meta_store.enqueue_paths(["a", "b"], now=100.0)
+    meta_store.enqueue_paths(["a"], now=200.0)
+
+    assert meta_store.queue_stats() == (2, 100.0)
+    meta_store.complete_paths(["a", "b"], taken_at=150.0)
+    assert _queued(meta_store) == ["a"]
+
+def test_polling_queues_created_modified_and_deleted_files(meta_store, root):
+    (root / "old.txt").write_text("old")
+    watcher = DirectoryWatcher(meta_store, root=root, debounce=0.05, poll_interval=0.05, use_inotify=False)
+    watcher.start()
+    try:
+        assert watcher.mode == "polling"
+        (root / "new.txt").write_text("new")
+        (root / "old.txt").unlink()
+        assert _wait_for(lambda: len(_queued(meta_store)) == 2)
+    finally:
+        watcher.stop()
+
+    assert sorted(_queued(meta_store)) == [str(root / "new.txt"), str(root / "old.txt")]
+
+class RecordingPipeline:
+    def __init__(self, meta_store, fail: bool = False):
+        self.meta_store = meta_store
+        self.fail = fail
+        self.runs = []
+
+    def run(self, paths=None):
+        self.runs.append(paths)
+        if self.fail:
+            raise RuntimeError("store is locked")
+
+def test_daemon_ingests_queued_paths_in_batches(meta_store, root):
+    pipeline = RecordingPipeline(meta_store)
+    daemon = IngestDaemon(pipeline, DirectoryWatcher(meta_store, root=root), batch_size=2)
+    meta_store.enqueue_paths(["a", "b", "c"], now=time.time())
+
+    assert daemon.process_batch() == 2
+    assert daemon.process_batch() == 1
+    assert daemon.process_batch() == 0
+    assert pipeline.runs == [["a", "b"], ["c"]]
+    assert daemon.metrics()["queue_depth"] == 0 and daemon.metrics()["processed_files"] == 3
+
+def test_failed_batch_stays_queued(meta_store, root):
+    daemon = IngestDaemon(RecordingPipeline(meta_store, fail=True),
+                          DirectoryWatcher(meta_store, root=root, poll_interval=0), batch_size=2)
+    meta_store.enqueue_paths(["a"], now=time.time())
+
+    assert daemon.process_batch() == 0
+    assert _queued(meta_store) == ["a"]
+    assert daemon.metrics()["last_error"] == "store is locked"